@@ -2,3 +2,33 @@ tda_api_key = "ABC@AMER.OAUTHAP"
 tda_token_path = "tda_token"
 tda_redirect_uri = "https://localhost"
 tda_ira = "1234567"
+# Every account of the same login, for --all-accounts
+tda_accounts = [tda_ira]
+# Seconds to serve positions and balances from memory
+tda_cache_ttl = 5.0
+# Seconds to serve quotes from memory
+tda_quote_ttl = 2.0
+# buy_limit refuses limits further than this percentage from the market price,
+# unless given --force
+max_limit_distance = 5.0
+# Daily and minute bars, kept up to date incrementally, for sell_stop --atr
+history_path = "history"
+atr_period = 14
+# Local copy of the orders, synced incrementally. Set to None to disable.
+tda_order_store = "orders.sqlite3"
+# Trade against an in-process simulated broker instead of TD Ameritrade
+tda_simulator = False
+# Stay under the API limit of 120 requests per minute, shared by all mish
+# processes through the state file
+tda_requests_per_minute = 100
+tda_rate_limit_path = "ratelimit.json"
+# Request latency and errors per endpoint, in the Prometheus text format, for
+# mish stats. Set to None to disable.
+metrics_path = "metrics.prom"
+# Order status for --wait-until, pushed instead of polled: "tda" for the
+# streaming API, or the path of a Unix socket serving the same messages as JSON
+# lines. Set to None to poll.
+tda_activity_feed = None
+# Parser of the trade alerts for mish ingest, as module:function. Set to None
+# for the built-in parser.
+alert_parser = None
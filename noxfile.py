@@ -9,14 +9,33 @@ locations = "src", "tests", "noxfile.py"
 
 @nox.session()
 def tests(session):
-    args = session.posargs or ["--cov"]
+    args = session.posargs or ["--cov", "--benchmark-skip"]
     session.run("poetry", "install", "--no-dev", external=True)
     install_with_constraints(
-        session, "coverage[toml]", "pytest", "pytest-cov", "pytest-mock"
+        session,
+        "coverage[toml]",
+        "pytest",
+        "pytest-benchmark",
+        "pytest-cov",
+        "pytest-mock",
     )
     session.run("pytest", *args)
 
 
+@nox.session()
+def benchmarks(session):
+    # Compares against the committed reference run and fails when a benchmark
+    # got more than 20% slower on average. Update the reference run with
+    # nox -s benchmarks -- --benchmark-json=tests/benchmarks/baseline.json
+    args = session.posargs or [
+        "--benchmark-compare=tests/benchmarks/baseline.json",
+        "--benchmark-compare-fail=mean:20%",
+    ]
+    session.run("poetry", "install", "--no-dev", external=True)
+    install_with_constraints(session, "pytest", "pytest-benchmark", "pytest-mock")
+    session.run("pytest", "tests/benchmarks", "--benchmark-only", *args)
+
+
 def install_with_constraints(session, *args, **kwargs):
     with tempfile.NamedTemporaryFile() as requirements:
         session.run(
@@ -1,3 +1,8 @@
-from importlib.metadata import version
+def __getattr__(name: str) -> str:
+    # importlib.metadata takes longer to import than the rest of mish, so the
+    # version is only looked up when asked for
+    if name == "__version__":
+        from importlib.metadata import version
 
-__version__ = version(__name__)
+        return version(__name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,229 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+import time
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import requests
+
+from .brokers.models import BrokerException, Order, Position
+from .brokers.orderbook import OrderBook
+
+if TYPE_CHECKING:
+    from .brokers.tdameritrade import TdAmeritrade
+
+
+# Arguments each order command takes after the symbol, in the same order as
+# the corresponding mish subcommand
+COMMANDS = {
+    "buy_market": ["quantity"],
+    "sell_market": ["quantity"],
+    "buy_limit": ["quantity", "price"],
+    "sell_stop": ["percentage", "price"],
+}
+
+
+# Seconds before the first retry of a failed cancel, doubled for every retry
+RETRY_DELAY = 0.5
+
+# Errors of requests that may succeed when made again
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+class BatchException(Exception):
+    pass
+
+
+class OrderSpec(NamedTuple):
+    line: int
+    command: str
+    symbol: str
+    quantity: int = 0
+    percentage: float = 0.0
+    price: Decimal = Decimal(0)
+
+    def __str__(self) -> str:
+        if self.command in ("buy_market", "sell_market"):
+            return f"{self.command} {self.symbol} {self.quantity}"
+        elif self.command == "buy_limit":
+            return f"{self.command} {self.symbol} {self.quantity} {self.price}"
+        else:
+            return f"{self.command} {self.symbol} {self.percentage} {self.price}"
+
+
+class CancelResult(NamedTuple):
+    order: Order
+    error: Optional[str] = None
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class OrderResult(NamedTuple):
+    spec: OrderSpec
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def sell_quantity(position: Position, percentage: float) -> int:
+    return int(round(position.long * (percentage / 100), 0))
+
+
+def parse_specs(lines: Iterable[str]) -> List[OrderSpec]:
+    """Parses one order per line, e.g. ``buy_limit DXCM 10 400.5``.
+
+    Blank lines and anything after a ``#`` are ignored.
+    """
+    specs = []
+    for number, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+
+        command = fields[0].lower()
+        if command not in COMMANDS:
+            raise BatchException(f"line {number}: unknown command {fields[0]}")
+        names = COMMANDS[command]
+        if len(fields) != len(names) + 2:
+            raise BatchException(
+                f"line {number}: {command} expects SYMBOL {' '.join(names).upper()}"
+            )
+
+        values: Dict = {}
+        try:
+            for name, value in zip(names, fields[2:]):
+                if name == "quantity":
+                    values[name] = int(value)
+                elif name == "percentage":
+                    values[name] = float(value)
+                else:
+                    values[name] = Decimal(value)
+        except (ValueError, InvalidOperation):
+            raise BatchException(f"line {number}: invalid {name} {value}")
+
+        specs.append(OrderSpec(number, command, fields[1].upper(), **values))
+    return specs
+
+
+def place_orders(
+    broker: "TdAmeritrade", specs: List[OrderSpec], workers: int = 8
+) -> List[OrderResult]:
+    """Places all orders concurrently and returns the results in spec order.
+
+    Positions are fetched once up front for all the sell stops in the batch.
+    """
+    positions: Dict[str, Position] = {}
+    if any(spec.command == "sell_stop" for spec in specs):
+        positions = broker.get_positions()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_place_order, broker, spec, positions) for spec in specs
+        ]
+        return [future.result() for future in futures]
+
+
+def _place_order(
+    broker: "TdAmeritrade", spec: OrderSpec, positions: Dict[str, Position]
+) -> OrderResult:
+    try:
+        if spec.command == "buy_market":
+            order_id = broker.place_buy_market(spec.symbol, spec.quantity)
+        elif spec.command == "sell_market":
+            order_id = broker.place_sell_market(spec.symbol, spec.quantity)
+        elif spec.command == "buy_limit":
+            order_id = broker.place_buy_limit(spec.symbol, spec.quantity, spec.price)
+        else:
+            position = positions.get(spec.symbol)
+            if not position:
+                return OrderResult(spec, error=f"No position in {spec.symbol}")
+            quantity = sell_quantity(position, spec.percentage)
+            if quantity <= 0:
+                return OrderResult(spec, error="Quantity must be positive")
+            order_id = broker.place_sell_stop(spec.symbol, quantity, spec.price)
+    except BrokerException as error:
+        return OrderResult(spec, error=str(error))
+    except Exception as error:
+        # e.g. a connection error, which mustn't lose the results of the others
+        return OrderResult(spec, error=f"{type(error).__name__}: {error}")
+    return OrderResult(spec, order_id=order_id)
+
+
+def select_orders(
+    book: OrderBook,
+    order_ids: Sequence[int] = (),
+    symbol: Optional[str] = None,
+    order_type: Optional[str] = None,
+    all_active: bool = False,
+) -> Tuple[List[Order], List[str]]:
+    """Returns the orders to cancel, and errors for the ids that can't be.
+
+    Orders are selected by id, or when they are active and match the symbol
+    and type. A composite order matches when any of its children does.
+    """
+    selected: Dict[int, Order] = {}
+    errors = []
+    for order_id in order_ids:
+        match = book.parent(order_id)
+        if match is None:
+            errors.append(f"{order_id} not found")
+        elif not match.active:
+            errors.append(f"{order_id} is not active")
+        else:
+            selected[match.order_id] = match
+
+    if all_active or symbol is not None or order_type is not None:
+        for child in book.active(symbol, order_type):
+            match = book.parent(child.order_id)
+            if match is not None:
+                selected[match.order_id] = match
+    return list(selected.values()), errors
+
+
+def cancel_orders(
+    broker: "TdAmeritrade", orders: List[Order], workers: int = 8, retries: int = 2
+) -> List[CancelResult]:
+    """Cancels all orders concurrently and returns the results in order.
+
+    Cancels that fail with a rate limit, a server error or a network error are
+    retried with exponential backoff.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_cancel_order, broker, order, retries) for order in orders
+        ]
+        return [future.result() for future in futures]
+
+
+def _cancel_order(broker: "TdAmeritrade", order: Order, retries: int) -> CancelResult:
+    attempt = 1
+    while True:
+        try:
+            broker.cancel_order(str(order.order_id))
+            return CancelResult(order, attempts=attempt)
+        except BrokerException as error:
+            if not error.retryable or attempt > retries:
+                return CancelResult(order, error=str(error), attempts=attempt)
+        except NETWORK_ERRORS as error:
+            if attempt > retries:
+                message = f"{type(error).__name__}: {error}"
+                return CancelResult(order, error=message, attempts=attempt)
+        except Exception as error:
+            message = f"{type(error).__name__}: {error}"
+            return CancelResult(order, error=message, attempts=attempt)
+        time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        attempt += 1
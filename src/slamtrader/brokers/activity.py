@@ -0,0 +1,166 @@
+"""Order status pushed by the account activity stream.
+
+A feed runs in a background thread and keeps an OrderStatusTable current, so
+commands can wait for an order to be filled without polling get_order.
+TdaActivityFeed subscribes to the TD Ameritrade streaming API. SocketActivityFeed
+reads the same messages as JSON lines from a Unix socket, for tests and for
+local stand-ins of the streaming API.
+"""
+import abc
+import asyncio
+import json
+import socket
+import threading
+from typing import Any, Dict, Optional
+from xml.etree import ElementTree
+
+from .models import INACTIVE_STATUSES, OrderStatus
+
+SERVICE = "ACCT_ACTIVITY"
+
+# Seconds to wait for the subscription before placing orders anyway
+START_TIMEOUT = 10.0
+
+# The status an order is in after each message type. Messages that don't
+# change the status, e.g. TooLateToCancel, are ignored.
+MESSAGE_STATUSES = {
+    "OrderEntryRequest": OrderStatus.QUEUED,
+    "OrderRoute": OrderStatus.WORKING,
+    "OrderActivation": OrderStatus.WORKING,
+    "OrderPartialFill": OrderStatus.WORKING,
+    "OrderFill": OrderStatus.FILLED,
+    "OrderRejection": OrderStatus.REJECTED,
+    "OrderCancelRequest": OrderStatus.PENDING_CANCEL,
+    "OrderCancelReplaceRequest": OrderStatus.PENDING_REPLACE,
+    "UROUT": OrderStatus.CANCELED,
+}
+
+
+def reached(status: Optional[OrderStatus], wanted: OrderStatus) -> bool:
+    """Returns whether an order in status is done waiting for wanted.
+
+    An order that is no longer active won't change anymore, e.g. a rejected
+    order never becomes WORKING and a filled order has been working.
+    """
+    return status == wanted or status in INACTIVE_STATUSES
+
+
+def order_key(message_data: str) -> Optional[int]:
+    """Returns the order id in the XML of an activity message."""
+    try:
+        root = ElementTree.fromstring(message_data)
+    except ElementTree.ParseError:
+        return None
+    for element in root.iter():
+        # Tags are namespaced, e.g. {urn:xmlns:beb.ameritrade.com}OrderKey
+        if element.tag.rsplit("}", 1)[-1] == "OrderKey" and element.text:
+            return int(element.text)
+    return None
+
+
+class OrderStatusTable:
+    def __init__(self) -> None:
+        self.statuses: Dict[int, OrderStatus] = {}
+        self.condition = threading.Condition()
+
+    def get(self, order_id: int) -> Optional[OrderStatus]:
+        with self.condition:
+            return self.statuses.get(order_id)
+
+    def update(self, order_id: int, status: OrderStatus) -> None:
+        with self.condition:
+            self.statuses[order_id] = status
+            self.condition.notify_all()
+
+    def handle(self, msg: Dict[str, Any]) -> None:
+        """Applies a message as passed to stream handlers."""
+        if msg.get("service") != SERVICE:
+            return
+        for content in msg.get("content", []):
+            status = MESSAGE_STATUSES.get(content.get("MESSAGE_TYPE"))
+            order_id = order_key(content.get("MESSAGE_DATA") or "")
+            if status is not None and order_id is not None:
+                self.update(order_id, status)
+
+    def wait_for(
+        self, order_id: int, wanted: OrderStatus, timeout: float
+    ) -> Optional[OrderStatus]:
+        """Waits until the order reaches wanted, and returns its last status."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: reached(self.statuses.get(order_id), wanted), timeout
+            )
+            return self.statuses.get(order_id)
+
+
+class ActivityFeed(abc.ABC):
+    """Runs a subscription in a daemon thread, started on first use."""
+
+    def __init__(self) -> None:
+        self.table = OrderStatusTable()
+        self.ready = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[Exception] = None
+
+    def start(self) -> None:
+        """Subscribes, and returns once messages for new orders will be seen."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.ready.wait(START_TIMEOUT)
+
+    @property
+    def running(self) -> bool:
+        return (
+            self.ready.is_set()
+            and self.error is None
+            and self.thread is not None
+            and self.thread.is_alive()
+        )
+
+    def _run(self) -> None:
+        try:
+            self.subscribe()
+        except Exception as error:
+            # Waiting commands fall back to get_order
+            self.error = error
+            self.ready.set()
+
+    @abc.abstractmethod
+    def subscribe(self) -> None:
+        """Subscribes, sets ready, and handles messages until an error."""
+
+
+class TdaActivityFeed(ActivityFeed):
+    def __init__(self, client, account_id: str) -> None:
+        super().__init__()
+        self.client = client
+        self.account_id = account_id
+
+    def subscribe(self) -> None:
+        asyncio.run(self._subscribe())
+
+    async def _subscribe(self) -> None:
+        from tda.streaming import StreamClient
+
+        stream = StreamClient(self.client, account_id=int(self.account_id))
+        await stream.login()
+        stream.add_account_activity_handler(self.table.handle)
+        await stream.account_activity_sub()
+        self.ready.set()
+        while True:
+            await stream.handle_message()
+
+
+class SocketActivityFeed(ActivityFeed):
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+
+    def subscribe(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(self.path)
+            self.ready.set()
+            with s.makefile("rb") as f:
+                for line in f:
+                    self.table.handle(json.loads(line))
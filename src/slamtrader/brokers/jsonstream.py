@@ -0,0 +1,122 @@
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+SEPARATORS = " \t\n\r,"
+
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+
+Path = Tuple[Optional[str], ...]
+
+
+def iter_array(chunks: Iterable[bytes], path: Sequence[str] = ()) -> Iterator[Any]:
+    """Yields the elements of a JSON array as they are decoded from chunks.
+
+    Without a path the document itself must be an array. With a path, the
+    array is the value found by following those keys from the document, e.g.
+    ("securitiesAccount", "positions") in an account. Nothing is yielded when
+    the object at the end of the path holds no such key. Only the element
+    being decoded is held in memory, not the whole array.
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    decoder = _ArrayDecoder(path)
+    for chunk in chunks:
+        yield from decoder.feed(text.decode(chunk))
+        if decoder.finished:
+            return
+    yield from decoder.feed(text.decode(b"", final=True), final=True)
+    if not decoder.started and not decoder.finished:
+        raise ValueError(f"No JSON array found for {decoder.name}")
+    if not decoder.finished:
+        raise ValueError("Unterminated JSON array")
+
+
+class _ArrayDecoder:
+    def __init__(self, path: Sequence[str]) -> None:
+        self.path: Path = tuple(path)
+        self.name = ".".join(path) or "document"
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.started = False
+        self.finished = False
+        # State of the scan for the start of the array: the position in the
+        # buffer, the paths of the open objects and arrays, and the key of the
+        # next value when in an object
+        self.pos = 0
+        self.open: List[Tuple[Path, str]] = []
+        self.key: Optional[str] = None
+
+    def feed(self, text: str, final: bool = False) -> Iterator[Any]:
+        self.buffer += text
+        if not self.started:
+            start = self._find_start()
+            if start is None:
+                return
+            self.started = True
+            self.buffer = self.buffer[start:]
+        yield from self._decode(final)
+
+    def _find_start(self) -> Optional[int]:
+        buffer = self.buffer
+        while self.pos < len(buffer) and not self.finished:
+            c = buffer[self.pos]
+            if c == '"':
+                m = STRING.match(buffer, self.pos)
+                if m is None:
+                    # Ends in the next chunk
+                    return None
+                if self.open and self.open[-1][1] == "{" and self.key is None:
+                    self.key = json.loads(m.group())
+                self.pos = m.end()
+                continue
+
+            self.pos += 1
+            if c in "{[":
+                path = self._value_path()
+                if c == "[" and path == self.path:
+                    return self.pos
+                self.open.append((path, c))
+            elif c in "}]" and self.open:
+                self._close(self.open.pop()[0])
+            elif c == ",":
+                self.key = None
+        return None
+
+    def _value_path(self) -> Path:
+        if not self.open:
+            return ()
+        path, kind = self.open[-1]
+        key = self.key if kind == "{" else None
+        self.key = None
+        return path + (key,)
+
+    def _close(self, path: Path) -> None:
+        if self.path and path == self.path[:-1]:
+            # The object that would hold the array doesn't
+            self.finished = True
+        elif path == self.path[: len(path)]:
+            raise ValueError(f"No JSON array found for {self.name}")
+
+    def _decode(self, final: bool) -> Iterator[Any]:
+        pos = 0
+        while not self.finished:
+            while pos < len(self.buffer) and self.buffer[pos] in SEPARATORS:
+                pos += 1
+            if pos == len(self.buffer):
+                break
+            if self.buffer[pos] == "]":
+                self.finished = True
+                break
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            # A number at the end of the buffer could continue in the next chunk
+            if end == len(self.buffer) and not final:
+                break
+            yield value
+            pos = end
+        self.buffer = self.buffer[pos:]
@@ -0,0 +1,174 @@
+"""Latency histograms and error counts per API endpoint.
+
+Metrics are kept in memory while a command runs and then added to a file in
+the Prometheus text format, so it can be scraped as well as read back by
+mish stats.
+"""
+
+import fcntl
+import math
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+# Alerts may wait in the mailbox for minutes before they are placed
+ALERT_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, math.inf)
+
+# Buckets of the endpoints that aren't a single request
+ENDPOINT_BUCKETS = {"alert": ALERT_BUCKETS}
+
+LATENCY = "mish_request_duration_seconds"
+ERRORS = "mish_request_errors_total"
+
+LINE = re.compile(
+    r'^(?P<name>\w+)\{endpoint="(?P<endpoint>\w+)"(?:,le="(?P<le>[^"]+)")?\}'
+    r" (?P<value>\S+)$"
+)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # Not cumulative, counts[i] is the number of samples in bucket i only
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.errors = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[self._bucket(seconds)] += 1
+        self.sum += seconds
+
+    def merge(self, other: "Histogram") -> None:
+        if other.buckets == self.buckets:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        else:
+            # e.g. from a file written with other buckets, each count goes to
+            # the bucket that holds the upper bound of its own
+            for bound, count in zip(other.buckets, other.counts):
+                self.counts[self._bucket(bound)] += count
+        self.sum += other.sum
+        self.errors += other.errors
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimates a quantile the same way Prometheus' histogram_quantile does."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if math.isinf(upper):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return None
+
+    def _bucket(self, seconds: float) -> int:
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                return i
+        return len(self.buckets) - 1
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float, error: bool = False) -> None:
+        with self.lock:
+            histogram = self._histogram(endpoint)
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+
+    def merge(self, other: "Metrics") -> None:
+        for endpoint, histogram in other.endpoints.items():
+            self._histogram(endpoint).merge(histogram)
+
+    def _histogram(self, endpoint: str) -> Histogram:
+        if endpoint not in self.endpoints:
+            buckets = ENDPOINT_BUCKETS.get(endpoint, BUCKETS)
+            self.endpoints[endpoint] = Histogram(buckets)
+        return self.endpoints[endpoint]
+
+    def to_prometheus(self) -> str:
+        lines = [
+            f"# HELP {LATENCY} Latency of TD Ameritrade API requests.",
+            f"# TYPE {LATENCY} histogram",
+        ]
+        for endpoint, histogram in sorted(self.endpoints.items()):
+            label = f'endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append(f'{LATENCY}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{LATENCY}_sum{{{label}}} {histogram.sum!r}")
+            lines.append(f"{LATENCY}_count{{{label}}} {cumulative}")
+
+        lines.append(f"# HELP {ERRORS} Failed TD Ameritrade API requests.")
+        lines.append(f"# TYPE {ERRORS} counter")
+        for endpoint, histogram in sorted(self.endpoints.items()):
+            lines.append(f'{ERRORS}{{endpoint="{endpoint}"}} {histogram.errors}')
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def from_prometheus(cls, text: str) -> "Metrics":
+        metrics = cls()
+        cumulative: Dict[str, List[int]] = {}
+        bounds: Dict[str, List[float]] = {}
+        for line in text.splitlines():
+            m = LINE.match(line)
+            if not m:
+                continue
+            histogram = metrics._histogram(m["endpoint"])
+            if m["name"] == f"{LATENCY}_bucket":
+                cumulative.setdefault(m["endpoint"], []).append(int(m["value"]))
+                bounds.setdefault(m["endpoint"], []).append(float(m["le"]))
+            elif m["name"] == f"{LATENCY}_sum":
+                histogram.sum = float(m["value"])
+            elif m["name"] == ERRORS:
+                histogram.errors = int(m["value"])
+
+        for endpoint, counts in cumulative.items():
+            previous = [0] + counts[:-1]
+            # The file may have been written with other buckets
+            parsed = Histogram(bounds[endpoint])
+            parsed.counts = [count - before for count, before in zip(counts, previous)]
+            metrics.endpoints[endpoint].merge(parsed)
+        return metrics
+
+    @classmethod
+    def load(cls, path: str) -> "Metrics":
+        try:
+            with open(path) as f:
+                return cls.from_prometheus(f.read())
+        except FileNotFoundError:
+            return cls()
+
+    def dump(self, path: str) -> None:
+        """Adds the metrics to those in the file, and starts over from zero."""
+        with self.lock:
+            if not self.endpoints:
+                return
+            with open(path + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                total = Metrics.load(path)
+                total.merge(self)
+                directory = os.path.dirname(os.path.abspath(path))
+                with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+                    f.write(total.to_prometheus())
+                os.replace(f.name, path)
+            self.endpoints = {}
@@ -0,0 +1,317 @@
+import copy
+from decimal import Decimal
+from enum import Enum
+import json
+from typing import Any, Dict, List, Optional
+
+
+class BrokerException(Exception):
+    def __init__(self, response) -> None:
+        self.status_code: Optional[int] = getattr(response, "status_code", None)
+        if isinstance(response, str):
+            self.message = response
+        else:
+            j = response.json()
+            if "error" in j:
+                self.message = j["error"]
+            else:
+                self.message = json.dumps(j, indent=4)
+        super().__init__(self.message)
+
+    @property
+    def retryable(self) -> bool:
+        """Whether the request may succeed when made again."""
+        return self.status_code == 429 or (
+            isinstance(self.status_code, int) and self.status_code >= 500
+        )
+
+
+def _decimal(value: float) -> Decimal:
+    # The API returns prices as JSON floats. Going through str gives the
+    # price as it was entered, e.g. 13.86 instead of 13.8599999999999994315658
+    return Decimal(str(value))
+
+
+class OrderStatus(str, Enum):
+    AWAITING_PARENT_ORDER = "AWAITING_PARENT_ORDER"
+    AWAITING_CONDITION = "AWAITING_CONDITION"
+    AWAITING_MANUAL_REVIEW = "AWAITING_MANUAL_REVIEW"
+    ACCEPTED = "ACCEPTED"
+    AWAITING_UR_OUT = "AWAITING_UR_OUT"
+    PENDING_ACTIVATION = "PENDING_ACTIVATION"
+    QUEUED = "QUEUED"
+    WORKING = "WORKING"
+    REJECTED = "REJECTED"
+    PENDING_CANCEL = "PENDING_CANCEL"
+    CANCELED = "CANCELED"
+    PENDING_REPLACE = "PENDING_REPLACE"
+    REPLACED = "REPLACED"
+    FILLED = "FILLED"
+    EXPIRED = "EXPIRED"
+    # Not a status of the API: an order we had as active, that is gone now
+    UNKNOWN = "UNKNOWN"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+INACTIVE_STATUSES = frozenset(
+    [
+        OrderStatus.CANCELED,
+        OrderStatus.EXPIRED,
+        OrderStatus.FILLED,
+        OrderStatus.REJECTED,
+        OrderStatus.REPLACED,
+        OrderStatus.UNKNOWN,
+    ]
+)
+
+
+class Position:
+    __slots__ = ("symbol", "asset_type", "long", "short", "trade_price", "market_value")
+
+    def __init__(self, raw) -> None:
+        # {
+        #     "shortQuantity": 0.0,
+        #     "averagePrice": 399.95,
+        #     "currentDayProfitLoss": 659.59,
+        #     "currentDayProfitLossPercentage": 2.22,
+        #     "longQuantity": 71.0,
+        #     "settledLongQuantity": 71.0,
+        #     "settledShortQuantity": 0.0,
+        #     "instrument": {
+        #         "assetType": "EQUITY",
+        #         "cusip": "252131107",
+        #         "symbol": "DXCM"
+        #     },
+        #     "marketValue": 30322.68,
+        #     "maintenanceRequirement": 30322.68
+        # }
+        instrument = raw["instrument"]
+        self.symbol: str = instrument["symbol"]
+        self.asset_type: str = instrument["assetType"]
+        self.long: float = raw["longQuantity"]
+        self.short: float = raw["shortQuantity"]
+        self.trade_price: Decimal = _decimal(raw["averagePrice"])
+        self.market_value: Decimal = _decimal(raw.get("marketValue", 0.0))
+
+    def __str__(self) -> str:
+        return (
+            f"{self.symbol} {self.long - self.short:g} {self.trade_price} "
+            f"{self.market_value}"
+        )
+
+    def to_record(self) -> Dict[str, Any]:
+        """The position as plain values, e.g. for JSON."""
+        return {
+            "symbol": self.symbol,
+            "asset_type": self.asset_type,
+            "long": self.long,
+            "short": self.short,
+            "trade_price": float(self.trade_price),
+            "market_value": float(self.market_value),
+        }
+
+
+class Balances:
+    __slots__ = ("buying_power", "available_funds", "liquidation_value")
+
+    def __init__(self, raw) -> None:
+        # {
+        #     "availableFunds": 119052.65,
+        #     "buyingPower": 119052.65,
+        #     "cashBalance": 0.0,
+        #     "liquidationValue": 260880.84,
+        #     "longMarketValue": 139648.19,
+        #     "moneyMarketFund": 129363.05,
+        #     "equity": 260700.84,
+        #     ...
+        # }
+        self.buying_power: Decimal = _decimal(raw.get("buyingPower", 0.0))
+        self.available_funds: Decimal = _decimal(raw.get("availableFunds", 0.0))
+        self.liquidation_value: Decimal = _decimal(raw.get("liquidationValue", 0.0))
+
+
+class Account:
+    """A snapshot of the positions and current balances of an account."""
+
+    __slots__ = ("positions", "balances")
+
+    def __init__(self, raw) -> None:
+        self.positions: Dict[str, Position] = {}
+        for v in raw.get("positions", []):
+            position = Position(v)
+            self.positions[position.symbol] = position
+        self.balances = Balances(raw.get("currentBalances", {}))
+
+
+class Leg:
+    __slots__ = ("instruction", "quantity", "symbol", "position_effect")
+
+    def __init__(self, raw) -> None:
+        self.instruction: str = raw["instruction"]
+        self.quantity = int(raw["quantity"])
+        self.symbol: str = raw["instrument"]["symbol"]
+        self.position_effect: str = raw.get("positionEffect", "")
+
+
+class Order:
+    """An order, parsed once from the API response.
+
+    OCO orders have no legs or status of their own, only children. The raw
+    JSON is only kept when asked for with keep_raw.
+    """
+
+    __slots__ = (
+        "order_id",
+        "strategy_type",
+        "status",
+        "order_type",
+        "duration",
+        "price",
+        "entered_time",
+        "legs",
+        "children",
+        "active",
+        "raw",
+        "_str",
+    )
+
+    def __init__(self, raw, keep_raw: bool = False) -> None:
+        # {
+        #     "session": "NORMAL",
+        #     "duration": "GOOD_TILL_CANCEL",
+        #     "orderType": "STOP",
+        #     "complexOrderStrategyType": "NONE",
+        #     "quantity": 1200.0,
+        #     "filledQuantity": 0.0,
+        #     "remainingQuantity": 1200.0,
+        #     "requestedDestination": "AUTO",
+        #     "destinationLinkName": "AutoRoute",
+        #     "stopPrice": 13.86,
+        #     "orderLegCollection": [
+        #         {
+        #             "orderLegType": "EQUITY",
+        #             "legId": 1,
+        #             "instrument": {
+        #                 "assetType": "EQUITY",
+        #                 "cusip": "92189F817",
+        #                 "symbol": "VNM"
+        #             },
+        #             "instruction": "SELL",
+        #             "positionEffect": "CLOSING",
+        #             "quantity": 1200.0
+        #         }
+        #     ],
+        #     "orderStrategyType": "SINGLE",
+        #     "orderId": 3126389058,
+        #     "cancelable": true,
+        #     "editable": true,
+        #     "status": "QUEUED",
+        #     "enteredTime": "2020-07-30T01:08:58+0000",
+        #     "accountId": 455102033
+        # }
+        self.order_id = int(raw["orderId"])
+        self.strategy_type: str = raw["orderStrategyType"]
+        status = raw.get("status")
+        self.status = OrderStatus(status) if status else None
+        self.order_type: Optional[str] = raw.get("orderType")
+        self.duration: Optional[str] = raw.get("duration")
+        price = raw.get("stopPrice", raw.get("price"))
+        self.price = _decimal(price) if price is not None else None
+        self.entered_time: Optional[str] = raw.get("enteredTime")
+        self.legs = tuple(Leg(leg) for leg in raw.get("orderLegCollection", []))
+        self.children = tuple(
+            Order(child, keep_raw) for child in raw.get("childOrderStrategies", [])
+        )
+        self.active: bool
+        if self.children:
+            self.active = any(child.active for child in self.children)
+        else:
+            self.active = self.status not in INACTIVE_STATUSES
+        self.raw = raw if keep_raw else None
+        self._str: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._str is None:
+            self._str = "\n".join(self._lines())
+        return self._str
+
+    def _lines(self) -> List[str]:
+        if not self.is_single:
+            lines = [f"{self.order_id} {self.strategy_type}"]
+            for child in self.children:
+                lines.append(f"    {child}")
+            return lines
+
+        # The API only supports single leg anyways, so this for loop always
+        # returns a single leg . OCO orders, for example, are not returned,
+        # even when Thinkorswim does show them.
+        lines = []
+        for leg in self.legs:
+            sign = "-" if leg.instruction == "SELL" else "+"
+            if self.order_type == "STOP" or self.order_type == "LIMIT":
+                order = f"{self.order_type} {self.price}"
+            else:
+                order = f"{self.order_type}"
+
+            # return f"SELL -1,200 VNM STP 13.86 GTC [TO CLOSE]"
+            lines.append(
+                f"{self.order_id} {leg.instruction} {sign}{leg.quantity} "
+                f"{leg.symbol} {order} {self.duration} {leg.position_effect} "
+                f"{self.status}"
+            )
+        return lines
+
+    def to_record(self) -> Dict[str, Any]:
+        """The order as plain values, e.g. for JSON, with children nested."""
+        leg = self.legs[0] if self.legs else None
+        return {
+            "order_id": self.order_id,
+            "strategy_type": self.strategy_type,
+            "status": self.status.value if self.status else None,
+            "order_type": self.order_type,
+            "duration": self.duration,
+            "price": float(self.price) if self.price is not None else None,
+            "entered_time": self.entered_time,
+            "symbol": self.symbol,
+            "instruction": leg.instruction if leg else None,
+            "quantity": leg.quantity if leg else None,
+            "position_effect": leg.position_effect if leg else None,
+            "active": self.active,
+            "children": [child.to_record() for child in self.children],
+        }
+
+    def replace_child(self, child: "Order") -> "Order":
+        """Returns a copy of this composite order with the child swapped in.
+
+        The child is found by id at any depth, e.g. an OCO fetched on its own.
+        """
+        if not self.children:
+            return self
+        children = []
+        for current in self.children:
+            if current.order_id == child.order_id:
+                children.append(child)
+            else:
+                children.append(current.replace_child(child))
+        order = copy.copy(self)
+        order.children = tuple(children)
+        order.active = any(current.active for current in children)
+        order.raw = None
+        order._str = None
+        return order
+
+    @property
+    def symbol(self) -> str:
+        if self.children:
+            return self.children[0].symbol
+        return self.legs[0].symbol
+
+    @property
+    def is_single(self) -> bool:
+        return self.strategy_type == "SINGLE"
+
+    @property
+    def is_oco(self) -> bool:
+        return self.strategy_type == "OCO"
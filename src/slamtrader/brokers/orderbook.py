@@ -0,0 +1,149 @@
+"""Orders indexed by id, symbol, status, type and instruction.
+
+A composite order, e.g. an OCO, is stored as a whole but its children are
+indexed one by one, so a lookup finds the stop of an OCO like any other stop.
+Lookups walk only the smallest index that matches, instead of every order.
+"""
+import threading
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+
+from .models import Order, OrderStatus
+
+# An insertion ordered set of order ids
+_Ids = Dict[int, None]
+
+
+class OrderBook:
+    def __init__(self, orders: Iterable[Order] = ()) -> None:
+        # Orders as returned by the API, composite orders with their children
+        self.orders: Dict[int, Order] = {}
+        # Every single order, including children, and where it belongs to
+        self._singles: Dict[int, Order] = {}
+        self._parents: Dict[int, int] = {}
+        self._indexes: Dict[str, Dict[Hashable, _Ids]] = {
+            "symbol": {},
+            "status": {},
+            "order_type": {},
+            "instruction": {},
+            "active": {},
+        }
+        self.lock = threading.RLock()
+        self.update(orders)
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def __iter__(self) -> Iterator[Order]:
+        return iter(list(self.orders.values()))
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._singles or order_id in self.orders
+
+    def get(self, order_id: int) -> Optional[Order]:
+        """Returns the order or child order with the id."""
+        with self.lock:
+            return self._singles.get(order_id) or self.orders.get(order_id)
+
+    def parent(self, order_id: int) -> Optional[Order]:
+        """Returns the order that was placed for an order or child order."""
+        with self.lock:
+            return self.orders.get(self._parents.get(order_id, order_id))
+
+    def add(self, order: Order) -> None:
+        """Adds an order, replacing the order with the same id.
+
+        A child order, e.g. the stop of an OCO fetched on its own, replaces
+        the child inside its parent, which keeps its other children.
+        """
+        with self.lock:
+            parent_id = self._parents.get(order.order_id, order.order_id)
+            if parent_id != order.order_id:
+                order = self.orders[parent_id].replace_child(order)
+            self.remove(order.order_id)
+            self.orders[order.order_id] = order
+            for single in _singles(order):
+                self._singles[single.order_id] = single
+                self._parents[single.order_id] = order.order_id
+                for name, key in _keys(single).items():
+                    self._indexes[name].setdefault(key, {})[single.order_id] = None
+
+    def update(self, orders: Iterable[Order]) -> None:
+        with self.lock:
+            for order in orders:
+                self.add(order)
+
+    def remove(self, order_id: int) -> Optional[Order]:
+        """Removes the order that was placed for an order or child order."""
+        with self.lock:
+            order = self.orders.pop(self._parents.get(order_id, order_id), None)
+            if order is None:
+                return None
+            for single in _singles(order):
+                del self._singles[single.order_id]
+                del self._parents[single.order_id]
+                for name, key in _keys(single).items():
+                    ids = self._indexes[name][key]
+                    del ids[single.order_id]
+                    if not ids:
+                        del self._indexes[name][key]
+            return order
+
+    def find(
+        self,
+        symbol: Optional[str] = None,
+        status: Optional[OrderStatus] = None,
+        order_type: Optional[str] = None,
+        instruction: Optional[str] = None,
+        active: Optional[bool] = None,
+    ) -> List[Order]:
+        """Returns the single orders, including children, that match.
+
+        Criteria left at None match any order.
+        """
+        criteria = {
+            "symbol": symbol,
+            "status": status,
+            "order_type": order_type,
+            "instruction": instruction,
+            "active": active,
+        }
+        with self.lock:
+            matches = [
+                self._indexes[name].get(key, {})
+                for name, key in criteria.items()
+                if key is not None
+            ]
+            if not matches:
+                return list(self._singles.values())
+            matches.sort(key=len)
+            return [
+                self._singles[order_id]
+                for order_id in matches[0]
+                if all(order_id in ids for ids in matches[1:])
+            ]
+
+    def active(
+        self,
+        symbol: Optional[str] = None,
+        order_type: Optional[str] = None,
+        instruction: Optional[str] = None,
+    ) -> List[Order]:
+        return self.find(symbol, None, order_type, instruction, True)
+
+
+def _singles(order: Order) -> Iterator[Order]:
+    if order.children:
+        for child in order.children:
+            yield from _singles(child)
+    else:
+        yield order
+
+
+def _keys(order: Order) -> Dict[str, Hashable]:
+    return {
+        "symbol": order.symbol,
+        "status": order.status,
+        "order_type": order.order_type,
+        "instruction": order.legs[0].instruction if order.legs else None,
+        "active": order.active,
+    }
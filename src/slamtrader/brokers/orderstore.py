@@ -0,0 +1,170 @@
+import datetime
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .models import Order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    status TEXT,
+    symbol TEXT,
+    active INTEGER NOT NULL,
+    entered_time TEXT NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (account_id, status);
+CREATE INDEX IF NOT EXISTS orders_symbol ON orders (account_id, symbol);
+CREATE INDEX IF NOT EXISTS orders_active ON orders (account_id, active);
+CREATE TABLE IF NOT EXISTS syncs (
+    account_id TEXT PRIMARY KEY,
+    synced_at TEXT NOT NULL
+);
+"""
+
+# Format of the enteredTime field returned by the API. All times are UTC so
+# the strings sort chronologically.
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+# Number of rows read from the database at a time while iterating
+FETCH_SIZE = 500
+
+
+class OrderStore:
+    """A local copy of the orders of one or more accounts.
+
+    The store remembers when each account was last synced, so only orders
+    entered since then, plus the orders that were still active, need to be
+    downloaded again.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def sync_from(
+        self, account_id: str, not_before: Optional[datetime.datetime] = None
+    ) -> Optional[datetime.datetime]:
+        """Returns the entered time from which orders must be fetched again.
+
+        The API can only filter on the time an order was entered, not on the
+        time it was last updated. An active order entered weeks ago may have
+        been filled or canceled since, so the window reaches back to the
+        oldest order that was still active at the last sync, but not before
+        not_before. Older active orders are found with active_before.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT synced_at FROM syncs WHERE account_id = ?", (account_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            synced_at = row[0]
+
+            row = self.db.execute(
+                "SELECT MIN(entered_time) FROM orders "
+                "WHERE account_id = ? AND active = 1",
+                (account_id,),
+            ).fetchone()
+
+        since = datetime.datetime.strptime(
+            min(filter(None, [synced_at, row[0]])), TIME_FORMAT
+        )
+        if not_before is not None and since < not_before:
+            return not_before
+        return since
+
+    def active_before(
+        self, account_id: str, before: datetime.datetime
+    ) -> List[Dict[str, Any]]:
+        """Returns the active orders entered before a time, as they were stored."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT raw FROM orders "
+                "WHERE account_id = ? AND active = 1 AND entered_time < ?",
+                (account_id, before.strftime(TIME_FORMAT)),
+            ).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def merge(
+        self,
+        account_id: str,
+        raw_orders: Iterable[Dict[str, Any]],
+        synced_at: datetime.datetime,
+    ) -> None:
+        rows = []
+        for raw in raw_orders:
+            order = Order(raw)
+            rows.append(
+                (
+                    order.order_id,
+                    account_id,
+                    raw.get("status"),
+                    order.symbol,
+                    order.active,
+                    _entered_time(raw),
+                    json.dumps(raw),
+                )
+            )
+
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (?, ?)",
+                (account_id, synced_at.strftime(TIME_FORMAT)),
+            )
+
+    def get_orders(
+        self,
+        account_id: str,
+        active_only: bool = False,
+        symbol: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> List[Order]:
+        return list(self.iter_orders(account_id, active_only, symbol, status))
+
+    def iter_orders(
+        self,
+        account_id: str,
+        active_only: bool = False,
+        symbol: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> Iterator[Order]:
+        query = "SELECT raw FROM orders WHERE account_id = ?"
+        params: List[Any] = [account_id]
+        if active_only:
+            query += " AND active = 1"
+        if symbol:
+            query += " AND symbol = ?"
+            params.append(symbol)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY entered_time DESC, order_id DESC"
+
+        with self.lock:
+            cursor = self.db.execute(query, params)
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for (raw,) in rows:
+                yield Order(json.loads(raw))
+
+
+def _entered_time(raw: Dict[str, Any]) -> str:
+    # OCO orders have no enteredTime of their own, their children do
+    times = [raw.get("enteredTime")]
+    for child in raw.get("childOrderStrategies", []):
+        times.append(child.get("enteredTime"))
+    return min(filter(None, times), default="")
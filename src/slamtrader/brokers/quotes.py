@@ -0,0 +1,85 @@
+"""Last prices, fetched in batches and cached for a few seconds.
+
+Any number of symbols are fetched with a single request. Symbols that another
+thread is already fetching are not requested again; the thread waits for that
+request instead. So pre-trade checks and reports that need prices add at most
+one round trip.
+"""
+from concurrent.futures import Future
+from decimal import Decimal
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+Quotes = Dict[str, Decimal]
+
+
+class QuoteService:
+    def __init__(self, fetch: Callable[[List[str]], Quotes], ttl: float) -> None:
+        self.fetch = fetch
+        self.ttl = ttl
+        self.cache: Dict[str, Tuple[Decimal, float]] = {}
+        self.pending: Dict[str, "Future[Quotes]"] = {}
+        self.lock = threading.Lock()
+
+    def get(self, symbols: Iterable[str]) -> Quotes:
+        """Returns the last price of every symbol that has a quote."""
+        quotes: Quotes = {}
+        waiting: Dict[str, "Future[Quotes]"] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        with self.lock:
+            for symbol in dict.fromkeys(symbols):
+                cached = self.cache.get(symbol)
+                if cached is not None and now - cached[1] < self.ttl:
+                    quotes[symbol] = cached[0]
+                elif symbol in self.pending:
+                    waiting[symbol] = self.pending[symbol]
+                else:
+                    missing.append(symbol)
+
+            future: "Future[Quotes]" = Future()
+            for symbol in missing:
+                self.pending[symbol] = future
+
+        if missing:
+            self._fetch(missing, future)
+            waiting.update((symbol, future) for symbol in missing)
+        for symbol, request in waiting.items():
+            fetched = request.result()
+            if symbol in fetched:
+                quotes[symbol] = fetched[symbol]
+        return quotes
+
+    def peek(self, symbols: Iterable[str]) -> Quotes:
+        """Returns the cached prices of the symbols, without fetching any."""
+        quotes: Quotes = {}
+        now = time.monotonic()
+        with self.lock:
+            for symbol in symbols:
+                cached = self.cache.get(symbol)
+                if cached is not None and now - cached[1] < self.ttl:
+                    quotes[symbol] = cached[0]
+        return quotes
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.cache.clear()
+
+    def _fetch(self, symbols: List[str], future: "Future[Quotes]") -> None:
+        try:
+            fetched = self.fetch(symbols)
+        except BaseException as error:
+            with self.lock:
+                for symbol in symbols:
+                    del self.pending[symbol]
+            future.set_exception(error)
+            raise
+
+        now = time.monotonic()
+        with self.lock:
+            for symbol in symbols:
+                del self.pending[symbol]
+            for symbol, price in fetched.items():
+                self.cache[symbol] = (price, now)
+        future.set_result(fetched)
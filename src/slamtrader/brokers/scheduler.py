@@ -0,0 +1,113 @@
+"""Client side rate limiting for the TD Ameritrade API.
+
+The API allows about 120 requests per minute per API key. Every request goes
+through a RequestScheduler, which takes a token from a bucket first. When
+requests have to wait, cancels go first, then placements, then reads.
+"""
+import enum
+import fcntl
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Priority(enum.IntEnum):
+    CANCEL = 0
+    PLACE = 1
+    READ = 2
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, in bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """Takes a token and returns 0, or returns how long to wait for one."""
+        with self.lock:
+            self.tokens, self.time, wait = self._take(
+                self.tokens, self.time, time.monotonic()
+            )
+            return wait
+
+    def _take(
+        self, tokens: float, last: float, now: float
+    ) -> Tuple[float, float, float]:
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0.0
+        return tokens, now, (1 - tokens) / self.rate
+
+
+class FileTokenBucket(TokenBucket):
+    """A token bucket shared by all processes that use the same state file.
+
+    The file is locked while the bucket is updated, so several mish commands
+    and scripts running with one API key stay under the limit together.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float) -> None:
+        super().__init__(rate, capacity)
+        self.path = os.path.expanduser(path)
+
+    def take(self) -> float:
+        with self.lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.load(f)
+                tokens, last = state["tokens"], state["time"]
+            except (ValueError, KeyError):
+                tokens, last = self.capacity, time.time()
+
+            tokens, last, wait = self._take(tokens, last, time.time())
+
+            f.seek(0)
+            f.truncate()
+            json.dump({"tokens": tokens, "time": last}, f)
+            return wait
+
+
+class RequestScheduler:
+    """Runs requests when the bucket allows, most urgent first.
+
+    Priorities only order the requests waiting in this process. Other
+    processes sharing a FileTokenBucket compete for tokens first come, first
+    served.
+    """
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.waiting: List[Tuple[int, int]] = []
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+
+    def run(self, priority: Priority, func: Callable[..., T], *args, **kwargs) -> T:
+        self.acquire(priority)
+        return func(*args, **kwargs)
+
+    def acquire(self, priority: Priority) -> None:
+        ticket = (int(priority), next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                if self.waiting[0] == ticket:
+                    wait = self.bucket.take()
+                    if not wait:
+                        heapq.heappop(self.waiting)
+                        self.condition.notify_all()
+                        return
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
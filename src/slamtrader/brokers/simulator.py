@@ -0,0 +1,472 @@
+"""An in-process stand-in for the parts of the TD Ameritrade API we use.
+
+SimulatedClient implements the subset of tda.client.Client that TdAmeritrade
+calls, on top of stateful accounts, positions and orders. Orders go through
+the same lifecycle as at the broker: QUEUED, then WORKING on the next step,
+then FILLED once the price allows it, or CANCELED. Latency and errors can be
+injected to load test the batch and async paths offline.
+"""
+import collections
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+ORDER_URL = "https://api.tdameritrade.com/v1/accounts/{}/orders/{}"
+ACTIVE_STATUSES = ("QUEUED", "WORKING")
+
+
+class SimulatedResponse:
+    def __init__(
+        self, status_code: int, body: Any = None, headers: Optional[dict] = None
+    ) -> None:
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = "" if body is None else json.dumps(body)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        content = self.text.encode()
+        for i in range(0, len(content), chunk_size):
+            yield content[i : i + chunk_size]
+
+
+class SimulatedAccount:
+    def __init__(self, account_id: str, cash: float) -> None:
+        self.account_id = account_id
+        self.cash = cash
+        # symbol -> [quantity, average price]
+        self.positions: Dict[str, List[float]] = {}
+        # Top level orders, OCO children are only reachable through their parent
+        self.order_ids: List[int] = []
+
+
+class _Session:
+    def mount(self, prefix, adapter) -> None:
+        pass
+
+
+class SimulatedClient:
+    """Stateful stand-in for tda.client.Client.
+
+    latency is added to every request, error_rate is the share of requests
+    that fail with a 500, and requests over max_requests_per_minute fail with
+    a 429. With auto_step, every request advances all orders one step, for
+    paper trading without driving the simulation by hand.
+    """
+
+    class Account:
+        class Fields:
+            POSITIONS = "positions"
+            ORDERS = "orders"
+
+    class PriceHistory:
+        class PeriodType:
+            DAY = "day"
+            YEAR = "year"
+
+        class FrequencyType:
+            MINUTE = "minute"
+            DAILY = "daily"
+
+        class Frequency:
+            EVERY_MINUTE = 1
+            DAILY = 1
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        max_requests_per_minute: Optional[int] = None,
+        seed: Optional[int] = None,
+        auto_step: bool = False,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_requests_per_minute = max_requests_per_minute
+        self.auto_step = auto_step
+        self.random = random.Random(seed)
+        self.session = _Session()
+        self.accounts: Dict[str, SimulatedAccount] = {}
+        self.orders: Dict[int, Dict[str, Any]] = {}
+        self.prices: Dict[str, float] = {}
+        # (symbol, frequency type) -> candles, oldest first
+        self.bars: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self.requests: Deque[float] = collections.deque()
+        self.request_count = 0
+        self._order_ids = itertools.count(1000000001)
+        self._lock = threading.RLock()
+
+    def add_account(
+        self,
+        account_id: str,
+        cash: float = 100000.0,
+        positions: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> SimulatedAccount:
+        """Adds an account with positions given as symbol: (quantity, price)."""
+        account = SimulatedAccount(account_id, cash)
+        for symbol, (quantity, price) in (positions or {}).items():
+            account.positions[symbol] = [quantity, price]
+            self.prices.setdefault(symbol, price)
+        self.accounts[account_id] = account
+        return account
+
+    def add_bars(
+        self, symbol: str, candles: List[Dict[str, Any]], frequency_type="daily"
+    ) -> None:
+        """Adds candles, replacing those with the same datetime."""
+        with self._lock:
+            bars = {
+                candle["datetime"]: candle
+                for candle in self.bars.get((symbol, frequency_type), []) + candles
+            }
+            self.bars[symbol, frequency_type] = sorted(
+                bars.values(), key=lambda candle: candle["datetime"]
+            )
+
+    def set_price(self, symbol: str, price: float) -> None:
+        """Moves the market, filling any working order the new price triggers."""
+        with self._lock:
+            self.prices[symbol] = price
+            for order in list(self.orders.values()):
+                if order.get("status") == "WORKING" and self._symbol(order) == symbol:
+                    self._try_fill(order)
+
+    def step(self) -> None:
+        """Advances every active order one step through its lifecycle."""
+        with self._lock:
+            for order in list(self.orders.values()):
+                if order.get("status") == "QUEUED":
+                    order["status"] = "WORKING"
+                elif order.get("status") == "WORKING":
+                    self._try_fill(order)
+
+    ##########################################################################
+    # tda.client.Client
+
+    def get_account(self, account_id, *, fields=None):
+        return self._request(lambda: self._get_account(account_id, fields))
+
+    def get_accounts(self, *, fields=None):
+        def get_accounts():
+            accounts = [self._account_json(a, fields) for a in self.accounts.values()]
+            return SimulatedResponse(200, accounts)
+
+        return self._request(get_accounts)
+
+    def get_orders_by_path(self, account_id, *, from_entered_datetime=None, **kwargs):
+        return self._request(
+            lambda: self._get_orders([account_id], from_entered_datetime)
+        )
+
+    def get_orders_by_query(self, *, from_entered_datetime=None, **kwargs):
+        return self._request(
+            lambda: self._get_orders(list(self.accounts), from_entered_datetime)
+        )
+
+    def get_order(self, order_id, account_id):
+        def get_order():
+            order = self._find_order(order_id, account_id)
+            if order is None:
+                return SimulatedResponse(404, {"error": "Order not found"})
+            return SimulatedResponse(200, order)
+
+        return self._request(get_order)
+
+    def cancel_order(self, order_id, account_id):
+        return self._request(lambda: self._cancel_order(order_id, account_id))
+
+    def place_order(self, account_id, order_spec):
+        return self._request(lambda: self._place_order(account_id, order_spec))
+
+    def replace_order(self, account_id, order_id, order_spec):
+        def replace_order():
+            order = self._find_order(order_id, account_id)
+            if order is None or order.get("status") not in ACTIVE_STATUSES:
+                return SimulatedResponse(400, {"error": "Order cannot be replaced"})
+            order["status"] = "REPLACED"
+            return self._place_order(account_id, order_spec)
+
+        return self._request(replace_order)
+
+    def get_price_history(
+        self,
+        symbol,
+        *,
+        period_type=None,
+        period=None,
+        frequency_type=None,
+        frequency=None,
+        start_datetime=None,
+        end_datetime=None,
+        need_extended_hours_data=None,
+    ):
+        def get_price_history():
+            start = _millis(start_datetime) if start_datetime else 0
+            end = _millis(end_datetime) if end_datetime else float("inf")
+            candles = [
+                candle
+                for candle in self.bars.get((symbol, frequency_type), [])
+                if start <= candle["datetime"] <= end
+            ]
+            return SimulatedResponse(
+                200, {"candles": candles, "symbol": symbol, "empty": not candles}
+            )
+
+        return self._request(get_price_history)
+
+    def get_quotes(self, symbols):
+        def get_quotes():
+            quotes = {}
+            for symbol in [symbols] if isinstance(symbols, str) else symbols:
+                if symbol in self.prices:
+                    price = self.prices[symbol]
+                    quotes[symbol] = {
+                        "symbol": symbol,
+                        "bidPrice": price,
+                        "askPrice": price,
+                        "lastPrice": price,
+                        "closePrice": price,
+                    }
+            return SimulatedResponse(200, quotes)
+
+        return self._request(get_quotes)
+
+    ##########################################################################
+    # Implementation
+
+    def _request(self, handler) -> SimulatedResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.request_count += 1
+            if self.max_requests_per_minute is not None:
+                now = time.monotonic()
+                while self.requests and now - self.requests[0] >= 60:
+                    self.requests.popleft()
+                if len(self.requests) >= self.max_requests_per_minute:
+                    return SimulatedResponse(429, {"error": "Too many requests"})
+                self.requests.append(now)
+            if self.random.random() < self.error_rate:
+                return SimulatedResponse(500, {"error": "Simulated server error"})
+            if self.auto_step:
+                self.step()
+            return handler()
+
+    def _get_account(self, account_id, fields) -> SimulatedResponse:
+        if account_id not in self.accounts:
+            return SimulatedResponse(404, {"error": "Account not found"})
+        return SimulatedResponse(
+            200, self._account_json(self.accounts[account_id], fields)
+        )
+
+    def _account_json(self, account: SimulatedAccount, fields) -> Dict[str, Any]:
+        market_value = 0.0
+        positions = []
+        for symbol, (quantity, average_price) in account.positions.items():
+            value = quantity * self.prices.get(symbol, average_price)
+            market_value += value
+            positions.append(
+                {
+                    "shortQuantity": -quantity if quantity < 0 else 0.0,
+                    "averagePrice": average_price,
+                    "longQuantity": quantity if quantity > 0 else 0.0,
+                    "instrument": {"assetType": "EQUITY", "symbol": symbol},
+                    "marketValue": round(value, 2),
+                }
+            )
+
+        data: Dict[str, Any] = {
+            "type": "MARGIN",
+            "accountId": account.account_id,
+            "currentBalances": {
+                "availableFunds": round(account.cash, 2),
+                "buyingPower": round(account.cash, 2),
+                "cashBalance": round(account.cash, 2),
+                "liquidationValue": round(account.cash + market_value, 2),
+            },
+        }
+        if fields is not None and "positions" in _fields(fields):
+            data["positions"] = positions
+        if fields is not None and "orders" in _fields(fields):
+            data["orderStrategies"] = [self.orders[i] for i in account.order_ids]
+        return {"securitiesAccount": data}
+
+    def _get_orders(
+        self, account_ids: List[str], from_entered_datetime
+    ) -> SimulatedResponse:
+        since = ""
+        if from_entered_datetime is not None:
+            since = _format_time(from_entered_datetime)
+        orders = []
+        for account_id in account_ids:
+            account = self.accounts[account_id]
+            for order_id in reversed(account.order_ids):
+                order = self.orders[order_id]
+                if _entered_time(order) >= since:
+                    orders.append(order)
+        return SimulatedResponse(200, orders)
+
+    def _find_order(self, order_id, account_id) -> Optional[Dict[str, Any]]:
+        order = self.orders.get(int(order_id))
+        if order is None or order["accountId"] != int(account_id):
+            return None
+        return order
+
+    def _cancel_order(self, order_id, account_id) -> SimulatedResponse:
+        order = self._find_order(order_id, account_id)
+        if order is None:
+            return SimulatedResponse(404, {"error": "Order not found"})
+        orders = order.get("childOrderStrategies", [order])
+        if not any(o["status"] in ACTIVE_STATUSES for o in orders):
+            return SimulatedResponse(400, {"error": "Order cannot be canceled"})
+        for o in orders:
+            if o["status"] in ACTIVE_STATUSES:
+                o["status"] = "CANCELED"
+                o["cancelable"] = False
+        return SimulatedResponse(200)
+
+    def _place_order(self, account_id, order_spec) -> SimulatedResponse:
+        if account_id not in self.accounts:
+            return SimulatedResponse(404, {"error": "Account not found"})
+        strategy = order_spec.get("orderStrategyType", "SINGLE")
+        if strategy == "SINGLE":
+            order = self._new_order(account_id, order_spec)
+        elif strategy == "OCO":
+            order = {
+                "orderStrategyType": "OCO",
+                "orderId": next(self._order_ids),
+                "cancelable": True,
+                "accountId": int(account_id),
+            }
+            order["childOrderStrategies"] = [
+                self._new_order(account_id, child, order["orderId"])
+                for child in order_spec["childOrderStrategies"]
+            ]
+            self.orders[order["orderId"]] = order
+        else:
+            return SimulatedResponse(
+                400, {"error": f"Unsupported orderStrategyType {strategy}"}
+            )
+
+        self.accounts[account_id].order_ids.append(order["orderId"])
+        location = ORDER_URL.format(account_id, order["orderId"])
+        return SimulatedResponse(201, headers={"Location": location})
+
+    def _new_order(self, account_id, spec, parent_id=None) -> Dict[str, Any]:
+        legs = []
+        for i, leg in enumerate(spec["orderLegCollection"], 1):
+            instruction = leg["instruction"]
+            legs.append(
+                {
+                    "orderLegType": "EQUITY",
+                    "legId": i,
+                    "instrument": dict(leg["instrument"]),
+                    "instruction": instruction,
+                    "positionEffect": "OPENING" if instruction == "BUY" else "CLOSING",
+                    "quantity": float(leg["quantity"]),
+                }
+            )
+        quantity = sum(leg["quantity"] for leg in legs)
+        order = {
+            "session": spec.get("session", "NORMAL"),
+            "duration": spec.get("duration", "DAY"),
+            "orderType": spec["orderType"],
+            "complexOrderStrategyType": "NONE",
+            "quantity": quantity,
+            "filledQuantity": 0.0,
+            "remainingQuantity": quantity,
+            "orderLegCollection": legs,
+            "orderStrategyType": "SINGLE",
+            "orderId": next(self._order_ids),
+            "cancelable": True,
+            "editable": True,
+            "status": "QUEUED",
+            "enteredTime": _format_time(datetime.datetime.now(datetime.timezone.utc)),
+            "accountId": int(account_id),
+        }
+        for key in ("price", "stopPrice"):
+            if key in spec:
+                order[key] = float(spec[key])
+        if parent_id is not None:
+            order["parentOrderId"] = parent_id
+        self.orders[order["orderId"]] = order
+        return order
+
+    def _try_fill(self, order: Dict[str, Any]) -> None:
+        price = self.prices.get(self._symbol(order))
+        if price is None or not _triggered(order, price):
+            return
+
+        account = self.accounts[str(order["accountId"])]
+        for leg in order["orderLegCollection"]:
+            quantity = leg["quantity"]
+            if leg["instruction"] == "SELL":
+                quantity = -quantity
+            position = account.positions.setdefault(leg["instrument"]["symbol"], [0, 0])
+            if quantity > 0 and position[0] >= 0:
+                cost = position[0] * position[1] + quantity * price
+                position[1] = cost / (position[0] + quantity)
+            position[0] += quantity
+            account.cash -= quantity * price
+            if position[0] == 0:
+                del account.positions[leg["instrument"]["symbol"]]
+
+        order["status"] = "FILLED"
+        order["filledQuantity"] = order["quantity"]
+        order["remainingQuantity"] = 0.0
+        order["cancelable"] = False
+        order["editable"] = False
+
+        # One fill cancels the other
+        if "parentOrderId" in order:
+            parent = self.orders[order["parentOrderId"]]
+            for sibling in parent["childOrderStrategies"]:
+                if sibling["status"] in ACTIVE_STATUSES:
+                    sibling["status"] = "CANCELED"
+
+    @staticmethod
+    def _symbol(order: Dict[str, Any]) -> str:
+        return order["orderLegCollection"][0]["instrument"]["symbol"]
+
+
+def _triggered(order: Dict[str, Any], price: float) -> bool:
+    buy = order["orderLegCollection"][0]["instruction"] == "BUY"
+    if order["orderType"] == "MARKET":
+        return True
+    if order["orderType"] == "LIMIT":
+        return price <= order["price"] if buy else price >= order["price"]
+    if order["orderType"] == "STOP":
+        return price >= order["stopPrice"] if buy else price <= order["stopPrice"]
+    return False
+
+
+def _fields(fields) -> List[str]:
+    if not isinstance(fields, (list, tuple)):
+        fields = [fields]
+    return [str(getattr(f, "value", f)) for f in fields]
+
+
+def _entered_time(order: Dict[str, Any]) -> str:
+    if "childOrderStrategies" in order:
+        return min(_entered_time(child) for child in order["childOrderStrategies"])
+    return order["enteredTime"]
+
+
+def _format_time(dt: datetime.datetime) -> str:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+
+def _millis(value: datetime.datetime) -> int:
+    return int(value.timestamp() * 1000)
@@ -1,231 +1,310 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 from decimal import Decimal
-import json
-from typing import Dict, List, Optional
-
+import functools
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TYPE_CHECKING,
+)
+
+from requests.adapters import HTTPAdapter
 from tda import auth
 from tda.orders.common import Duration, OrderType
 from tda.orders.equities import equity_buy_limit, equity_buy_market, equity_sell_market
 from tda.utils import Utils
 
+from .activity import ActivityFeed, reached
+from .jsonstream import iter_array
+from .metrics import Metrics
+from .models import (  # noqa: F401
+    Account,
+    Balances,
+    BrokerException,
+    Leg,
+    Order,
+    OrderStatus,
+    Position,
+)
+from .orderbook import OrderBook
+from .quotes import QuoteService
+from .scheduler import Priority, RequestScheduler
+from .tokens import TokenManager
 
-class BrokerException(Exception):
-    def __init__(self, response):
-        j = response.json()
-        if "error" not in j:
-            self.message = json.dumps(j, indent=4)
-        self.message = response.json()["error"]
-        super().__init__(self.message)
-
-
-class Position:
-    def __init__(self, raw) -> None:
-        # {
-        #     "shortQuantity": 0.0,
-        #     "averagePrice": 399.95,
-        #     "currentDayProfitLoss": 659.59,
-        #     "currentDayProfitLossPercentage": 2.22,
-        #     "longQuantity": 71.0,
-        #     "settledLongQuantity": 71.0,
-        #     "settledShortQuantity": 0.0,
-        #     "instrument": {
-        #         "assetType": "EQUITY",
-        #         "cusip": "252131107",
-        #         "symbol": "DXCM"
-        #     },
-        #     "marketValue": 30322.68,
-        #     "maintenanceRequirement": 30322.68
-        # }
-        self.raw = raw
-
-    @property
-    def symbol(self) -> str:
-        return self.raw["instrument"]["symbol"]
-
-    @property
-    def long(self) -> int:
-        return self.raw["longQuantity"]
-
-    @property
-    def short(self) -> int:
-        return self.raw["shortQuantity"]
-
-    @property
-    def trade_price(self) -> Decimal:
-        return Decimal(self.raw["averagePrice"])
-
-
-class Order:
-    def __init__(self, raw) -> None:
-        # {
-        #     "session": "NORMAL",
-        #     "duration": "GOOD_TILL_CANCEL",
-        #     "orderType": "STOP",
-        #     "complexOrderStrategyType": "NONE",
-        #     "quantity": 1200.0,
-        #     "filledQuantity": 0.0,
-        #     "remainingQuantity": 1200.0,
-        #     "requestedDestination": "AUTO",
-        #     "destinationLinkName": "AutoRoute",
-        #     "stopPrice": 13.86,
-        #     "orderLegCollection": [
-        #         {
-        #             "orderLegType": "EQUITY",
-        #             "legId": 1,
-        #             "instrument": {
-        #                 "assetType": "EQUITY",
-        #                 "cusip": "92189F817",
-        #                 "symbol": "VNM"
-        #             },
-        #             "instruction": "SELL",
-        #             "positionEffect": "CLOSING",
-        #             "quantity": 1200.0
-        #         }
-        #     ],
-        #     "orderStrategyType": "SINGLE",
-        #     "orderId": 3126389058,
-        #     "cancelable": true,
-        #     "editable": true,
-        #     "status": "QUEUED",
-        #     "enteredTime": "2020-07-30T01:08:58+0000",
-        #     "accountId": 455102033
-        # }
-        self.raw = raw
-
-    def __str__(self) -> str:
-        if self.is_single:
-            # The API only supports single leg anyways, so this for loop always
-            # returns a single leg . OCO orders, for example, are not returned,
-            # even when Thinkorswim does show them.
-            str = []
-            for leg in self.raw["orderLegCollection"]:
-                instruction = leg["instruction"]
-                quantity = int(leg["quantity"])
-
-                sign = "+"
-                if instruction == "SELL":
-                    sign = "-"
-                else:
-                    sign = "+"
-
-                symbol = leg["instrument"]["symbol"]
-                if self.order_type == "STOP" or self.order_type == "LIMIT":
-                    order = f"{self.order_type} {self.price}"
-                else:
-                    order = f"{self.order_type}"
-
-                effect = leg["positionEffect"]
-
-                # return f"SELL -1,200 VNM STP 13.86 GTC [TO CLOSE]"
-                str.append(
-                    f"{self.order_id} {instruction} {sign}{quantity} {symbol} {order} "
-                    f"{self.duration} {effect} {self.status}"
-                )
-            return "\n".join(str)
-        elif self.is_oco:
-            str = [f"{self.order_id} OCO"]
-            for child in self.raw["childOrderStrategies"]:
-                child_order = Order(child)
-                str.append(f"    {child_order}")
-
-            return "\n".join(str)
-        else:
-            raise BrokerException(f"Unhandled orderStrategyType {self.strategy_type}")
-
-    @property
-    def order_id(self) -> str:
-        return self.raw["orderId"]
-
-    @property
-    def status(self) -> str:
-        return self.raw["status"]
-
-    @property
-    def active(self) -> bool:
-        if self.is_single:
-            return (
-                self.status != "CANCELED"
-                and self.status != "EXPIRED"
-                and self.status != "FILLED"
-                and self.status != "REJECTED"
-                and self.status != "REPLACED"
-            )
-        elif self.is_oco:
-            active = False
-            for child in self.raw["childOrderStrategies"]:
-                child_order = Order(child)
-                active |= child_order.active
-            return active
-        else:
-            raise BrokerException(f"Unhandled orderStrategyType {self.strategy_type}")
-
-    @property
-    def strategy_type(self) -> str:
-        return self.raw["orderStrategyType"]
-
-    @property
-    def is_single(self) -> bool:
-        return self.strategy_type == "SINGLE"
+if TYPE_CHECKING:
+    from .orderstore import OrderStore
 
-    def is_oco(self) -> bool:
-        return self.strategy_type == "OCO"
+# Size of the chunks in which responses are handed to the JSON decoder
+CHUNK_SIZE = 64 * 1024
 
-    @property
-    def order_type(self) -> str:
-        return self.raw["orderType"]
+# Seconds between get_order calls while waiting without an activity feed
+POLL_INTERVAL = 1.0
 
-    @property
-    def duration(self) -> str:
-        return self.raw["duration"]
-
-    @property
-    def price(self) -> float:
-        if "stopPrice" in self.raw:
-            return self.raw["stopPrice"]
-        else:
-            return self.raw["price"]
+# How far back the API returns orders
+ORDER_HISTORY = datetime.timedelta(days=60)
 
 
 class TdAmeritrade:
     def __init__(
-        self, account_id: str, api_key: str, token_path: str, redirect_uri: str
+        self,
+        account_id: str,
+        api_key: str,
+        token_path: str,
+        redirect_uri: str,
+        cache_ttl: float = 5.0,
+        order_store: Optional["OrderStore"] = None,
+        client=None,
+        scheduler: Optional[RequestScheduler] = None,
+        metrics: Optional[Metrics] = None,
+        quote_ttl: float = 2.0,
+        interactive: bool = True,
     ) -> None:
+        """Creates a broker for one account.
+
+        Pass a client, e.g. a SimulatedClient, to skip authentication. With a
+        scheduler, every request waits for its turn under the rate limit. With
+        metrics, every request is timed and counted per endpoint. Without a
+        token, a browser is opened to log in, or a BrokerException is raised
+        when not interactive.
+        """
         self.account_id = account_id
+        self.order_store = order_store
+        self.scheduler = scheduler
+        self.metrics = metrics
+        # Pushes order status to wait_for_order, see mish.get_broker
+        self.feed: Optional[ActivityFeed] = None
+        # Built by the first get_order_book, then kept up to date
+        self.book: Optional[OrderBook] = None
+        self._book_time = 0.0
+        # Account snapshots are served from memory for cache_ttl seconds, and
+        # dropped as soon as we place or cancel an order
+        self.cache_ttl = cache_ttl
+        self._account: Optional[Account] = None
+        self._account_time = 0.0
+        self._account_lock = threading.Lock()
+        self.quotes = QuoteService(self._fetch_quotes, quote_ttl)
+        # Refreshes the token ahead of expiry once started, see mish serve
+        self.tokens: Optional[TokenManager] = None
+        if client is not None:
+            self.c = client
+            return
+        self.tokens = TokenManager(token_path, api_key)
+        start = time.perf_counter()
         try:
-            self.c = auth.client_from_token_file(token_path, api_key)
+            self.c = self.tokens.load_client()
+            if self.metrics is not None:
+                self.metrics.observe("auth", time.perf_counter() - start)
         except FileNotFoundError:
+            if not interactive:
+                raise BrokerException(
+                    f"No token at {token_path}, run mish in a terminal to log in"
+                )
+
             from selenium import webdriver
             from webdriver_manager.chrome import ChromeDriverManager
 
             with webdriver.Chrome(ChromeDriverManager().install()) as driver:
-                self.c = auth.client_from_login_flow(
-                    driver, api_key, redirect_uri, token_path
+                self.c = self.tokens.attach(
+                    auth.client_from_login_flow(
+                        driver, api_key, redirect_uri, token_path
+                    )
                 )
 
+    def _call(self, priority: Priority, func, *args, **kwargs):
+        if self.scheduler is not None:
+            self.scheduler.acquire(priority)
+        if self.metrics is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        error = True
+        try:
+            r = func(*args, **kwargs)
+            error = not r.ok
+            return r
+        finally:
+            endpoint = getattr(func, "__name__", "request")
+            self.metrics.observe(endpoint, time.perf_counter() - start, error)
+
+    def get_account(self) -> Account:
+        with self._account_lock:
+            now = time.monotonic()
+            if self._account and now - self._account_time < self.cache_ttl:
+                return self._account
+
+            r = self._call(
+                Priority.READ,
+                self.c.get_account,
+                self.account_id,
+                fields=self.c.Account.Fields.POSITIONS,
+            )
+            if not r.ok:
+                raise BrokerException(r)
+
+            self._account = Account(r.json()["securitiesAccount"])
+            self._account_time = now
+            return self._account
+
+    def invalidate(self) -> None:
+        with self._account_lock:
+            self._account = None
+
+    def cache_account(self, account: Account) -> None:
+        """Serves an account read by someone else, e.g. an AccountSet."""
+        with self._account_lock:
+            self._account = account
+            self._account_time = time.monotonic()
+
     def get_positions(self) -> Dict[str, Position]:
-        r = self.c.get_account(self.account_id, fields=self.c.Account.Fields.POSITIONS)
+        return dict(self.get_account().positions)
+
+    def iter_positions(self) -> Iterator[Position]:
+        """Yields positions as they are decoded from the account response.
+
+        A cached account snapshot is used when there is one.
+        """
+        with self._account_lock:
+            now = time.monotonic()
+            if self._account and now - self._account_time < self.cache_ttl:
+                account = self._account
+            else:
+                account = None
+        if account is not None:
+            yield from account.positions.values()
+            return
+
+        r = self._call(
+            Priority.READ,
+            self.c.get_account,
+            self.account_id,
+            fields=self.c.Account.Fields.POSITIONS,
+        )
         if not r.ok:
             raise BrokerException(r)
+        # The positions key is left out of an account without positions
+        path = ("securitiesAccount", "positions")
+        for raw in iter_array(r.iter_content(CHUNK_SIZE), path):
+            yield Position(raw)
 
-        data = r.json()
-        account = data["securitiesAccount"]
-        positions = {}
-        for v in account["positions"]:
-            position = Position(v)
-            positions[position.symbol] = position
-        return positions
+    def get_balances(self) -> Balances:
+        return self.get_account().balances
 
     def get_position(self, symbol: str) -> Optional[Position]:
-        positions = self.get_positions()
-        if symbol in positions:
-            return positions[symbol]
-        return None
-
-    def get_orders(self) -> List[Order]:
+        return self.get_account().positions.get(symbol)
+
+    def get_orders(self, active_only: bool = False, sync: bool = True) -> List[Order]:
+        """Returns the orders of the last 60 days, newest first.
+
+        With an order store, only the orders that could have changed since
+        the last sync are downloaded and merged into the store, and the
+        result is read from the store. Pass sync=False to skip the download.
+        """
+        if self.order_store is None:
+            orders = [Order(raw) for raw in self._fetch_orders()]
+            if active_only:
+                orders = [order for order in orders if order.active]
+            return orders
+
+        if sync:
+            self.sync_orders()
+        return self.order_store.get_orders(self.account_id, active_only)
+
+    def iter_orders(
+        self, active_only: bool = False, sync: bool = True
+    ) -> Iterator[Order]:
+        """Yields the same orders as get_orders, as soon as each is decoded."""
+        if self.order_store is not None:
+            if sync:
+                self.sync_orders()
+            yield from self.order_store.iter_orders(self.account_id, active_only)
+            return
+
+        r = self._request_orders()
+        for raw in iter_array(r.iter_content(CHUNK_SIZE)):
+            order = Order(raw)
+            if order.active or not active_only:
+                yield order
+
+    def sync_orders(self) -> List[Dict[str, Any]]:
+        """Merges the orders changed since the last sync, and returns them.
+
+        Active orders entered before the 60 days the API returns, e.g. old
+        GTC stops, are fetched again one by one. Those the API no longer has
+        are marked UNKNOWN.
+        """
+        if self.order_store is None:
+            return []
+        synced_at = datetime.datetime.now(datetime.timezone.utc)
+        window = synced_at - ORDER_HISTORY
+        since = self.order_store.sync_from(self.account_id, window)
+        raw_orders = self._fetch_orders(since)
+        fetched = {int(raw["orderId"]) for raw in raw_orders}
+        for raw in self.order_store.active_before(self.account_id, window):
+            if int(raw["orderId"]) not in fetched:
+                raw_orders.append(self._refetch_order(raw))
+        self.order_store.merge(self.account_id, raw_orders, synced_at)
+        return raw_orders
+
+    def _refetch_order(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        r = self._call(Priority.READ, self.c.get_order, raw["orderId"], self.account_id)
+        if r.status_code == 404:
+            return {**raw, "status": OrderStatus.UNKNOWN.value}
+        if not r.ok:
+            raise BrokerException(r)
+        return r.json()
+
+    def get_order_book(
+        self, sync: bool = True, max_age: Optional[float] = None
+    ) -> OrderBook:
+        """Returns all orders of the last 60 days, indexed for lookups.
+
+        The book is built once. After that, a sync only adds the orders that
+        changed, when there is an order store. Placed orders are added as they
+        were sent, and orders fetched with get_order as they are. Canceled and
+        replaced orders are dropped until a sync returns their new status.
+
+        With max_age, the book is returned as it is when it was synced less
+        than max_age seconds ago, and synced otherwise.
+        """
+        now = time.monotonic()
+        if max_age is not None:
+            if self.book is not None and now - self._book_time < max_age:
+                return self.book
+            sync = True
+
+        if self.book is None:
+            self.book = OrderBook(self.get_orders(sync=sync))
+        elif sync and self.order_store is not None:
+            self.book.update(Order(raw) for raw in self.sync_orders())
+        elif sync:
+            self.book = OrderBook(self.get_orders())
+        if sync:
+            self._book_time = now
+        return self.book
+
+    def _fetch_orders(
+        self, since: Optional[datetime.datetime] = None
+    ) -> List[Dict[str, Any]]:
+        return self._request_orders(since).json()
+
+    def _request_orders(self, since: Optional[datetime.datetime] = None):
         # tda.debug.enable_bug_report_logging()
 
-        from_date = datetime.datetime.today() + datetime.timedelta(-60)
-        r = self.c.get_orders_by_path(
+        now = datetime.datetime.now(datetime.timezone.utc)
+        from_date = now - ORDER_HISTORY
+        if since is not None and since > from_date:
+            from_date = since
+        r = self._call(
+            Priority.READ,
+            self.c.get_orders_by_path,
             self.account_id,
             # must specify from_date or the result would be empty
             from_entered_datetime=from_date,
@@ -238,38 +317,128 @@ class TdAmeritrade:
         )
         if not r.ok:
             raise BrokerException(r)
-
-        # print(json.dumps(r.json(), indent=4))
-        orders = []
-        for order in r.json():
-            # print(json.dumps(order, indent=4))
-            orders.append(Order(order))
-        return orders
+        return r
 
     def get_order(self, order_id: str) -> Order:
-        r = self.c.get_order(order_id, self.account_id)
+        r = self._call(Priority.READ, self.c.get_order, order_id, self.account_id)
         if not r.ok:
             raise BrokerException(r)
 
-        return Order(r.json())
+        order = Order(r.json())
+        if self.book is not None:
+            self.book.add(order)
+        return order
+
+    def get_quotes(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        """Returns the last price of every symbol with a quote.
+
+        Prices are cached for quote_ttl seconds. The symbols that aren't
+        cached are fetched with one request.
+        """
+        return self.quotes.get(symbols)
+
+    def get_quote(self, symbol: str) -> Optional[Decimal]:
+        return self.get_quotes([symbol]).get(symbol)
+
+    def _fetch_quotes(self, symbols: List[str]) -> Dict[str, Decimal]:
+        r = self._call(Priority.READ, self.c.get_quotes, symbols)
+        if not r.ok:
+            raise BrokerException(r)
+
+        return {
+            symbol: Decimal(str(quote["lastPrice"]))
+            for symbol, quote in r.json().items()
+        }
+
+    def get_price_history(
+        self,
+        symbol: str,
+        frequency: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> List[Dict[str, Any]]:
+        """Returns the daily or minute candles from start to end, oldest first.
+
+        Each candle has open, high, low, close, volume and datetime, in
+        milliseconds since the epoch.
+        """
+        history = self.c.PriceHistory
+        if frequency == "daily":
+            period_type = history.PeriodType.YEAR
+            frequency_type = history.FrequencyType.DAILY
+            every = history.Frequency.DAILY
+        elif frequency == "minute":
+            period_type = history.PeriodType.DAY
+            frequency_type = history.FrequencyType.MINUTE
+            every = history.Frequency.EVERY_MINUTE
+        else:
+            raise ValueError(f"Unknown frequency {frequency}")
+
+        r = self._call(
+            Priority.READ,
+            self.c.get_price_history,
+            symbol,
+            period_type=period_type,
+            frequency_type=frequency_type,
+            frequency=every,
+            start_datetime=start,
+            end_datetime=end,
+        )
+        if not r.ok:
+            raise BrokerException(r)
+
+        return r.json().get("candles", [])
+
+    def wait_for_order(
+        self, order_id: str, status: OrderStatus, timeout: float
+    ) -> Order:
+        """Waits until the order has the status or is done, and returns it.
+
+        The status is pushed by the activity feed when it is running. Otherwise
+        the order is polled every POLL_INTERVAL seconds.
+        """
+        deadline = time.monotonic() + timeout
+        if self.feed is not None and self.feed.running:
+            self.feed.table.wait_for(int(order_id), status, timeout)
+            return self.get_order(order_id)
+
+        while True:
+            order = self.get_order(order_id)
+            remaining = deadline - time.monotonic()
+            if reached(order.status, status) or remaining <= 0:
+                return order
+            time.sleep(min(POLL_INTERVAL, remaining))
 
     def cancel_order(self, order_id: str) -> None:
-        r = self.c.cancel_order(order_id, self.account_id)
+        r = self._call(Priority.CANCEL, self.c.cancel_order, order_id, self.account_id)
+        self.invalidate()
+        if not r.ok:
+            raise BrokerException(r)
+        if self.book is not None:
+            self.book.remove(int(order_id))
+
+    def _place_order(self, order) -> str:
+        r = self._call(Priority.PLACE, self.c.place_order, self.account_id, order)
+        self.invalidate()
         if not r.ok:
             raise BrokerException(r)
 
+        order_id = Utils(self.c, self.account_id).extract_order_id(r)
+        self._add_to_book(order_id, order)
+        return order_id
+
     def place_buy_market(self, symbol: str, quantity: int) -> str:
         order = (
             # market order can only be a day order
             equity_buy_market(symbol, quantity)
         ).build()
 
-        r = self.c.place_order(self.account_id, order)
-        if not r.ok:
-            raise BrokerException(r)
+        return self._place_order(order)
 
-        order_id = Utils(self.c, self.account_id).extract_order_id(r)
-        return order_id
+    def place_sell_market(self, symbol: str, quantity: int) -> str:
+        order = equity_sell_market(symbol, quantity).build()
+
+        return self._place_order(order)
 
     def place_buy_limit(self, symbol: str, quantity: int, limit: Decimal) -> str:
         order = (
@@ -278,24 +447,222 @@ class TdAmeritrade:
             )
         ).build()
 
-        r = self.c.place_order(self.account_id, order)
+        return self._place_order(order)
+
+    def place_sell_stop(self, symbol: str, quantity: int, stop: Decimal) -> str:
+        return self._place_order(_sell_stop(symbol, quantity, stop))
+
+    def replace_sell_stop(
+        self, order_id: str, symbol: str, quantity: int, stop: Decimal
+    ) -> str:
+        """Replaces an order with a sell stop, and returns the new order id."""
+        spec = _sell_stop(symbol, quantity, stop)
+        r = self._call(
+            Priority.PLACE,
+            self.c.replace_order,
+            self.account_id,
+            order_id,
+            spec,
+        )
+        self.invalidate()
         if not r.ok:
             raise BrokerException(r)
+        if self.book is not None:
+            self.book.remove(int(order_id))
 
-        order_id = Utils(self.c, self.account_id).extract_order_id(r)
-        return order_id
+        new_order_id = Utils(self.c, self.account_id).extract_order_id(r)
+        self._add_to_book(new_order_id, spec)
+        return new_order_id
+
+    def _add_to_book(self, order_id, spec: Dict[str, Any]) -> None:
+        # As sent, until a sync or get_order returns the order as it is now
+        if self.book is not None and order_id is not None:
+            self.book.add(Order({**spec, "orderId": order_id, "status": "QUEUED"}))
+
+
+def _sell_stop(symbol: str, quantity: int, stop: Decimal) -> Dict[str, Any]:
+    return (
+        equity_sell_market(symbol, quantity)
+        .set_order_type(OrderType.STOP)
+        .set_duration(Duration.GOOD_TILL_CANCEL)
+        .set_stop_price(stop)
+    ).build()
+
+
+class AccountOrder(NamedTuple):
+    account_id: str
+    order: Order
+
+
+class AccountPosition(NamedTuple):
+    account_id: str
+    position: Position
 
-    def place_sell_stop(self, symbol: str, quantity: int, stop: Decimal):
-        order = (
-            equity_sell_market(symbol, quantity)
-            .set_order_type(OrderType.STOP)
-            .set_duration(Duration.GOOD_TILL_CANCEL)
-            .set_stop_price(stop)
-        ).build()
 
-        r = self.c.place_order(self.account_id, order)
+class AccountSet:
+    """Several accounts of the same login, read together.
+
+    The positions and balances of all accounts come from one get_accounts
+    request, and their orders from one get_orders_by_query request. Results
+    are tagged with their account. Accounts that have to be read on their
+    own, e.g. to sync an order store, are read in parallel.
+    """
+
+    def __init__(self, brokers: Iterable[TdAmeritrade], workers: int = 8) -> None:
+        self.brokers = {broker.account_id: broker for broker in brokers}
+        # Requests for all accounts go through the scheduler and metrics of
+        # the first broker. All brokers share its client.
+        self.main = next(iter(self.brokers.values()))
+        self.workers = workers
+
+    def get_accounts(self) -> Dict[str, Account]:
+        """Returns the accounts by id, and caches them in their brokers."""
+        c = self.main.c
+        r = self.main._call(
+            Priority.READ, c.get_accounts, fields=c.Account.Fields.POSITIONS
+        )
         if not r.ok:
             raise BrokerException(r)
 
-        order_id = Utils(self.c, self.account_id).extract_order_id(r)
-        return order_id
+        accounts = {}
+        for raw in r.json():
+            account_id = str(raw["securitiesAccount"]["accountId"])
+            if account_id in self.brokers:
+                accounts[account_id] = Account(raw["securitiesAccount"])
+                self.brokers[account_id].cache_account(accounts[account_id])
+
+        # Accounts of another login
+        missing = [
+            account_id for account_id in self.brokers if account_id not in accounts
+        ]
+        for account_id, account in zip(
+            missing, self._map(lambda broker: broker.get_account(), missing)
+        ):
+            accounts[account_id] = account
+        return {account_id: accounts[account_id] for account_id in self.brokers}
+
+    def get_positions(self) -> List[AccountPosition]:
+        return [
+            AccountPosition(account_id, position)
+            for account_id, account in self.get_accounts().items()
+            for position in account.positions.values()
+        ]
+
+    def get_orders(
+        self, active_only: bool = False, sync: bool = True
+    ) -> List[AccountOrder]:
+        """Returns the orders of the last 60 days of all accounts.
+
+        Order stores are synced per account, so with an order store every
+        account is read on its own.
+        """
+        if any(broker.order_store is not None for broker in self.brokers.values()):
+            results = self._map(
+                lambda broker: broker.get_orders(active_only, sync), list(self.brokers)
+            )
+            return [
+                AccountOrder(account_id, order)
+                for account_id, orders in zip(self.brokers, results)
+                for order in orders
+            ]
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        r = self.main._call(
+            Priority.READ,
+            self.main.c.get_orders_by_query,
+            from_entered_datetime=now - ORDER_HISTORY,
+        )
+        if not r.ok:
+            raise BrokerException(r)
+
+        orders = []
+        for raw in r.json():
+            account_id = str(raw.get("accountId"))
+            order = Order(raw)
+            if account_id in self.brokers and (order.active or not active_only):
+                orders.append(AccountOrder(account_id, order))
+        return orders
+
+    def _map(self, func, account_ids: List[str]) -> list:
+        if not account_ids:
+            return []
+        workers = min(self.workers, len(account_ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    func, (self.brokers[account_id] for account_id in account_ids)
+                )
+            )
+
+
+class AsyncTdAmeritrade:
+    """Coroutine versions of the TdAmeritrade calls.
+
+    tda-api only ships a synchronous client, so every call runs on a worker
+    thread over the broker's HTTP session. The session's connection pool is
+    sized to the number of workers so that all in-flight requests reuse
+    keep-alive connections instead of opening new ones.
+    """
+
+    def __init__(self, broker: TdAmeritrade, workers: int = 8) -> None:
+        self.broker = broker
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.broker.c.session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        )
+
+    async def __aenter__(self) -> "AsyncTdAmeritrade":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def get_positions(self) -> Dict[str, Position]:
+        return await self._run(self.broker.get_positions)
+
+    async def get_account(self) -> Account:
+        return await self._run(self.broker.get_account)
+
+    async def get_balances(self) -> Balances:
+        return await self._run(self.broker.get_balances)
+
+    async def get_position(self, symbol: str) -> Optional[Position]:
+        return await self._run(self.broker.get_position, symbol)
+
+    async def get_orders(self, active_only: bool = False) -> List[Order]:
+        return await self._run(self.broker.get_orders, active_only)
+
+    async def get_order(self, order_id: str) -> Order:
+        return await self._run(self.broker.get_order, order_id)
+
+    async def cancel_order(self, order_id: str) -> None:
+        await self._run(self.broker.cancel_order, order_id)
+
+    async def place_buy_market(self, symbol: str, quantity: int) -> str:
+        return await self._run(self.broker.place_buy_market, symbol, quantity)
+
+    async def get_quotes(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        return await self._run(self.broker.get_quotes, symbols)
+
+    async def place_sell_market(self, symbol: str, quantity: int) -> str:
+        return await self._run(self.broker.place_sell_market, symbol, quantity)
+
+    async def place_buy_limit(self, symbol: str, quantity: int, limit: Decimal) -> str:
+        return await self._run(self.broker.place_buy_limit, symbol, quantity, limit)
+
+    async def place_sell_stop(self, symbol: str, quantity: int, stop: Decimal) -> str:
+        return await self._run(self.broker.place_sell_stop, symbol, quantity, stop)
+
+    async def replace_sell_stop(
+        self, order_id: str, symbol: str, quantity: int, stop: Decimal
+    ) -> str:
+        return await self._run(
+            self.broker.replace_sell_stop, order_id, symbol, quantity, stop
+        )
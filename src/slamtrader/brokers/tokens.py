@@ -0,0 +1,132 @@
+"""OAuth tokens shared by all mish processes through the token file.
+
+The access token expires after 30 minutes and is otherwise refreshed inline,
+by the first request after it expired. TokenManager refreshes it in a
+background thread a few minutes ahead instead, so no order waits for it.
+Every refresh replaces the token file atomically under a lock, and a process
+that finds a fresher token in the file uses it instead of refreshing again.
+"""
+from contextlib import contextmanager
+import fcntl
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from tda import auth
+
+# Seconds before the access token expires to refresh it
+REFRESH_MARGIN = 300.0
+
+# Seconds to wait before trying a failed refresh again
+RETRY_DELAY = 30.0
+
+Token = Dict[str, Any]
+
+
+class TokenException(Exception):
+    pass
+
+
+class TokenManager:
+    def __init__(self, path: str, api_key: str, margin: float = REFRESH_MARGIN) -> None:
+        self.path = path
+        self.api_key = api_key
+        self.margin = margin
+        self.client = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        # The last refresh error of the background thread
+        self.error: Optional[Exception] = None
+
+    def load_client(self):
+        """Returns a client with the token from the file.
+
+        Raises FileNotFoundError when there is no token yet.
+        """
+        return self.attach(auth.client_from_token_file(self.path, self.api_key))
+
+    def attach(self, client):
+        """Makes the client save the tokens it refreshes inline atomically."""
+        self.client = client
+        client.session.token_updater = self.save
+        return client
+
+    def save(self, token: Token) -> None:
+        with self._locked():
+            self._write(token)
+
+    def load(self) -> Optional[Token]:
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def expires_in(self) -> float:
+        """Seconds until the access token of the client expires."""
+        if self.client is None:
+            raise TokenException("No client to refresh the token of")
+        return _expires_in(self.client.session.token)
+
+    def refresh(self) -> None:
+        """Refreshes the access token, unless another process already did."""
+        if self.client is None:
+            raise TokenException("No client to refresh the token of")
+        session = self.client.session
+        with self._locked():
+            stored = self.load()
+            if stored is not None and _expires_in(stored) > self.margin:
+                session.token = stored
+                return
+            token = session.refresh_token(
+                session.auto_refresh_url, **session.auto_refresh_kwargs
+            )
+            session.token = token
+            self._write(token)
+
+    def start(self) -> None:
+        """Keeps refreshing the token ahead of expiry in a daemon thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self) -> None:
+        delay = self.expires_in() - self.margin
+        while not self.stopped.wait(max(delay, 0)):
+            try:
+                self.refresh()
+                self.error = None
+                delay = self.expires_in() - self.margin
+            except Exception as error:
+                # Requests still refresh inline when the token expires
+                self.error = error
+                delay = RETRY_DELAY
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _write(self, token: Token) -> None:
+        # Other processes read the file without the lock, so they must never
+        # see it half written
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+            pickle.dump(token, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.path)
+
+
+def _expires_in(token: Token) -> float:
+    return float(token.get("expires_at", 0)) - time.time()
@@ -0,0 +1,84 @@
+"""Thin front end for mish.
+
+When a ``mish serve`` daemon is listening, commands are forwarded to it over
+its Unix socket, so neither click, tda nor the token file are loaded here.
+Otherwise the command runs in process as usual. So do commands that run
+until interrupted, which would keep the daemon from serving anyone else.
+"""
+import io
+import json
+import os
+import socket
+import sys
+from typing import List, Optional
+
+
+def long_running(argv: List[str]) -> bool:
+    """Whether the command runs until interrupted, e.g. mish ingest."""
+    if argv[:1] in (["serve"], ["ingest"]):
+        return True
+    return argv[:1] == ["trail"] and any(
+        arg == "--interval" or arg.startswith("--interval=") for arg in argv
+    )
+
+
+# Commands that read a file argument, or stdin without one, and their options
+# that take a value
+STDIN_COMMANDS = {
+    "batch": {"-w", "--workers"},
+    "rebalance": {"--lot", "-w", "--workers"},
+}
+
+
+def reads_stdin(argv: List[str]) -> bool:
+    """Whether the command reads stdin, e.g. mish batch without a file."""
+    options = STDIN_COMMANDS.get(argv[0] if argv else "")
+    if options is None:
+        return False
+    arguments = []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in options:
+            next(args, None)
+        elif arg == "-" or not arg.startswith("-"):
+            arguments.append(arg)
+    return arguments in ([], ["-"])
+
+
+def socket_path() -> str:
+    return os.environ.get("MISH_SOCKET", os.path.expanduser("~/.mish.sock"))
+
+
+def forward(path: str, argv: List[str], input: Optional[str] = None) -> int:
+    request = {"argv": argv, "cwd": os.getcwd(), "input": input}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(json.dumps(request).encode() + b"\n")
+        with s.makefile("rb") as f:
+            response = json.loads(f.readline())
+
+    sys.stdout.write(response["output"])
+    sys.stdout.flush()
+    return response["exit_code"]
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    path = socket_path()
+    if not long_running(argv) and os.path.exists(path):
+        # Only read stdin when the command does, or an open pipe would hang
+        input = None
+        if reads_stdin(argv) and not sys.stdin.isatty():
+            input = sys.stdin.read()
+        try:
+            exit_code = forward(path, argv, input)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Stale socket from a daemon that is no longer running
+            if input is not None:
+                sys.stdin = io.StringIO(input)
+        else:
+            sys.exit(exit_code)
+
+    from .mish import main as mish
+
+    mish()
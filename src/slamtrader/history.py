@@ -0,0 +1,215 @@
+"""Local price history, stored by column in memory-mapped files.
+
+Every symbol and frequency has a directory with one file per column, e.g.
+``history/DXCM/daily/close.f8``, holding raw little endian values. Updates
+only fetch and append the bars after the last one stored. Reads map the files
+instead of loading them, so slicing the last bars of a long history is free.
+"""
+import datetime
+import os
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+if TYPE_CHECKING:
+    from .brokers.tdameritrade import TdAmeritrade
+
+COLUMNS = {
+    "datetime": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+}
+
+# How far back the first update of a symbol goes
+INITIAL_HISTORY = {
+    "daily": datetime.timedelta(days=365),
+    "minute": datetime.timedelta(days=10),
+}
+
+
+class Bars(NamedTuple):
+    # Milliseconds since the epoch, when the bar starts
+    datetime: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    def tail(self, count: int) -> "Bars":
+        """The last count bars, as views on the same memory."""
+        return Bars(*(column[-count:] if count else column[:0] for column in self))
+
+
+class BarStore:
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def bars(self, symbol: str, frequency: str = "daily") -> Bars:
+        """Maps the stored bars read-only, oldest first."""
+        count = self._count(symbol, frequency)
+        return Bars(*(self._map(symbol, frequency, name, count) for name in COLUMNS))
+
+    def last_time(self, symbol: str, frequency: str = "daily") -> Optional[int]:
+        times = self.bars(symbol, frequency).datetime
+        return int(times[-1]) if len(times) else None
+
+    def append(self, symbol: str, frequency: str, candles: List[Dict[str, Any]]) -> int:
+        """Appends the candles newer than the last bar, and returns how many.
+
+        A candle with the time of the last bar replaces it, as the bar of the
+        current day or minute keeps changing until it closes.
+        """
+        os.makedirs(self._directory(symbol, frequency), exist_ok=True)
+        count = self._count(symbol, frequency)
+        last = self.last_time(symbol, frequency)
+        if last is not None:
+            candles = [candle for candle in candles if candle["datetime"] >= last]
+        if not candles:
+            return 0
+
+        replace = last is not None and candles[0]["datetime"] == last
+        start = count - 1 if replace else count
+        for name, dtype in COLUMNS.items():
+            values = np.array([candle[name] for candle in candles], dtype=dtype)
+            path = self._path(symbol, frequency, name)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(start * dtype.itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+        return len(candles) - replace
+
+    def update(
+        self, broker: "TdAmeritrade", symbols: Iterable[str], frequency: str = "daily"
+    ) -> int:
+        """Fetches the bars since the last update of each symbol."""
+        added = 0
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for symbol in symbols:
+            last = self.last_time(symbol, frequency)
+            if last is None:
+                start = now - INITIAL_HISTORY[frequency]
+            else:
+                start = datetime.datetime.fromtimestamp(
+                    last / 1000, datetime.timezone.utc
+                )
+            candles = broker.get_price_history(symbol, frequency, start, now)
+            added += self.append(symbol, frequency, candles)
+        return added
+
+    def _directory(self, symbol: str, frequency: str) -> str:
+        return os.path.join(self.root, symbol, frequency)
+
+    def _path(self, symbol: str, frequency: str, name: str) -> str:
+        # e.g. close.f8
+        suffix = COLUMNS[name].str[1:]
+        return os.path.join(self._directory(symbol, frequency), f"{name}.{suffix}")
+
+    def _count(self, symbol: str, frequency: str) -> int:
+        # A column written last by an interrupted append may be longer
+        counts = []
+        for name, dtype in COLUMNS.items():
+            try:
+                size = os.path.getsize(self._path(symbol, frequency, name))
+            except FileNotFoundError:
+                return 0
+            counts.append(size // dtype.itemsize)
+        return min(counts)
+
+    def _map(self, symbol: str, frequency: str, name: str, count: int) -> np.ndarray:
+        if not count:
+            return np.empty(0, COLUMNS[name])
+        path = self._path(symbol, frequency, name)
+        return np.memmap(path, dtype=COLUMNS[name], mode="r", shape=(count,))
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """The true range of every bar after the first, along the last axis."""
+    previous = close[..., :-1]
+    high, low = high[..., 1:], low[..., 1:]
+    return np.maximum(
+        high - low, np.maximum(np.abs(high - previous), np.abs(low - previous))
+    )
+
+
+def average_true_range(bars: Bars, period: int = 14) -> np.ndarray:
+    """The ATR at every bar, as the simple moving average of the true range.
+
+    Bars without period true ranges before them are NaN.
+    """
+    ranges = true_range(bars.high, bars.low, bars.close)
+    atr = np.full(len(bars), np.nan)
+    if len(ranges) >= period:
+        atr[period:] = sliding_window_view(ranges, period).mean(axis=1)
+    return atr
+
+
+def rolling_high(values: np.ndarray, window: int) -> np.ndarray:
+    """The highest of the last window values at every point, NaN before."""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1 :] = sliding_window_view(values, window).max(axis=1)
+    return result
+
+
+def rolling_low(values: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1 :] = sliding_window_view(values, window).min(axis=1)
+    return result
+
+
+def watchlist_atr(
+    store: BarStore, symbols: Iterable[str], period: int = 14, frequency: str = "daily"
+) -> Dict[str, float]:
+    """The latest ATR of every symbol, NaN without enough history.
+
+    The last period + 1 bars of every symbol are stacked into one matrix, so
+    the whole watchlist is computed in one pass.
+    """
+    tails = _tails(store, symbols, period + 1, frequency)
+    atr = dict.fromkeys(tails, float("nan"))
+    ready = [symbol for symbol, bars in tails.items() if len(bars) == period + 1]
+    if ready:
+        high, low, close = (
+            np.stack([getattr(tails[symbol], column) for symbol in ready])
+            for column in ("high", "low", "close")
+        )
+        atr.update(zip(ready, true_range(high, low, close).mean(axis=1).tolist()))
+    return atr
+
+
+def watchlist_high_low(
+    store: BarStore, symbols: Iterable[str], window: int, frequency: str = "daily"
+) -> Dict[str, Tuple[float, float]]:
+    """The highest high and lowest low of the last window bars of every symbol."""
+    tails = _tails(store, symbols, window, frequency)
+    extremes = dict.fromkeys(tails, (float("nan"), float("nan")))
+    ready = [symbol for symbol, bars in tails.items() if len(bars) == window]
+    if ready:
+        high = np.stack([tails[symbol].high for symbol in ready]).max(axis=1)
+        low = np.stack([tails[symbol].low for symbol in ready]).min(axis=1)
+        extremes.update(zip(ready, zip(high.tolist(), low.tolist())))
+    return extremes
+
+
+def _tails(
+    store: BarStore, symbols: Iterable[str], count: int, frequency: str
+) -> Dict[str, Bars]:
+    return {symbol: store.bars(symbol, frequency).tail(count) for symbol in symbols}
@@ -0,0 +1,245 @@
+"""Trade alerts dropped in a directory, placed as orders as they arrive.
+
+An alert is a file, either a mail saved as ``.eml`` or plain ``.txt``. Files
+whose name starts with a dot or ends with ``.tmp`` are still being written and
+are skipped, so writers should write under such a name and rename it when
+done. A parser turns the text of an alert into order specs, which are placed
+like a batch. Handled alerts are moved to ``done/``, or to ``failed/`` when
+they can't be parsed or their orders fail the pre-trade checks. The keys of
+placed alerts and orders are kept in ``.ingested``, so an alert dropped
+twice, e.g. by a repeated mailbox export, is only placed once. Of an alert
+dropped again after some of its orders failed, only those are placed.
+"""
+from decimal import Decimal
+from email import policy
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+import hashlib
+import importlib
+import os
+import re
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, TYPE_CHECKING
+
+from .batch import BatchException, OrderResult, OrderSpec, parse_specs, place_orders
+from .validation import check_orders, ValidationException
+
+if TYPE_CHECKING:
+    from .brokers.tdameritrade import TdAmeritrade
+
+SUFFIXES = (".eml", ".txt")
+SEEN_FILE = ".ingested"
+
+Parser = Callable[[str], List[OrderSpec]]
+
+# Tickers are written in capitals, so words like "more" or "shares" aren't
+# taken for one
+_SYMBOL = r"(?P<symbol>(?-i:[A-Z]{1,5}(?:\.[A-Z])?))"
+# Capitalized words that aren't tickers, e.g. in "BUY 100 MORE"
+STOPWORDS = frozenset(
+    "A ALL AN AND ANY AT FOR HALF I IN IS IT LIMIT MARKET MORE MY NOW OF ON "
+    "OR OUR SHARE SHARES SOME STOP THE TO".split()
+)
+_PRICE = r"\$?(?P<price>\d+(?:\.\d+)?)"
+# e.g. "Buy 100 DXCM at $390.50", "Buy 100 DXCM"
+_BUY = re.compile(
+    rf"^buy\s+(?P<quantity>\d+)\s+(?:shares\s+(?:of\s+)?)?{_SYMBOL}"
+    rf"(?:\s+(?:at|@|limit)\s+{_PRICE})?\b",
+    re.IGNORECASE,
+)
+# e.g. "Sell 50 DXCM"
+_SELL = re.compile(
+    rf"^sell\s+(?P<quantity>\d+)\s+(?:shares\s+(?:of\s+)?)?{_SYMBOL}\b", re.IGNORECASE
+)
+# e.g. "Stop DXCM at 380", "Stop 50% DXCM at 380"
+_STOP = re.compile(
+    rf"^stop\s+(?:(?P<percentage>\d+(?:\.\d+)?)%\s+)?{_SYMBOL}\s+(?:at|@)\s+{_PRICE}",
+    re.IGNORECASE,
+)
+
+
+class Alert(NamedTuple):
+    path: str
+    # Message-ID of a mail, or the hash of the file
+    key: str
+    text: str
+    # When the alert was sent, or else dropped, in seconds since the epoch
+    received: float
+
+
+class IngestResult(NamedTuple):
+    alert: Alert
+    results: List[OrderResult] = []
+    # Seconds from the alert to the last order placed
+    latency: Optional[float] = None
+    error: Optional[str] = None
+    duplicate: bool = False
+
+    @property
+    def failed(self) -> int:
+        return sum(not result.ok for result in self.results)
+
+
+def parse_alert(text: str) -> List[OrderSpec]:
+    """Finds the orders in the lines of an alert, ignoring any other text.
+
+    Lines are read as mish batch commands, e.g. ``buy_limit DXCM 10 390``, or
+    as ``Buy 100 DXCM at 390``, ``Sell 50 DXCM`` and ``Stop 50% DXCM at 380``.
+    Tickers must be in capitals. A buy without a price is a market order. A
+    stop without a percentage is for the whole position. Orders repeated in
+    the same alert are dropped.
+    """
+    specs: Dict[tuple, OrderSpec] = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip().lstrip(">").strip()
+        spec = _parse_line(number, line)
+        if spec is not None:
+            specs.setdefault(spec[1:], spec)
+    return list(specs.values())
+
+
+def _parse_line(number: int, line: str) -> Optional[OrderSpec]:
+    try:
+        (spec,) = parse_specs([line])
+        return spec._replace(line=number)
+    except (BatchException, ValueError):
+        pass
+
+    match = _BUY.match(line)
+    if match and match["symbol"] not in STOPWORDS:
+        symbol, quantity = match["symbol"], int(match["quantity"])
+        if match["price"]:
+            price = Decimal(match["price"])
+            return OrderSpec(number, "buy_limit", symbol, quantity, price=price)
+        return OrderSpec(number, "buy_market", symbol, quantity)
+    match = _SELL.match(line)
+    if match and match["symbol"] not in STOPWORDS:
+        return OrderSpec(number, "sell_market", match["symbol"], int(match["quantity"]))
+    match = _STOP.match(line)
+    if match and match["symbol"] not in STOPWORDS:
+        return OrderSpec(
+            number,
+            "sell_stop",
+            match["symbol"],
+            percentage=float(match["percentage"] or 100),
+            price=Decimal(match["price"]),
+        )
+    return None
+
+
+def load_parser(name: str) -> Parser:
+    """Imports a parser given as ``module:function``."""
+    module, _, function = name.partition(":")
+    if not function:
+        raise ValueError(f"Parser {name} is not given as module:function")
+    return getattr(importlib.import_module(module), function)
+
+
+def read_alert(path: str) -> Alert:
+    with open(path, "rb") as f:
+        data = f.read()
+    received = os.path.getmtime(path)
+    if not path.endswith(".eml"):
+        key = hashlib.sha256(data).hexdigest()
+        return Alert(path, key, data.decode(errors="replace"), received)
+
+    message = BytesParser(policy=policy.default).parsebytes(data)
+    key = str(message.get("Message-ID") or hashlib.sha256(data).hexdigest())
+    try:
+        received = parsedate_to_datetime(str(message["Date"])).timestamp()
+    except (TypeError, ValueError):
+        pass
+    body = message.get_body(preferencelist=("plain",))
+    text = body.get_content() if body is not None else ""
+    return Alert(path, key, f"{message.get('Subject', '')}\n{text}", received)
+
+
+class Ingester:
+    def __init__(
+        self,
+        broker: "TdAmeritrade",
+        directory: str,
+        parser: Parser = parse_alert,
+        workers: int = 8,
+        check: bool = True,
+    ) -> None:
+        self.broker = broker
+        self.directory = directory
+        self.parser = parser
+        self.workers = workers
+        self.check = check
+        self.seen: Set[str] = set()
+        try:
+            with open(self._path(SEEN_FILE)) as f:
+                self.seen.update(line.strip() for line in f)
+        except FileNotFoundError:
+            pass
+
+    def scan(self) -> List[str]:
+        """Returns the paths of the alerts waiting, oldest first."""
+        paths = [
+            entry.path
+            for entry in os.scandir(self.directory)
+            if entry.is_file()
+            and entry.name.endswith(SUFFIXES)
+            and not entry.name.startswith(".")
+        ]
+        return sorted(paths, key=os.path.getmtime)
+
+    def ingest(self, path: str) -> IngestResult:
+        """Places the orders of one alert, and moves it out of the way."""
+        alert = read_alert(path)
+        if alert.key in self.seen:
+            self._move(alert, "done")
+            return IngestResult(alert, duplicate=True)
+
+        try:
+            specs = self.parser(alert.text)
+        except Exception as error:
+            self._move(alert, "failed")
+            return IngestResult(alert, error=f"{type(error).__name__}: {error}")
+        if not specs:
+            self._move(alert, "failed")
+            return IngestResult(alert, error="No orders found")
+
+        # Skip the orders placed when the alert was dropped before
+        specs = [spec for spec in specs if _order_key(alert, spec) not in self.seen]
+        if self.check:
+            try:
+                check_orders(self.broker, specs)
+            except ValidationException as error:
+                self._move(alert, "failed")
+                message = f"Failed the pre-trade checks:\n{error}"
+                return IngestResult(alert, error=message)
+
+        # Raises before any order is placed, the alert is left to try again
+        results = place_orders(self.broker, specs, self.workers)
+        keys = [_order_key(alert, result.spec) for result in results if result.ok]
+        if len(keys) == len(results):
+            keys.append(alert.key)
+        self._mark(keys)
+        latency = time.time() - alert.received
+        if self.broker.metrics is not None:
+            failed = any(not result.ok for result in results)
+            self.broker.metrics.observe("alert", latency, failed)
+        self._move(alert, "done")
+        return IngestResult(alert, results, latency)
+
+    def _mark(self, keys: List[str]) -> None:
+        self.seen.update(keys)
+        with open(self._path(SEEN_FILE), "a") as f:
+            f.writelines(key + "\n" for key in keys)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _move(self, alert: Alert, folder: str) -> None:
+        os.makedirs(self._path(folder), exist_ok=True)
+        name = os.path.basename(alert.path)
+        os.replace(alert.path, self._path(folder, name))
+
+    def _path(self, *names: str) -> str:
+        return os.path.join(self.directory, *names)
+
+
+def _order_key(alert: Alert, spec: OrderSpec) -> str:
+    return f"{alert.key} {spec}"
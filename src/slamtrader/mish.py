@@ -1,51 +1,355 @@
 from decimal import Decimal
+import functools
 import importlib
+import math
+import os
+import sys
+import time
+from types import ModuleType
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
 
 import click
 
-from . import __version__
-from .brokers.tdameritrade import BrokerException, TdAmeritrade
+from . import client
+from .brokers.models import BrokerException, OrderStatus
+
+# The broker, tda and the config module are only imported once a command needs
+# them, so --help and --version don't pay for them.
+
+
+class Config:
+    """The config module, imported on first use."""
+
+    def __init__(self) -> None:
+        self._module: Optional[ModuleType] = None
+
+    def __getattr__(self, name: str):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module("config")
+            except ModuleNotFoundError:
+                self._module = importlib.import_module("config_example")
+        return getattr(self._module, name)
 
 
 def get_broker(config):
-    return TdAmeritrade(
+    # mish serve keeps one authenticated broker around for all commands
+    broker = getattr(config, "broker", None)
+    if broker is None:
+        try:
+            broker = _make_broker(config)
+        except BrokerException as error:
+            raise click.ClickException(str(error))
+
+    # Record the request timings once the command is done
+    ctx = click.get_current_context(silent=True)
+    if broker.metrics is not None and ctx is not None:
+        ctx.call_on_close(functools.partial(broker.metrics.dump, config.metrics_path))
+    return broker
+
+
+def _make_broker(config):
+    from .brokers.orderstore import OrderStore
+    from .brokers.tdameritrade import TdAmeritrade
+
+    order_store = None
+    if getattr(config, "tda_order_store", None):
+        order_store = OrderStore(config.tda_order_store)
+
+    scheduler = None
+    if getattr(config, "tda_requests_per_minute", None):
+        from .brokers.scheduler import FileTokenBucket, RequestScheduler
+
+        bucket = FileTokenBucket(
+            config.tda_rate_limit_path, config.tda_requests_per_minute / 60, 10
+        )
+        scheduler = RequestScheduler(bucket)
+
+    client = None
+    if getattr(config, "tda_simulator", False):
+        from .brokers.simulator import SimulatedClient
+
+        # Paper trading, best combined with mish serve to keep the state
+        client = SimulatedClient(auto_step=True)
+        client.add_account(config.tda_ira)
+
+    metrics = None
+    if getattr(config, "metrics_path", None):
+        from .brokers.metrics import Metrics
+
+        metrics = Metrics()
+
+    broker = TdAmeritrade(
         config.tda_ira,
         config.tda_api_key,
         config.tda_token_path,
         config.tda_redirect_uri,
+        cache_ttl=getattr(config, "tda_cache_ttl", 5.0),
+        quote_ttl=getattr(config, "tda_quote_ttl", 2.0),
+        order_store=order_store,
+        client=client,
+        scheduler=scheduler,
+        metrics=metrics,
+        # Cron jobs and alert handlers can't log in with a browser
+        interactive=sys.stdin.isatty(),
     )
 
+    feed = getattr(config, "tda_activity_feed", None)
+    if feed == "tda":
+        from .brokers.activity import TdaActivityFeed
+
+        broker.feed = TdaActivityFeed(broker.c, config.tda_ira)
+    elif feed:
+        from .brokers.activity import SocketActivityFeed
+
+        broker.feed = SocketActivityFeed(feed)
+    return broker
+
+
+def get_account_set(config):
+    """Returns the accounts in tda_accounts, read together through one login."""
+    from .brokers.tdameritrade import AccountSet, TdAmeritrade
+
+    broker = get_broker(config)
+    brokers = [broker]
+    for account_id in getattr(config, "tda_accounts", None) or []:
+        if account_id != broker.account_id:
+            brokers.append(
+                TdAmeritrade(
+                    account_id,
+                    "",
+                    "",
+                    "",
+                    cache_ttl=broker.cache_ttl,
+                    order_store=broker.order_store,
+                    client=broker.c,
+                    scheduler=broker.scheduler,
+                    metrics=broker.metrics,
+                )
+            )
+    return AccountSet(brokers)
+
 
 def upper(ctx, param, value):
     return value.upper()
 
 
+class ClientFile(click.File):
+    """A click.File relative to the directory of the client, see mish serve."""
+
+    def convert(self, value, param, ctx):
+        cwd = getattr(ctx.obj, "cwd", None) if ctx is not None else None
+        if cwd and isinstance(value, str) and value != "-":
+            value = os.path.join(cwd, value)
+        return super().convert(value, param, ctx)
+
+
+def wait_options(f):
+    f = click.option(
+        "--timeout",
+        type=float,
+        default=30.0,
+        show_default=True,
+        help="Seconds to wait with --wait-until",
+    )(f)
+    return click.option(
+        "--wait-until",
+        type=click.Choice(["WORKING", "FILLED"], case_sensitive=False),
+        help="Wait until the order has this status",
+    )(f)
+
+
+def watch_orders(broker, wait_until: Optional[str]) -> None:
+    # Subscribe before placing, so no status update is missed
+    if wait_until and broker.feed is not None:
+        broker.feed.start()
+
+
+def show_order(broker, order_id: str, wait_until: Optional[str], timeout: float):
+    if not wait_until:
+        click.echo(broker.get_order(order_id))
+        return
+
+    status = OrderStatus(wait_until)
+    order = broker.wait_for_order(order_id, status, timeout)
+    click.echo(order)
+    if order.status != status:
+        if order.active:
+            raise click.ClickException(f"Timed out waiting for {status}")
+        raise click.ClickException(f"{order.order_id} is {order.status}")
+
+
+def echo_results(results) -> int:
+    """Shows the placed orders and returns how many failed."""
+    failed = 0
+    for result in results:
+        if result.ok:
+            click.echo(f"{result.order_id} {result.spec}")
+        else:
+            failed += 1
+            click.echo(f"FAILED {result.spec}: {result.error}", err=True)
+    return failed
+
+
+def check_price(config, broker, symbol: str, kind: str, price: Decimal) -> None:
+    """Refuses a stop at or above market, or a limit far from market."""
+    market = broker.get_quote(symbol)
+    # e.g. an empty quote of a halted stock
+    if market is None or market <= 0:
+        raise click.ClickException(f"No quote for {symbol}")
+
+    if kind == "stop" and price >= market:
+        raise click.ClickException(
+            f"Stop {price} is not below the market price {market} of {symbol}"
+        )
+    distance = abs(price - market) / market * 100
+    max_distance = Decimal(str(getattr(config, "max_limit_distance", 5.0)))
+    if kind == "limit" and distance > max_distance:
+        raise click.ClickException(
+            f"Limit {price} is {distance:.1f}% from the market price {market} of "
+            f"{symbol}, more than {max_distance}%"
+        )
+
+
+def validate_orders(broker, specs) -> None:
+    """Refuses orders that fail the pre-trade checks, listing every failure."""
+    from .validation import check_orders, ValidationException
+
+    try:
+        check_orders(broker, specs)
+    except ValidationException as error:
+        raise click.ClickException(f"Orders failed the pre-trade checks:\n{error}")
+
+
+def atr_stop(config, broker, symbol: str, multiple: Decimal) -> Decimal:
+    from .history import BarStore, watchlist_atr
+
+    store = BarStore(config.history_path)
+    store.update(broker, [symbol])
+    period = getattr(config, "atr_period", 14)
+    atr = watchlist_atr(store, [symbol], period)[symbol]
+    if math.isnan(atr):
+        raise click.ClickException(f"Not enough history for the ATR of {symbol}")
+
+    market = broker.get_quote(symbol)
+    # e.g. an empty quote of a halted stock
+    if market is None or market <= 0:
+        raise click.ClickException(f"No quote for {symbol}")
+    stop = (market - multiple * Decimal(str(atr))).quantize(Decimal("0.01"))
+    click.echo(f"{period} day ATR of {symbol} is {atr:.2f}, stop at {stop}")
+    return stop
+
+
+def print_version(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+    from . import __version__
+
+    click.echo(f"{ctx.info_name}, version {__version__}")
+    ctx.exit()
+
+
 @click.group()
-@click.version_option(version=__version__)
+@click.option(
+    "--version",
+    is_flag=True,
+    callback=print_version,
+    expose_value=False,
+    is_eager=True,
+    help="Show the version and exit.",
+)
 @click.pass_context
 def main(ctx: click.Context) -> None:
     """ Semi-automate Mish's trading service """
 
-    try:
-        config = importlib.import_module("config")
-    except ModuleNotFoundError:
-        config = importlib.import_module("config_example")
+    # mish serve passes in its own config with a warm broker
+    if ctx.obj is None:
+        ctx.obj = Config()
+
+
+def format_option(f):
+    return click.option(
+        "--format",
+        "output_format",
+        type=click.Choice(["text", "json", "ndjson", "csv"]),
+        default="text",
+        show_default=True,
+        help="Write machine readable records instead of text",
+    )(f)
+
+
+def echo_records(
+    output_format: str, tagged: Iterable[Tuple[Optional[str], Any]]
+) -> None:
+    """Writes models, tagged with their account id or None, as they come."""
+    if output_format == "text":
+        for account_id, model in tagged:
+            click.echo(model if account_id is None else f"{account_id} {model}")
+        return
 
-    ctx.obj = config
+    from .output import RecordWriter
+
+    with RecordWriter(sys.stdout.buffer, output_format) as writer:
+        for account_id, model in tagged:
+            record = model.to_record()
+            if account_id is not None:
+                record = {"account_id": account_id, **record}
+            writer.write(record)
 
 
 @main.command("list_orders")
 @click.option("-a", "--all", is_flag=True, default=False)
+@click.option(
+    "-o",
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="List the orders in the local order store without syncing it first",
+)
+@click.option(
+    "--all-accounts",
+    is_flag=True,
+    default=False,
+    help="List the orders of every account in tda_accounts",
+)
+@format_option
 @click.pass_obj
-def list_orders(config, all: bool) -> None:
+def list_orders(
+    config, all: bool, offline: bool, all_accounts: bool, output_format: str
+) -> None:
     """ List all active orders """
-    broker = get_broker(config)
+    tagged: Iterable[Tuple[Optional[str], Any]]
+    try:
+        if all_accounts:
+            tagged = get_account_set(config).get_orders(not all, not offline)
+        else:
+            broker = get_broker(config)
+            orders = broker.iter_orders(active_only=not all, sync=not offline)
+            tagged = ((None, order) for order in orders)
+        echo_records(output_format, tagged)
+    except BrokerException as error:
+        raise click.ClickException(str(error))
+
 
+@main.command("list_positions")
+@click.option(
+    "--all-accounts",
+    is_flag=True,
+    default=False,
+    help="List the positions of every account in tda_accounts",
+)
+@format_option
+@click.pass_obj
+def list_positions(config, all_accounts: bool, output_format: str) -> None:
+    """ List all positions """
+    tagged: Iterable[Tuple[Optional[str], Any]]
     try:
-        orders = broker.get_orders()
-        for order in orders:
-            if order.active or all:
-                click.echo(order)
+        if all_accounts:
+            tagged = get_account_set(config).get_positions()
+        else:
+            positions = get_broker(config).iter_positions()
+            tagged = ((None, position) for position in positions)
+        echo_records(output_format, tagged)
     except BrokerException as error:
         raise click.ClickException(str(error))
 
@@ -69,19 +373,116 @@ def cancel_order(config, order_id: str):
         raise click.ClickException(str(error))
 
 
+@main.command("cancel")
+@click.argument("order_ids", nargs=-1, type=int)
+@click.option("-s", "--symbol", help="Cancel the active orders for this symbol")
+@click.option(
+    "-t",
+    "--type",
+    "order_type",
+    type=click.Choice(
+        ["MARKET", "LIMIT", "STOP", "STOP_LIMIT", "TRAILING_STOP"],
+        case_sensitive=False,
+    ),
+    help="Cancel the active orders of this type",
+)
+@click.option("--all-active", is_flag=True, help="Cancel all active orders")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.pass_obj
+def cancel(
+    config,
+    order_ids: Tuple[int, ...],
+    symbol: Optional[str],
+    order_type: Optional[str],
+    all_active: bool,
+    workers: int,
+) -> None:
+    """ Cancel orders by id, or all active orders matching the options """
+    from .batch import cancel_orders, select_orders
+
+    if not (order_ids or symbol or order_type or all_active):
+        raise click.UsageError("Give order ids, --symbol, --type or --all-active")
+
+    broker = get_broker(config)
+
+    try:
+        book = broker.get_order_book()
+    except BrokerException as error:
+        raise click.ClickException(str(error))
+
+    selected, errors = select_orders(
+        book, order_ids, symbol and symbol.upper(), order_type, all_active
+    )
+    for message in errors:
+        click.echo(f"FAILED {message}", err=True)
+
+    failed = len(errors)
+    for result in cancel_orders(broker, selected, workers):
+        if result.ok:
+            click.echo(f"{result.order.order_id} canceled")
+        else:
+            failed += 1
+            click.echo(f"FAILED {result.order.order_id}: {result.error}", err=True)
+    if failed:
+        raise click.ClickException(f"{failed} orders could not be canceled")
+    if not selected:
+        click.echo("No matching orders")
+
+
 @main.command("buy_market")
 @click.argument("symbol", callback=upper)
 @click.argument("quantity", type=int)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@wait_options
 @click.pass_obj
-def buy_market(config, symbol: str, quantity: int) -> None:
+def buy_market(
+    config,
+    symbol: str,
+    quantity: int,
+    force: bool,
+    wait_until: Optional[str],
+    timeout: float,
+) -> None:
     """ Buy a stock at market """
+    from .batch import OrderSpec
 
     broker = get_broker(config)
 
     try:
+        if not force:
+            validate_orders(broker, [OrderSpec(1, "buy_market", symbol, quantity)])
+        watch_orders(broker, wait_until)
         order_id = broker.place_buy_market(symbol, quantity)
-        order = broker.get_order(order_id)
-        click.echo(order)
+        show_order(broker, order_id, wait_until, timeout)
+    except BrokerException as error:
+        raise click.ClickException(str(error))
+
+
+@main.command("sell_market")
+@click.argument("symbol", callback=upper)
+@click.argument("quantity", type=int)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@wait_options
+@click.pass_obj
+def sell_market(
+    config,
+    symbol: str,
+    quantity: int,
+    force: bool,
+    wait_until: Optional[str],
+    timeout: float,
+) -> None:
+    """ Sell a stock at market """
+    from .batch import OrderSpec
+
+    broker = get_broker(config)
+
+    try:
+        if not force:
+            validate_orders(broker, [OrderSpec(1, "sell_market", symbol, quantity)])
+        watch_orders(broker, wait_until)
+        order_id = broker.place_sell_market(symbol, quantity)
+        show_order(broker, order_id, wait_until, timeout)
     except BrokerException as error:
         raise click.ClickException(str(error))
 
@@ -90,16 +491,32 @@ def buy_market(config, symbol: str, quantity: int) -> None:
 @click.argument("symbol", callback=upper)
 @click.argument("quantity", type=int)
 @click.argument("limit", type=float)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@wait_options
 @click.pass_obj
-def buy_limit(config, symbol: str, quantity: int, limit) -> None:
+def buy_limit(
+    config,
+    symbol: str,
+    quantity: int,
+    limit,
+    force: bool,
+    wait_until: Optional[str],
+    timeout: float,
+) -> None:
     """ Buy a stock with a buy stop """
+    from .batch import OrderSpec
 
     broker = get_broker(config)
 
     try:
+        if not force:
+            price = Decimal(str(limit))
+            check_price(config, broker, symbol, "limit", price)
+            spec = OrderSpec(1, "buy_limit", symbol, quantity, price=price)
+            validate_orders(broker, [spec])
+        watch_orders(broker, wait_until)
         order_id = broker.place_buy_limit(symbol, quantity, limit)
-        order = broker.get_order(order_id)
-        click.echo(order)
+        show_order(broker, order_id, wait_until, timeout)
     except BrokerException as error:
         raise click.ClickException(str(error))
 
@@ -107,27 +524,492 @@ def buy_limit(config, symbol: str, quantity: int, limit) -> None:
 @main.command("sell_stop")
 @click.argument("symbol", callback=upper)
 @click.argument("percentage", type=float)
-@click.argument("stop", type=Decimal)
+@click.argument("stop", type=Decimal, required=False)
+@click.option(
+    "--atr",
+    "atr_multiple",
+    type=Decimal,
+    help="Place the stop this many daily ATRs below the market price",
+)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@wait_options
 @click.pass_obj
-def sell_stop(config, symbol: str, percentage: float, stop: Decimal) -> None:
+def sell_stop(
+    config,
+    symbol: str,
+    percentage: float,
+    stop: Optional[Decimal],
+    atr_multiple: Optional[Decimal],
+    force: bool,
+    wait_until: Optional[str],
+    timeout: float,
+) -> None:
     """ Sell a stock with a sell stop """
+    from .batch import OrderSpec, sell_quantity
+
+    if stop is not None and atr_multiple is not None:
+        raise click.UsageError("Give either STOP or --atr, not both")
 
     broker = get_broker(config)
 
     try:
+        if stop is None:
+            if atr_multiple is None:
+                raise click.UsageError("Give STOP or --atr")
+            stop = atr_stop(config, broker, symbol, atr_multiple)
         position = broker.get_position(symbol)
         if not position:
             raise click.ClickException(f"No position in {symbol}")
-        quantity = int(round(position.long * (percentage / 100), 0))
+        quantity = sell_quantity(position, percentage)
+        # Even forced, e.g. a small percentage of a small position
+        if quantity <= 0:
+            raise click.ClickException(
+                f"{percentage}% of {symbol} is 0 shares. Quantity must be positive"
+            )
+        if not force:
+            check_price(config, broker, symbol, "stop", stop)
+            spec = OrderSpec(1, "sell_stop", symbol, percentage=percentage, price=stop)
+            validate_orders(broker, [spec])
         click.echo(
             (
                 f"Selling {quantity} shares ({percentage}%) of "
                 f"{symbol} with a sell stop at {stop}"
             )
         )
+        watch_orders(broker, wait_until)
         order_id = broker.place_sell_stop(symbol, quantity, stop)
+        show_order(broker, order_id, wait_until, timeout)
+    except BrokerException as error:
+        raise click.ClickException(str(error))
 
-        order = broker.get_order(order_id)
-        click.echo(order)
+
+@main.command("batch")
+@click.argument("specs", type=ClientFile("r"), default="-")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@click.pass_obj
+def batch(config, specs, workers: int, force: bool) -> None:
+    """ Place orders read from a file or stdin, one per line
+
+    Each line is a command as it would be given to mish, e.g.
+
+    \b
+        buy_market DXCM 10
+        sell_market DXCM 10
+        buy_limit DXCM 10 400.5
+        sell_stop DXCM 50 380
+
+    Unless forced, no order is placed when any order fails the pre-trade
+    checks, and all failures are listed.
+    """
+    from .batch import BatchException, parse_specs, place_orders
+
+    try:
+        order_specs = parse_specs(specs)
+    except BatchException as error:
+        raise click.ClickException(str(error))
+
+    broker = get_broker(config)
+
+    try:
+        if not force:
+            validate_orders(broker, order_specs)
+        results = place_orders(broker, order_specs, workers)
+    except BrokerException as error:
+        raise click.ClickException(str(error))
+
+    failed = echo_results(results)
+    if failed:
+        raise click.ClickException(f"{failed} of {len(results)} orders failed")
+
+
+@main.command("ingest")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--parser",
+    "parser_name",
+    help="Parse alerts with this module:function instead of the built-in parser",
+)
+@click.option(
+    "--interval",
+    type=float,
+    default=0.2,
+    show_default=True,
+    help="Seconds between scans of DIRECTORY",
+)
+@click.option("--once", is_flag=True, default=False, help="Exit after one scan")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.option("--force", is_flag=True, help="Skip the pre-trade checks")
+@click.pass_obj
+def ingest(
+    config,
+    directory: str,
+    parser_name: Optional[str],
+    interval: float,
+    once: bool,
+    workers: int,
+    force: bool,
+) -> None:
+    """ Place the orders of the trade alerts dropped in DIRECTORY
+
+    Alerts are mails saved as .eml, or .txt files. The built-in parser reads
+    lines like "Buy 100 DXCM at 390", "Sell 50 DXCM", "Stop 50% DXCM at 380",
+    or batch commands. Each alert is placed once, then moved to done/, or to
+    failed/ when no orders were found in it or they failed the pre-trade
+    checks.
+    """
+    from .ingest import Ingester
+
+    parser = alert_parser(parser_name or getattr(config, "alert_parser", None))
+    broker = get_broker(config)
+    if not once and broker.tokens is not None:
+        broker.tokens.start()
+    ingester = Ingester(broker, directory, parser, workers, check=not force)
+    if not once:
+        click.echo(f"Watching {directory}")
+
+    while True:
+        for path in ingester.scan():
+            ingest_alert(ingester, path)
+        if broker.metrics is not None:
+            broker.metrics.dump(config.metrics_path)
+        if once:
+            break
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+
+def alert_parser(name: Optional[str]):
+    from .ingest import load_parser, parse_alert
+
+    if not name:
+        return parse_alert
+    try:
+        return load_parser(name)
+    except (ImportError, AttributeError, ValueError) as error:
+        raise click.ClickException(f"Can't load parser {name}: {error}")
+
+
+def ingest_alert(ingester, path: str) -> None:
+    name = os.path.basename(path)
+    try:
+        result = ingester.ingest(path)
     except BrokerException as error:
+        click.echo(f"FAILED {name}: {error}", err=True)
+        return
+
+    if result.duplicate:
+        click.echo(f"{name}: already placed")
+    elif result.error:
+        click.echo(f"FAILED {name}: {result.error}", err=True)
+    else:
+        echo_results(result.results)
+        click.echo(f"{name}: placed {result.latency:.3f}s after the alert")
+
+
+@main.command("rebalance")
+@click.argument("targets", type=ClientFile("r"), default="-")
+@click.option("--lot", type=int, default=1, show_default=True, help="Shares per lot")
+@click.option("-n", "--dry-run", is_flag=True, help="Only show the orders")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.pass_obj
+def rebalance(config, targets, lot: int, dry_run: bool, workers: int) -> None:
+    """ Buy and sell at market to reach target weights
+
+    Each line of TARGETS is a symbol and its percentage of the liquidation
+    value, e.g. ``DXCM 12.5``. Symbols that are not listed are left alone.
+    """
+    from .batch import place_orders
+    from .rebalance import parse_targets, plan_rebalance, RebalanceException
+
+    try:
+        weights = parse_targets(targets)
+    except RebalanceException as error:
+        raise click.ClickException(str(error))
+
+    broker = get_broker(config)
+
+    try:
+        positions = broker.get_positions()
+        balances = broker.get_balances()
+        quotes = broker.get_quotes(list(weights))
+        plan = plan_rebalance(
+            weights,
+            positions,
+            quotes,
+            balances.liquidation_value,
+            balances.available_funds,
+            lot,
+        )
+    except (BrokerException, RebalanceException) as error:
         raise click.ClickException(str(error))
+
+    echo_plan(plan)
+    if dry_run or not plan.specs:
+        return
+
+    # Sell first, so the buys can use the proceeds
+    failed = 0
+    for specs in (plan.sells, plan.buys):
+        try:
+            results = place_orders(broker, specs, workers)
+        except BrokerException as error:
+            raise click.ClickException(str(error))
+        failed += echo_results(results)
+    if failed:
+        raise click.ClickException(f"{failed} of {len(plan.specs)} orders failed")
+
+
+def echo_plan(plan) -> None:
+    click.echo(f"{'SYMBOL':<8} {'PRICE':>10} {'CURRENT':>8} {'TARGET':>8} {'DELTA':>8}")
+    for i, symbol in enumerate(plan.symbols):
+        click.echo(
+            f"{symbol:<8} {plan.price[i]:>10.2f} {plan.current[i]:>8.0f} "
+            f"{plan.target[i]:>8.0f} {plan.delta[i]:>+8.0f}"
+        )
+
+
+@main.command("trail")
+@click.option(
+    "--percent",
+    type=Decimal,
+    default=Decimal(8),
+    show_default=True,
+    help="Trail the stops this percentage below the market price",
+)
+@click.option(
+    "--atr",
+    "atr_multiple",
+    type=Decimal,
+    help="Trail the stops this many daily ATRs below the market price instead",
+)
+@click.option(
+    "--threshold",
+    type=Decimal,
+    default=Decimal("0.5"),
+    show_default=True,
+    help="Only move stops that rise by more than this percentage",
+)
+@click.option("--interval", type=float, default=0, help="Repeat every INTERVAL seconds")
+@click.option(
+    "--cancel-closed",
+    is_flag=True,
+    help="Cancel the sell stops of symbols without a position, also stops not "
+    "placed by trail",
+)
+@click.option(
+    "--merge",
+    is_flag=True,
+    help="Replace the stops of a position with one stop for the whole position",
+)
+@click.option("-n", "--dry-run", is_flag=True, help="Only show the changes")
+@click.option("-w", "--workers", type=int, default=8, show_default=True)
+@click.pass_obj
+def trail(
+    config,
+    percent: Decimal,
+    atr_multiple: Optional[Decimal],
+    threshold: Decimal,
+    interval: float,
+    cancel_closed: bool,
+    merge: bool,
+    dry_run: bool,
+    workers: int,
+) -> None:
+    """ Raise the sell stops of all positions as the prices rise """
+    broker = get_broker(config)
+    if interval and broker.tokens is not None:
+        broker.tokens.start()
+    # Symbols whose daily bars are up to date for --atr
+    updated: Set[str] = set()
+
+    while True:
+        try:
+            failed = trail_stops(
+                broker,
+                trail_distances(config, broker, percent, atr_multiple, updated),
+                threshold,
+                cancel_closed,
+                merge,
+                dry_run,
+                workers,
+            )
+        except BrokerException as error:
+            raise click.ClickException(str(error))
+        if not interval:
+            break
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+    if failed:
+        raise click.ClickException(f"{failed} stops could not be changed")
+
+
+def trail_distances(
+    config, broker, percent: Decimal, atr_multiple: Optional[Decimal], updated
+) -> Dict[str, Decimal]:
+    positions = broker.get_positions()
+    quotes = broker.get_quotes(list(positions))
+    if atr_multiple is None:
+        return {symbol: price * percent / 100 for symbol, price in quotes.items()}
+
+    from .history import BarStore, watchlist_atr
+
+    # The daily bars don't change enough during a run to fetch them every cycle
+    store = BarStore(config.history_path)
+    store.update(broker, [symbol for symbol in positions if symbol not in updated])
+    updated.update(positions)
+    atr = watchlist_atr(store, positions, getattr(config, "atr_period", 14))
+    return {
+        symbol: atr_multiple * Decimal(str(value))
+        for symbol, value in atr.items()
+        if not math.isnan(value)
+    }
+
+
+def trail_stops(
+    broker,
+    distances: Dict[str, Decimal],
+    threshold: Decimal,
+    cancel_closed: bool,
+    merge: bool,
+    dry_run: bool,
+    workers: int,
+) -> int:
+    from .trail import plan_trail, run_actions, target_stops
+
+    positions = broker.get_positions()
+    book = broker.get_order_book()
+    quotes = broker.get_quotes(list(positions))
+    targets = target_stops(quotes, distances)
+    actions = plan_trail(
+        positions, book, targets, threshold / 100, cancel_closed, merge
+    )
+    if dry_run:
+        for action in actions:
+            click.echo(action)
+        return 0
+
+    failed = 0
+    for result in run_actions(broker, actions, workers):
+        if result.ok:
+            click.echo(f"{result.order_id} {result.action}")
+        else:
+            failed += 1
+            click.echo(f"FAILED {result.action}: {result.error}", err=True)
+    return failed
+
+
+@main.command("risk")
+@click.option(
+    "--all-accounts",
+    is_flag=True,
+    default=False,
+    help="Show the positions of every account in tda_accounts, and their heat",
+)
+@click.pass_obj
+def risk(config, all_accounts: bool) -> None:
+    """ Show the dollar risk of every position down to its stops """
+    import numpy as np
+
+    from .brokers.orderbook import OrderBook
+    from .risk import concat_reports, portfolio_risk, RiskReport
+
+    reports: Dict[Optional[str], RiskReport]
+    try:
+        if all_accounts:
+            account_set = get_account_set(config)
+            accounts = account_set.get_accounts()
+            orders = account_set.get_orders(active_only=True)
+            reports = {
+                account_id: portfolio_risk(
+                    account.positions.values(),
+                    OrderBook(o.order for o in orders if o.account_id == account_id),
+                    account.balances.liquidation_value,
+                )
+                for account_id, account in accounts.items()
+            }
+        else:
+            broker = get_broker(config)
+            positions = broker.get_positions().values()
+            book = broker.get_order_book()
+            balances = broker.get_balances()
+            reports = {
+                None: portfolio_risk(positions, book, balances.liquidation_value)
+            }
+    except BrokerException as error:
+        raise click.ClickException(str(error))
+
+    report = concat_reports(list(reports.values()))
+    account_ids = [
+        account_id
+        for account_id, account_report in reports.items()
+        for _ in account_report.symbols
+    ]
+    header = (
+        f"{'SYMBOL':<8} {'QTY':>8} {'PRICE':>10} {'VALUE':>12} {'P&L':>12} "
+        f"{'STOP':>10} {'DIST':>7} {'RISK':>12}"
+    )
+    click.echo(f"{'ACCOUNT':<10} {header}" if all_accounts else header)
+    for i in np.argsort(-report.risk, kind="stable"):
+        stop = "" if np.isnan(report.stop[i]) else f"{report.stop[i]:.2f}"
+        distance = "" if np.isnan(report.distance[i]) else f"{report.distance[i]:.1%}"
+        line = (
+            f"{report.symbols[i]:<8} {report.quantity[i]:>8.0f} "
+            f"{report.price[i]:>10.2f} {report.market_value[i]:>12,.2f} "
+            f"{report.pnl[i]:>12,.2f} {stop:>10} {distance:>7} "
+            f"{report.risk[i]:>12,.2f}"
+        )
+        click.echo(f"{account_ids[i]:<10} {line}" if all_accounts else line)
+    click.echo(
+        f"Value {report.market_value.sum():,.2f}, P&L {report.pnl.sum():,.2f}, "
+        f"risk {report.risk.sum():,.2f}, heat {report.heat:.1%} of "
+        f"{report.liquidation_value:,.2f}"
+    )
+
+
+@main.command("stats")
+@click.pass_obj
+def stats(config) -> None:
+    """ Show the latency and errors of TD Ameritrade requests """
+    from .brokers.metrics import Metrics
+
+    metrics = Metrics.load(config.metrics_path)
+    click.echo(
+        f"{'ENDPOINT':<24} {'COUNT':>7} {'ERRORS':>6} "
+        f"{'P50 MS':>8} {'P95 MS':>8} {'P99 MS':>8}"
+    )
+    for endpoint, histogram in sorted(metrics.endpoints.items()):
+        quantiles = [histogram.quantile(q) for q in (0.5, 0.95, 0.99)]
+        # No latencies without a request that got a response
+        columns = ["-" if q is None else f"{q * 1000:.1f}" for q in quantiles]
+        click.echo(
+            f"{endpoint:<24} {histogram.count:>7} {histogram.errors:>6} "
+            + " ".join(f"{column:>8}" for column in columns)
+        )
+
+
+@main.command("serve")
+@click.option("--socket", "path", default=client.socket_path, show_default=True)
+@click.pass_obj
+def serve(config, path: str) -> None:
+    """ Keep an authenticated broker running for other mish commands
+
+    Other mish commands are sent to this process over a Unix socket at PATH,
+    which can also be set with MISH_SOCKET.
+    """
+    from .server import MishServer
+
+    config.broker = get_broker(config)
+    # The commands sent to the server never wait for a token refresh
+    if config.broker.tokens is not None:
+        config.broker.tokens.start()
+    with MishServer(path, config) as server:
+        click.echo(f"Serving on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
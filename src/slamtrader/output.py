@@ -0,0 +1,90 @@
+"""Records written as JSON, NDJSON or CSV, one at a time.
+
+Each record is encoded and written to the binary stream as soon as it is
+given, so listing tens of thousands of orders never holds them all in memory.
+orjson is used to encode JSON when it is installed.
+"""
+import csv
+import io
+import json
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+FORMATS = ("json", "ndjson", "csv")
+
+Record = Dict[str, Any]
+
+
+def _dumps(record: Record) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode()
+
+
+dumps: Callable[[Record], bytes] = orjson.dumps if orjson is not None else _dumps
+
+
+class RecordWriter:
+    """Writes records to a binary stream in one of the FORMATS.
+
+    Nested children, e.g. of OCO orders, stay nested in JSON. In CSV, they
+    follow their parent as rows of their own, with the parent's id in
+    parent_id.
+    """
+
+    def __init__(self, stream: BinaryIO, format: str) -> None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format}")
+        self.stream = stream
+        self.format = format
+        self.count = 0
+        self._text: Optional[io.TextIOWrapper] = None
+        self._csv: Optional[csv.DictWriter] = None
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, record: Record) -> None:
+        if self.format == "json":
+            self.stream.write(b"[\n" if not self.count else b",\n")
+            self.stream.write(dumps(record))
+        elif self.format == "ndjson":
+            self.stream.write(dumps(record) + b"\n")
+        else:
+            self._write_rows(record)
+        self.count += 1
+
+    def close(self) -> None:
+        if self.format == "json":
+            self.stream.write(b"\n]\n" if self.count else b"[]\n")
+        if self._text is not None:
+            self._text.flush()
+            # Leave the stream open for the caller
+            self._text.detach()
+            self._text = None
+        self.stream.flush()
+
+    def _write_rows(self, record: Record, parent: Optional[Record] = None) -> None:
+        row = {key: value for key, value in record.items() if key != "children"}
+        if "children" in record:
+            row["parent_id"] = parent["order_id"] if parent else None
+        if parent is not None:
+            # e.g. the account id the parent was tagged with
+            row.update(
+                (key, value)
+                for key, value in parent.items()
+                if key not in row and key != "children"
+            )
+
+        if self._csv is None:
+            self._text = io.TextIOWrapper(self.stream, encoding="utf-8", newline="")
+            self._csv = csv.DictWriter(self._text, list(row), extrasaction="ignore")
+            self._csv.writeheader()
+        self._csv.writerow(row)
+        for child in record.get("children", []):
+            self._write_rows(child, record)
@@ -0,0 +1,109 @@
+"""Orders that bring the portfolio to target weights.
+
+Targets are read one per line, e.g. ``DXCM 12.5`` for 12.5% of the
+liquidation value. Only the listed symbols are traded; list a symbol with 0
+to sell all of it. Whatever the weights leave over stays in cash.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Mapping, NamedTuple
+
+import numpy as np
+
+from .batch import OrderSpec
+from .brokers.models import Position
+
+
+class RebalanceException(Exception):
+    pass
+
+
+class RebalancePlan(NamedTuple):
+    symbols: List[str]
+    price: np.ndarray
+    current: np.ndarray
+    target: np.ndarray
+    delta: np.ndarray
+    specs: List[OrderSpec]
+
+    @property
+    def sells(self) -> List[OrderSpec]:
+        return [spec for spec in self.specs if spec.command == "sell_market"]
+
+    @property
+    def buys(self) -> List[OrderSpec]:
+        return [spec for spec in self.specs if spec.command == "buy_market"]
+
+
+def parse_targets(lines: Iterable[str]) -> Dict[str, Decimal]:
+    """Parses one ``SYMBOL PERCENTAGE`` per line into weights.
+
+    Blank lines and anything after a ``#`` are ignored.
+    """
+    targets: Dict[str, Decimal] = {}
+    for number, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) != 2:
+            raise RebalanceException(f"line {number}: expects SYMBOL PERCENTAGE")
+
+        symbol = fields[0].upper()
+        try:
+            percentage = Decimal(fields[1])
+        except InvalidOperation:
+            raise RebalanceException(f"line {number}: invalid percentage {fields[1]}")
+        if percentage < 0:
+            raise RebalanceException(f"line {number}: negative percentage")
+        if symbol in targets:
+            raise RebalanceException(f"line {number}: duplicate symbol {symbol}")
+        targets[symbol] = percentage / 100
+
+    if sum(targets.values()) > 1:
+        raise RebalanceException("Target weights add up to more than 100%")
+    return targets
+
+
+def plan_rebalance(
+    targets: Mapping[str, Decimal],
+    positions: Mapping[str, Position],
+    quotes: Mapping[str, Decimal],
+    liquidation_value: Decimal,
+    available_funds: Decimal,
+    lot: int = 1,
+) -> RebalancePlan:
+    """Computes the share delta of every target symbol in one vectorized step.
+
+    Targets are rounded down to whole lots. When the buys cost more than the
+    available funds plus what the sells bring in, every buy is scaled down by
+    the same factor, again to whole lots.
+    """
+    symbols = list(targets)
+    missing = [symbol for symbol in symbols if symbol not in quotes]
+    if missing:
+        raise RebalanceException(f"No quote for {', '.join(missing)}")
+
+    count = len(symbols)
+    weight = np.fromiter((float(targets[s]) for s in symbols), float, count)
+    price = np.fromiter((float(quotes[s]) for s in symbols), float, count)
+    current = np.fromiter(
+        (positions[s].long if s in positions else 0 for s in symbols), float, count
+    )
+
+    target = np.floor(weight * float(liquidation_value) / price / lot) * lot
+    delta = target - current
+
+    buying = delta > 0
+    cost = float(np.sum(delta[buying] * price[buying]))
+    proceeds = float(np.sum(-delta[~buying] * price[~buying]))
+    cash = float(available_funds) + proceeds
+    if cost > cash:
+        scale = max(cash, 0.0) / cost
+        delta[buying] = np.floor(delta[buying] * scale / lot) * lot
+        target = current + delta
+
+    specs: List[OrderSpec] = []
+    for i in np.flatnonzero(delta):
+        command = "buy_market" if delta[i] > 0 else "sell_market"
+        quantity = int(abs(delta[i]))
+        specs.append(OrderSpec(len(specs) + 1, command, symbols[i], quantity=quantity))
+    return RebalancePlan(symbols, price, current, target, delta, specs)
@@ -0,0 +1,112 @@
+"""Risk of the long positions, computed on NumPy arrays in one pass.
+
+The risk of a position is what it loses when the price drops to the stop and
+every sell stop fills. Shares not covered by a stop are at risk in full.
+Heat is the total risk as a share of the liquidation value.
+"""
+from decimal import Decimal
+from typing import Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from .brokers.models import Position
+from .brokers.orderbook import OrderBook
+
+STOP_TYPES = ("STOP", "STOP_LIMIT")
+
+
+class RiskReport(NamedTuple):
+    symbols: List[str]
+    quantity: np.ndarray
+    price: np.ndarray
+    market_value: np.ndarray
+    pnl: np.ndarray
+    # Quantity weighted price of the sell stops, NaN without one
+    stop: np.ndarray
+    stop_quantity: np.ndarray
+    # Drop from the price to the stop, as a fraction of the price
+    distance: np.ndarray
+    risk: np.ndarray
+    liquidation_value: float
+
+    @property
+    def heat(self) -> float:
+        if not self.liquidation_value:
+            return float("nan")
+        return float(self.risk.sum()) / self.liquidation_value
+
+
+def sell_stops(book: OrderBook) -> Iterator[Tuple[str, float, Decimal]]:
+    """Yields symbol, quantity and stop price of the active sell stops.
+
+    The stops in composite orders, e.g. the stop loss of an OCO, are included.
+    """
+    for order_type in STOP_TYPES:
+        for order in book.active(order_type=order_type, instruction="SELL"):
+            if order.price is not None:
+                yield order.symbol, order.legs[0].quantity, order.price
+
+
+def portfolio_risk(
+    positions: Iterable[Position],
+    book: OrderBook,
+    liquidation_value: Decimal,
+) -> RiskReport:
+    longs = [position for position in positions if position.long > 0]
+    count = len(longs)
+    index = {position.symbol: i for i, position in enumerate(longs)}
+
+    quantity = np.fromiter((p.long for p in longs), float, count)
+    market_value = np.fromiter((float(p.market_value) for p in longs), float, count)
+    cost = np.fromiter((float(p.trade_price) for p in longs), float, count)
+    price = market_value / quantity
+    pnl = market_value - cost * quantity
+
+    stops = [stop for stop in sell_stops(book) if stop[0] in index]
+    positions_index = np.fromiter((index[s[0]] for s in stops), int, len(stops))
+    stop_quantities = np.fromiter((s[1] for s in stops), float, len(stops))
+    stop_prices = np.fromiter((float(s[2]) for s in stops), float, len(stops))
+    stop_quantity = np.bincount(positions_index, stop_quantities, minlength=count)
+    stop_value = np.bincount(
+        positions_index, stop_quantities * stop_prices, minlength=count
+    )
+
+    stopped = stop_quantity > 0
+    stop = np.where(stopped, stop_value / np.maximum(stop_quantity, 1), np.nan)
+    distance = np.where(stopped, (price - stop) / price, np.nan)
+    protected = np.minimum(stop_quantity, quantity)
+    # A stop above the price would sell at market, losing nothing
+    loss_per_share = np.where(stopped, np.maximum(price - stop, 0.0), 0.0)
+    risk = protected * loss_per_share + (quantity - protected) * price
+
+    return RiskReport(
+        [position.symbol for position in longs],
+        quantity,
+        price,
+        market_value,
+        pnl,
+        stop,
+        stop_quantity,
+        distance,
+        risk,
+        float(liquidation_value),
+    )
+
+
+def concat_reports(reports: Sequence[RiskReport]) -> RiskReport:
+    """Joins the reports of several accounts, e.g. for the heat of all of them.
+
+    Stops only protect the positions of their own account, so every account
+    is reported on its own first.
+    """
+    arrays = [
+        np.concatenate([np.empty(0)] + [report[i] for report in reports])
+        for i in range(1, len(RiskReport._fields) - 1)
+    ]
+    return RiskReport._make(
+        [
+            [symbol for report in reports for symbol in report.symbols],
+            *arrays,
+            sum(report.liquidation_value for report in reports),
+        ]
+    )
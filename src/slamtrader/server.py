@@ -0,0 +1,81 @@
+import json
+import os
+import socketserver
+import traceback
+from typing import Any
+
+import click.testing
+
+
+class MishServer(socketserver.UnixStreamServer):
+    """Runs mish commands sent by the thin client over a Unix socket.
+
+    The config holds an authenticated broker that every command reuses, so
+    the token file is read once and the account and order caches stay warm.
+    Commands run one at a time.
+    """
+
+    def __init__(self, path: str, config: Any) -> None:
+        self.config = config
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        # Anyone who can connect can place orders, so the socket is created
+        # without access for others, instead of restricted after the bind
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, MishRequestHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class MishRequestHandler(socketserver.StreamRequestHandler):
+    server: MishServer
+
+    def handle(self) -> None:
+        request = json.loads(self.rfile.readline())
+        response = self.run(request["argv"], request["cwd"], request["input"])
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    def run(self, argv, cwd, input) -> dict:
+        from .client import long_running
+        from .mish import main
+
+        if argv[:1] == ["serve"]:
+            return {"exit_code": 1, "output": "Error: already serving\n"}
+        if long_running(argv):
+            message = "runs until interrupted, run it without mish serve"
+            return {"exit_code": 1, "output": f"Error: {argv[0]} {message}\n"}
+
+        # The token refresh and activity feed threads keep running, so the
+        # directory of the process stays. File arguments are resolved against
+        # the client's instead, see mish.ClientFile.
+        config = ClientConfig(self.server.config, cwd)
+        result = click.testing.CliRunner().invoke(
+            main, argv, input=input, obj=config, prog_name="mish"
+        )
+        output = result.output
+        # e.g. a connection error, which click leaves to the caller
+        error = result.exception
+        if error is not None and not isinstance(error, SystemExit):
+            output += "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )
+        return {"exit_code": result.exit_code, "output": output}
+
+
+class ClientConfig:
+    """The config of the server, with the directory of the client as cwd."""
+
+    def __init__(self, config: Any, cwd: str) -> None:
+        self.config = config
+        self.cwd = cwd
+
+    def __getattr__(self, name: str):
+        return getattr(self.config, name)
@@ -0,0 +1,192 @@
+"""Trailing sell stops, adjusted only where they moved enough.
+
+Every cycle computes a target stop for each long stock position, a fixed
+distance below the market price, and compares it with the active sell stops.
+Stops only ever move up, each with its own quantity, so tiered stops stay
+tiered. Orders are only sent for stops that rise by more than the threshold,
+for shares no stop covers, and, when asked to, for stops left over from
+closed positions. So a cycle costs three reads plus one request per change.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from .brokers.models import BrokerException, Order, Position
+from .brokers.orderbook import OrderBook
+
+if TYPE_CHECKING:
+    from .brokers.tdameritrade import TdAmeritrade
+
+CENT = Decimal("0.01")
+
+
+class TrailAction(NamedTuple):
+    # place, replace or cancel
+    command: str
+    symbol: str
+    quantity: int = 0
+    stop: Decimal = Decimal(0)
+    order_id: Optional[int] = None
+
+    def __str__(self) -> str:
+        if self.command == "place":
+            return f"place {self.symbol} {self.quantity} at {self.stop}"
+        elif self.command == "replace":
+            return (
+                f"replace {self.order_id} {self.symbol} {self.quantity} at {self.stop}"
+            )
+        else:
+            return f"cancel {self.order_id} {self.symbol}"
+
+
+class TrailResult(NamedTuple):
+    action: TrailAction
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def sell_stops(book: OrderBook) -> Tuple[Dict[str, List[Order]], Set[str]]:
+    """Returns the active sell stops by symbol, and the symbols to leave alone.
+
+    Symbols with a stop in a composite order, e.g. an OCO, are left alone.
+    """
+    stops: Dict[str, List[Order]] = {}
+    composite: Set[str] = set()
+    for order in book.active(order_type="STOP", instruction="SELL"):
+        parent = book.parent(order.order_id)
+        if parent is not None and parent.children:
+            composite.add(order.symbol)
+        else:
+            stops.setdefault(order.symbol, []).append(order)
+    return stops, composite
+
+
+def target_stops(
+    quotes: Mapping[str, Decimal], distances: Mapping[str, Decimal]
+) -> Dict[str, Decimal]:
+    return {
+        symbol: (quotes[symbol] - distance).quantize(CENT)
+        for symbol, distance in distances.items()
+        if symbol in quotes and quotes[symbol] > distance
+    }
+
+
+def plan_trail(
+    positions: Mapping[str, Position],
+    book: OrderBook,
+    targets: Mapping[str, Decimal],
+    threshold: Decimal,
+    cancel_closed: bool = False,
+    merge: bool = False,
+) -> List[TrailAction]:
+    """Returns the orders that bring the stops up to the targets.
+
+    threshold is the smallest move worth an order, as a fraction of the
+    current stop, e.g. 0.005 for half a percent. Only stock positions are
+    trailed. With cancel_closed, the sell stops of symbols without a position
+    are canceled, including stops that weren't placed by trail. With merge,
+    the stops of a position are replaced by one for the whole position.
+    """
+    stops, composite = sell_stops(book)
+    actions = []
+    for symbol, position in positions.items():
+        target = targets.get(symbol)
+        if (
+            position.asset_type != "EQUITY"
+            or position.long <= 0
+            or symbol in composite
+            or target is None
+        ):
+            continue
+
+        current = stops.pop(symbol, [])
+        trail = _merge_stops if merge and current else _raise_stops
+        actions += trail(symbol, int(position.long), current, target, threshold)
+
+    # Stops of positions that were closed
+    for symbol, orders_left in stops.items():
+        if cancel_closed and symbol not in positions:
+            for order in orders_left:
+                actions.append(TrailAction("cancel", symbol, order_id=order.order_id))
+    return actions
+
+
+def _raise_stops(
+    symbol: str,
+    quantity: int,
+    current: List[Order],
+    target: Decimal,
+    threshold: Decimal,
+) -> List[TrailAction]:
+    actions = [
+        TrailAction("replace", symbol, order.legs[0].quantity, target, order.order_id)
+        for order in current
+        if target > (order.price or Decimal(0)) * (1 + threshold)
+    ]
+    uncovered = quantity - sum(order.legs[0].quantity for order in current)
+    if uncovered > 0:
+        actions.append(TrailAction("place", symbol, uncovered, target))
+    return actions
+
+
+def _merge_stops(
+    symbol: str,
+    quantity: int,
+    current: List[Order],
+    target: Decimal,
+    threshold: Decimal,
+) -> List[TrailAction]:
+    # Keep the highest stop, for the whole position, and cancel any others
+    current.sort(key=lambda order: order.price or 0, reverse=True)
+    first, extra = current[0], current[1:]
+    stop = first.price or Decimal(0)
+    actions = []
+    if target > stop * (1 + threshold) or first.legs[0].quantity != quantity:
+        actions.append(
+            TrailAction("replace", symbol, quantity, max(stop, target), first.order_id)
+        )
+    for order in extra:
+        actions.append(TrailAction("cancel", symbol, order_id=order.order_id))
+    return actions
+
+
+def run_actions(
+    broker: "TdAmeritrade", actions: List[TrailAction], workers: int = 8
+) -> List[TrailResult]:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_action, broker, action) for action in actions]
+        return [future.result() for future in futures]
+
+
+def _run_action(broker: "TdAmeritrade", action: TrailAction) -> TrailResult:
+    try:
+        if action.command == "place":
+            order_id = broker.place_sell_stop(
+                action.symbol, action.quantity, action.stop
+            )
+        elif action.command == "replace":
+            order_id = broker.replace_sell_stop(
+                str(action.order_id), action.symbol, action.quantity, action.stop
+            )
+        else:
+            broker.cancel_order(str(action.order_id))
+            order_id = str(action.order_id)
+    except BrokerException as error:
+        return TrailResult(action, error=str(error))
+    except Exception as error:
+        # e.g. a connection error, which mustn't lose the results of the others
+        return TrailResult(action, error=f"{type(error).__name__}: {error}")
+    return TrailResult(action, order_id=order_id)
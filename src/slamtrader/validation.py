@@ -0,0 +1,173 @@
+"""Pre-trade checks against the locally cached account state.
+
+Orders are checked against the cached positions and balances and the active
+orders in the order book, so the checks cost no request once the state is
+cached. Every violation of every order is returned at once, instead of the
+first one the API would reject after a round trip.
+"""
+from decimal import Decimal
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from .batch import OrderSpec, sell_quantity
+from .brokers.models import Account, Order
+from .brokers.orderbook import OrderBook
+
+if TYPE_CHECKING:
+    from .brokers.tdameritrade import TdAmeritrade
+
+# Instruction and order type of each order command
+ORDER_TYPES = {
+    "buy_market": ("BUY", "MARKET"),
+    "buy_limit": ("BUY", "LIMIT"),
+    "sell_market": ("SELL", "MARKET"),
+    "sell_stop": ("SELL", "STOP"),
+}
+
+
+class Violation(NamedTuple):
+    spec: OrderSpec
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.spec}: {self.message}"
+
+
+class ValidationException(Exception):
+    def __init__(self, violations: List[Violation]) -> None:
+        self.violations = violations
+        super().__init__("\n".join(str(violation) for violation in violations))
+
+
+def order_quantity(spec: OrderSpec, account: Account) -> int:
+    """The shares an order is for. A sell stop is for a share of the position."""
+    if spec.command != "sell_stop":
+        return spec.quantity
+    position = account.positions.get(spec.symbol)
+    return sell_quantity(position, spec.percentage) if position else 0
+
+
+def validate(
+    specs: Sequence[OrderSpec],
+    account: Account,
+    book: OrderBook,
+    prices: Mapping[str, Decimal],
+) -> List[Violation]:
+    """Returns what is wrong with the orders, taken together.
+
+    - An order must be for at least one share.
+    - An order must not repeat an active order, or another order of specs.
+    - The buys must fit the available funds, in order. The cash of active buy
+      orders is taken to be held back from them already. Market buys are
+      priced with prices, and refused when there is no price for them.
+    - The sells plus the active sell orders of a symbol must not be for more
+      shares than the position.
+    """
+    violations = []
+    funds = account.balances.available_funds
+    selling: Dict[str, int] = {}
+    seen: Set[Tuple] = set()
+    for spec in specs:
+        instruction, order_type = ORDER_TYPES[spec.command]
+        quantity = order_quantity(spec, account)
+        if quantity <= 0:
+            violations.append(Violation(spec, "Quantity must be positive"))
+            continue
+
+        key = (spec.command, spec.symbol, quantity, spec.price)
+        if key in seen:
+            violations.append(Violation(spec, "Repeats an order before it"))
+        seen.add(key)
+        repeated = _find_active(book, spec, quantity)
+        if repeated is not None:
+            message = f"Repeats active order {repeated.order_id}"
+            violations.append(Violation(spec, message))
+
+        if instruction == "BUY":
+            price = spec.price if order_type == "LIMIT" else prices.get(spec.symbol)
+            if price is None:
+                message = f"No price for {spec.symbol}"
+                violations.append(Violation(spec, message))
+                continue
+            cost = price * quantity
+            if cost > funds:
+                message = f"Costs {cost:.2f}, only {funds:.2f} of funds left"
+                violations.append(Violation(spec, message))
+            else:
+                funds -= cost
+        else:
+            if spec.symbol not in selling:
+                selling[spec.symbol] = _active_sells(book, spec.symbol)
+            position = account.positions.get(spec.symbol)
+            shares = int(position.long) if position else 0
+            if selling[spec.symbol] + quantity > shares:
+                message = (
+                    f"Sells {quantity} of {shares} shares, with "
+                    f"{selling[spec.symbol]} in active sell orders"
+                )
+                violations.append(Violation(spec, message))
+            selling[spec.symbol] += quantity
+    return violations
+
+
+def check_orders(broker: "TdAmeritrade", specs: Sequence[OrderSpec]) -> None:
+    """Raises a ValidationException with every violation of the orders.
+
+    The account, order book and quotes come from the broker's caches, so
+    only a cold broker makes requests, to fill them. The account and the
+    book are refreshed once they are older than the broker's cache_ttl, the
+    book with an incremental sync when there is an order store. Market buys
+    are priced with a cached quote, or else the market value of the position,
+    or else a quote fetched for them.
+    """
+    account = broker.get_account()
+    book = broker.get_order_book(max_age=broker.cache_ttl)
+    prices = {
+        symbol: position.market_value / Decimal(position.long)
+        for symbol, position in account.positions.items()
+        if position.long > 0
+    }
+    prices.update(broker.quotes.peek(spec.symbol for spec in specs))
+    unpriced = [
+        spec.symbol
+        for spec in specs
+        if spec.command == "buy_market" and spec.symbol not in prices
+    ]
+    if unpriced:
+        prices.update(broker.get_quotes(unpriced))
+    violations = validate(specs, account, book, prices)
+    if violations:
+        raise ValidationException(violations)
+
+
+def _active_sells(book: OrderBook, symbol: str) -> int:
+    """Returns the shares in active sell orders of the symbol.
+
+    The children of a composite order, e.g. the limit and the stop of an OCO,
+    exclude each other, so it counts once, with its largest child.
+    """
+    quantities: Dict[int, int] = {}
+    for order in book.active(symbol, instruction="SELL"):
+        parent = book.parent(order.order_id)
+        order_id = order.order_id if parent is None else parent.order_id
+        quantities[order_id] = max(quantities.get(order_id, 0), order.legs[0].quantity)
+    return sum(quantities.values())
+
+
+def _find_active(book: OrderBook, spec: OrderSpec, quantity: int) -> Optional[Order]:
+    instruction, order_type = ORDER_TYPES[spec.command]
+    for order in book.active(spec.symbol, order_type, instruction):
+        if order.legs[0].quantity == quantity and (
+            order_type == "MARKET" or order.price == spec.price
+        ):
+            return order
+    return None
@@ -0,0 +1,190 @@
+"""Benchmarks for parsing, filtering and rendering large accounts.
+
+Run them with ``nox -s benchmarks``. Every run is compared against the
+reference run in baseline.json. Commit a new reference run, from the same
+machine, along with a change that moves the timings, so they show up in review.
+"""
+import itertools
+import random
+import types
+
+import click.testing
+import pytest
+
+from slamtrader import mish
+from slamtrader.brokers.models import Order
+from slamtrader.brokers.orderbook import OrderBook
+from slamtrader.brokers.simulator import SimulatedResponse
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.risk import portfolio_risk
+
+pytest.importorskip("pytest_benchmark")
+
+POSITIONS = 10_000
+ORDERS = 50_000
+STATUSES = ["QUEUED", "WORKING", "FILLED", "CANCELED", "EXPIRED", "REJECTED"]
+
+
+def make_position(symbol: str, rng: random.Random) -> dict:
+    quantity = float(rng.randint(1, 2000))
+    price = round(rng.uniform(1, 500), 3)
+    return {
+        "shortQuantity": 0.0,
+        "averagePrice": price,
+        "currentDayProfitLoss": 0.0,
+        "currentDayProfitLossPercentage": 0.0,
+        "longQuantity": quantity,
+        "settledLongQuantity": quantity,
+        "settledShortQuantity": 0.0,
+        "instrument": {"assetType": "EQUITY", "cusip": "000000000", "symbol": symbol},
+        "marketValue": round(quantity * price, 2),
+        "maintenanceRequirement": round(quantity * price, 2),
+    }
+
+
+def make_single(order_id: int, rng: random.Random) -> dict:
+    order_type = rng.choice(["LIMIT", "STOP", "MARKET"])
+    instruction = "BUY" if order_type == "LIMIT" else "SELL"
+    quantity = float(rng.randint(1, 2000))
+    order = {
+        "session": "NORMAL",
+        "duration": rng.choice(["DAY", "GOOD_TILL_CANCEL"]),
+        "orderType": order_type,
+        "complexOrderStrategyType": "NONE",
+        "quantity": quantity,
+        "filledQuantity": 0.0,
+        "remainingQuantity": quantity,
+        "requestedDestination": "AUTO",
+        "destinationLinkName": "AutoRoute",
+        "orderLegCollection": [
+            {
+                "orderLegType": "EQUITY",
+                "legId": 1,
+                "instrument": {
+                    "assetType": "EQUITY",
+                    "cusip": "000000000",
+                    "symbol": f"S{rng.randrange(POSITIONS)}",
+                },
+                "instruction": instruction,
+                "positionEffect": "OPENING" if instruction == "BUY" else "CLOSING",
+                "quantity": quantity,
+            }
+        ],
+        "orderStrategyType": "SINGLE",
+        "orderId": order_id,
+        "cancelable": True,
+        "editable": True,
+        "status": rng.choice(STATUSES),
+        "enteredTime": "2020-07-30T01:08:58+0000",
+        "accountId": 12345678,
+    }
+    if order_type == "LIMIT":
+        order["price"] = round(rng.uniform(1, 500), 2)
+    elif order_type == "STOP":
+        order["stopPrice"] = round(rng.uniform(1, 500), 2)
+    return order
+
+
+def make_orders(count: int, rng: random.Random) -> list:
+    """Every fifth order is an OCO with two children."""
+    ids = itertools.count(3000000000)
+    orders = []
+    for i in range(count):
+        if i % 5 == 0:
+            orders.append(
+                {
+                    "orderStrategyType": "OCO",
+                    "orderId": next(ids),
+                    "cancelable": False,
+                    "editable": False,
+                    "accountId": 12345678,
+                    "childOrderStrategies": [
+                        make_single(next(ids), rng),
+                        make_single(next(ids), rng),
+                    ],
+                }
+            )
+        else:
+            orders.append(make_single(next(ids), rng))
+    return orders
+
+
+class CannedClient:
+    """A client that returns the same pre-serialized responses every time."""
+
+    class Account:
+        class Fields:
+            POSITIONS = "positions"
+
+    def __init__(self, account: dict, orders: list) -> None:
+        self.account = SimulatedResponse(200, account)
+        self.orders = SimulatedResponse(200, orders)
+
+    def get_account(self, account_id, *, fields=None):
+        return self.account
+
+    def get_orders_by_path(self, account_id, **kwargs):
+        return self.orders
+
+
+@pytest.fixture(scope="module")
+def raw_orders() -> list:
+    return make_orders(ORDERS, random.Random(1))
+
+
+@pytest.fixture(scope="module")
+def broker(raw_orders) -> TdAmeritrade:
+    rng = random.Random(0)
+    account = {
+        "securitiesAccount": {
+            "accountId": "12345678",
+            "positions": [make_position(f"S{i}", rng) for i in range(POSITIONS)],
+            "currentBalances": {"buyingPower": 100000.0},
+        }
+    }
+    client = CannedClient(account, raw_orders)
+    return TdAmeritrade("12345678", "", "", "", cache_ttl=0, client=client)
+
+
+def test_get_positions(benchmark, broker: TdAmeritrade):
+    positions = benchmark(broker.get_positions)
+    assert len(positions) == POSITIONS
+
+
+def test_parse_orders(benchmark, raw_orders):
+    orders = benchmark(lambda: [Order(raw) for raw in raw_orders])
+    assert len(orders) == ORDERS
+
+
+def test_filter_active(benchmark, raw_orders):
+    orders = [Order(raw) for raw in raw_orders]
+    active = benchmark(lambda: [order for order in orders if order.active])
+    assert 0 < len(active) < ORDERS
+
+
+def test_render(benchmark, raw_orders):
+    # Rendering is cached per order, so every round renders fresh orders
+    def setup():
+        return ([Order(raw) for raw in raw_orders],), {}
+
+    lines = benchmark.pedantic(
+        lambda orders: [str(order) for order in orders], setup=setup, rounds=5
+    )
+    assert len(lines) == ORDERS
+
+
+def test_list_orders(benchmark, broker: TdAmeritrade):
+    config = types.SimpleNamespace(broker=broker)
+    runner = click.testing.CliRunner()
+
+    result = benchmark(runner.invoke, mish.main, ["list_orders", "--all"], obj=config)
+    assert result.exit_code == 0
+    assert result.output.count("OCO") == ORDERS // 5
+
+
+def test_portfolio_risk(benchmark, broker: TdAmeritrade, raw_orders):
+    positions = broker.get_positions().values()
+    book = OrderBook(Order(raw) for raw in raw_orders)
+
+    report = benchmark(portfolio_risk, positions, book, 1_000_000)
+    assert len(report.symbols) == POSITIONS
@@ -0,0 +1,134 @@
+import json
+import queue
+import socketserver
+import threading
+
+import pytest
+
+from slamtrader.brokers import tdameritrade
+from slamtrader.brokers.activity import (
+    ActivityFeed,
+    order_key,
+    OrderStatusTable,
+    reached,
+    SocketActivityFeed,
+)
+from slamtrader.brokers.models import OrderStatus
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+def activity(message_type: str, order_id: int) -> dict:
+    return {
+        "service": "ACCT_ACTIVITY",
+        "content": [
+            {
+                "ACCOUNT": "1234567",
+                "MESSAGE_TYPE": message_type,
+                "MESSAGE_DATA": (
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<{message_type}Message xmlns="urn:xmlns:beb.ameritrade.com">'
+                    f"<Order><OrderKey>{order_id}</OrderKey></Order>"
+                    f"</{message_type}Message>"
+                ),
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def stream(tmp_path):
+    """A stand-in for the streaming API, sending what is put in the queue."""
+    messages: "queue.Queue[dict]" = queue.Queue()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            while True:
+                msg = messages.get()
+                self.wfile.write(json.dumps(msg).encode() + b"\n")
+                self.wfile.flush()
+
+    path = str(tmp_path / "activity.sock")
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path, messages
+    server.shutdown()
+    server.server_close()
+
+
+def test_order_key():
+    assert order_key(activity("OrderFill", 42)["content"][0]["MESSAGE_DATA"]) == 42
+    assert order_key("") is None
+    assert order_key("<SubscribeMessage/>") is None
+
+
+def test_reached():
+    assert reached(OrderStatus.WORKING, OrderStatus.WORKING)
+    assert reached(OrderStatus.FILLED, OrderStatus.WORKING)
+    assert reached(OrderStatus.REJECTED, OrderStatus.FILLED)
+    assert not reached(OrderStatus.QUEUED, OrderStatus.WORKING)
+    assert not reached(None, OrderStatus.WORKING)
+
+
+def test_table_ignores_other_messages():
+    table = OrderStatusTable()
+    table.handle(activity("TooLateToCancel", 42))
+    table.handle({"service": "QUOTE", "content": [{"MESSAGE_TYPE": "OrderFill"}]})
+    assert table.get(42) is None
+    assert table.wait_for(42, OrderStatus.FILLED, timeout=0.01) is None
+
+
+def test_feed_needs_subscribe():
+    class Feed(ActivityFeed):
+        pass
+
+    with pytest.raises(TypeError):
+        Feed()  # type: ignore
+
+
+def test_socket_feed(stream):
+    path, messages = stream
+    feed = SocketActivityFeed(path)
+    feed.start()
+    assert feed.running
+
+    messages.put(activity("OrderEntryRequest", 42))
+    assert feed.table.wait_for(42, OrderStatus.QUEUED, timeout=5) == OrderStatus.QUEUED
+    messages.put(activity("OrderRoute", 42))
+    messages.put(activity("OrderFill", 42))
+    assert feed.table.wait_for(42, OrderStatus.FILLED, timeout=5) == OrderStatus.FILLED
+
+
+def test_wait_for_order_with_feed(stream):
+    path, messages = stream
+    client = SimulatedClient()
+    client.add_account("1234567")
+    client.set_price("NVDA", 390.0)
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+    broker.feed = SocketActivityFeed(path)
+    broker.feed.start()
+
+    order_id = broker.place_buy_market("NVDA", 10)
+    client.step()
+    client.step()
+    messages.put(activity("OrderFill", int(order_id)))
+    order = broker.wait_for_order(order_id, OrderStatus.FILLED, timeout=5)
+    assert order.status == OrderStatus.FILLED
+
+
+def test_wait_for_order_polls_without_feed(monkeypatch):
+    monkeypatch.setattr(tdameritrade, "POLL_INTERVAL", 0)
+    client = SimulatedClient(auto_step=True)
+    client.add_account("1234567")
+    client.set_price("NVDA", 390.0)
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+
+    order_id = broker.place_buy_market("NVDA", 10)
+    order = broker.wait_for_order(order_id, OrderStatus.FILLED, timeout=5)
+    assert order.status == OrderStatus.FILLED
+
+    order_id = broker.place_buy_limit("NVDA", 10, 100)
+    order = broker.wait_for_order(order_id, OrderStatus.FILLED, timeout=0)
+    assert order.active
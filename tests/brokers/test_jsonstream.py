@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from slamtrader.brokers.jsonstream import iter_array
+
+
+def chunked(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 1024])
+def test_iter_array(size):
+    elements = [{"symbol": "DXCM", "note": "café ]"}, 12345, [1, 2], "x"]
+    data = json.dumps(elements).encode()
+    assert list(iter_array(chunked(data, size))) == elements
+
+
+@pytest.mark.parametrize("size", [1, 7, 1024])
+def test_iter_array_key(size):
+    document = {
+        "securitiesAccount": {
+            "accountId": "12345678",
+            "positions": [{"symbol": "NVDA"}, {"symbol": "DXCM"}],
+            "currentBalances": {"buyingPower": 1.0},
+        }
+    }
+    data = json.dumps(document, indent=4).encode()
+    path = ("securitiesAccount", "positions")
+    assert list(iter_array(chunked(data, size), path)) == [
+        {"symbol": "NVDA"},
+        {"symbol": "DXCM"},
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 5, 1024])
+def test_iter_array_path(size):
+    document = {
+        "note": 'no "positions": [1] here',
+        "orders": [{"positions": [1, 2]}],
+        "other": {"positions": [3]},
+        "securitiesAccount": {"accountId": "1", "positions": [{"symbol": "X"}]},
+    }
+    data = json.dumps(document).encode()
+    path = ("securitiesAccount", "positions")
+    assert list(iter_array(chunked(data, size), path)) == [{"symbol": "X"}]
+
+    # TDA leaves the key out of an account without positions
+    data = b'{"securitiesAccount": {"accountId": "1", "currentBalances": {}}}'
+    assert list(iter_array(chunked(data, size), path)) == []
+
+
+def test_iter_array_is_lazy():
+    def chunks():
+        yield b'[{"a": 1}, {"b"'
+        raise AssertionError("read past the first element")
+
+    assert next(iter_array(chunks())) == {"a": 1}
+
+
+def test_iter_array_errors():
+    with pytest.raises(
+        ValueError, match="No JSON array found for securitiesAccount.positions"
+    ):
+        list(iter_array([b'{"orders": []}'], ("securitiesAccount", "positions")))
+    with pytest.raises(ValueError, match="No JSON array found for document"):
+        list(iter_array([b'{"orders": []}']))
+    with pytest.raises(ValueError, match="Unterminated JSON array"):
+        list(iter_array([b'[{"a": 1}, ']))
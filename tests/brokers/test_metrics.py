@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from slamtrader.brokers.metrics import Histogram, Metrics
+from slamtrader.brokers.models import BrokerException
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+def test_histogram_quantile():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    for _ in range(100):
+        histogram.observe(0.2)
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == pytest.approx(0.175)
+    histogram.observe(60)
+    assert histogram.quantile(1) == 10.0
+
+
+def test_prometheus_round_trip():
+    metrics = Metrics()
+    metrics.observe("get_account", 0.03)
+    metrics.observe("get_account", 0.3, error=True)
+    metrics.observe("place_order", 1.5)
+
+    text = metrics.to_prometheus()
+    assert (
+        'mish_request_duration_seconds_bucket{endpoint="get_account",le="0.05"} 1'
+        in text
+    )
+    assert (
+        'mish_request_duration_seconds_bucket{endpoint="get_account",le="+Inf"} 2'
+        in text
+    )
+    assert 'mish_request_errors_total{endpoint="get_account"} 1' in text
+
+    loaded = Metrics.from_prometheus(text)
+    assert (
+        loaded.endpoints["get_account"].counts
+        == metrics.endpoints["get_account"].counts
+    )
+    assert loaded.endpoints["get_account"].sum == pytest.approx(0.33)
+    assert loaded.endpoints["get_account"].errors == 1
+    assert loaded.endpoints["place_order"].count == 1
+
+
+def test_dump_adds_to_file(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+
+    def run() -> None:
+        metrics = Metrics()
+        for _ in range(10):
+            metrics.observe("get_account", 0.1)
+        metrics.dump(path)
+        assert not metrics.endpoints
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Metrics.load(path).endpoints["get_account"].count == 40
+    assert not Metrics.load(str(tmp_path / "missing.prom")).endpoints
+
+
+def test_broker_records_requests():
+    client = SimulatedClient()
+    client.add_account("1234567")
+    broker = TdAmeritrade("1234567", "", "", "", client=client, metrics=Metrics())
+
+    broker.get_positions()
+    with pytest.raises(BrokerException):
+        broker.cancel_order("404")
+
+    endpoints = broker.metrics.endpoints
+    assert endpoints["get_account"].count == 1
+    assert endpoints["get_account"].errors == 0
+    assert endpoints["cancel_order"].errors == 1
+
+
+def test_alert_buckets():
+    metrics = Metrics()
+    metrics.observe("alert", 45.0)
+    metrics.observe("get_account", 45.0)
+    assert metrics.endpoints["alert"].quantile(1) == 60.0
+    assert metrics.endpoints["get_account"].quantile(1) == 10.0
+
+    text = metrics.to_prometheus()
+    assert 'mish_request_duration_seconds_bucket{endpoint="alert",le="60.0"} 1' in text
+    loaded = Metrics.from_prometheus(text)
+    assert loaded.endpoints["alert"].counts == metrics.endpoints["alert"].counts
+
+    # Written before alerts had buckets of their own
+    old = Metrics()
+    old.observe("get_account", 45.0)
+    text = old.to_prometheus().replace('"get_account"', '"alert"')
+    loaded = Metrics.from_prometheus(text)
+    assert loaded.endpoints["alert"].buckets == metrics.endpoints["alert"].buckets
+    assert loaded.endpoints["alert"].count == 1
+    assert loaded.endpoints["alert"].sum == 45.0
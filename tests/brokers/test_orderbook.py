@@ -0,0 +1,143 @@
+from decimal import Decimal
+
+import pytest
+
+from slamtrader.brokers.models import Order, OrderStatus
+from slamtrader.brokers.orderbook import OrderBook
+from slamtrader.brokers.orderstore import OrderStore
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+def make_order(order_id, status, symbol="VNM", order_type="STOP", instruction="SELL"):
+    return {
+        "orderType": order_type,
+        "stopPrice": 13.86,
+        "orderLegCollection": [
+            {
+                "instrument": {"assetType": "EQUITY", "symbol": symbol},
+                "instruction": instruction,
+                "quantity": 1200.0,
+            }
+        ],
+        "orderStrategyType": "SINGLE",
+        "orderId": order_id,
+        "status": status,
+    }
+
+
+@pytest.fixture
+def book():
+    oco = {
+        "orderStrategyType": "OCO",
+        "orderId": 10,
+        "childOrderStrategies": [
+            make_order(11, "QUEUED", "DXCM", "LIMIT"),
+            make_order(12, "QUEUED", "DXCM"),
+        ],
+    }
+    return OrderBook(
+        Order(raw)
+        for raw in [
+            make_order(1, "QUEUED"),
+            make_order(2, "CANCELED"),
+            make_order(3, "WORKING", order_type="LIMIT", instruction="BUY"),
+            oco,
+        ]
+    )
+
+
+def ids(orders):
+    return [order.order_id for order in orders]
+
+
+def get(book: OrderBook, order_id: int) -> Order:
+    order = book.get(order_id)
+    assert order is not None
+    return order
+
+
+def parent(book: OrderBook, order_id: int) -> Order:
+    order = book.parent(order_id)
+    assert order is not None
+    return order
+
+
+def test_find(book: OrderBook):
+    assert len(book) == 4
+    assert ids(book.find()) == [1, 2, 3, 11, 12]
+    assert ids(book.find(symbol="VNM")) == [1, 2, 3]
+    assert ids(book.find(status=OrderStatus.CANCELED)) == [2]
+    assert ids(book.find(status=OrderStatus.QUEUED)) == [1, 11, 12]
+    assert ids(book.active(order_type="STOP")) == [1, 12]
+    assert ids(book.active(symbol="VNM", instruction="BUY")) == [3]
+    assert ids(book.find(symbol="VNM", active=False)) == [2]
+    assert book.find(symbol="NVDA") == []
+
+
+def test_get_and_parent(book: OrderBook):
+    assert get(book, 12).order_type == "STOP"
+    assert get(book, 10).is_oco
+    assert parent(book, 12).order_id == 10
+    assert parent(book, 1).order_id == 1
+    assert 11 in book and 10 in book and 4 not in book
+    assert book.get(4) is None and book.parent(4) is None
+
+
+def test_add_replaces(book: OrderBook):
+    book.add(Order(make_order(1, "FILLED")))
+    assert get(book, 1).status == OrderStatus.FILLED
+    assert ids(book.active(order_type="STOP")) == [12]
+    assert ids(book.find(status=OrderStatus.FILLED)) == [1]
+    assert len(book) == 4
+
+
+def test_add_replaces_child(book: OrderBook):
+    book.add(Order(make_order(12, "FILLED", "DXCM")))
+    assert len(book) == 4
+    oco = get(book, 10)
+    assert oco.is_oco
+    assert [child.status for child in oco.children] == [
+        OrderStatus.QUEUED,
+        OrderStatus.FILLED,
+    ]
+    assert oco.active
+    assert ids(book.active(symbol="DXCM")) == [11]
+    assert parent(book, 12).order_id == 10
+
+
+def test_remove(book: OrderBook):
+    removed = book.remove(11)
+    assert removed is not None and removed.order_id == 10
+    assert book.get(12) is None
+    assert ids(book.find(symbol="DXCM")) == []
+    assert book.remove(10) is None
+    assert ids(book) == [1, 2, 3]
+
+
+@pytest.fixture
+def client():
+    client = SimulatedClient()
+    client.add_account("1234567")
+    return client
+
+
+@pytest.mark.parametrize("order_store", [None, ":memory:"])
+def test_get_order_book(client: SimulatedClient, order_store):
+    store = OrderStore(order_store) if order_store else None
+    broker = TdAmeritrade("1234567", "", "", "", client=client, order_store=store)
+    stop = int(broker.place_sell_stop("DXCM", 71, Decimal(380)))
+    book = broker.get_order_book()
+    assert ids(book.active(symbol="DXCM")) == [stop]
+
+    limit = int(broker.place_buy_limit("DXCM", 10, Decimal(390)))
+    broker.cancel_order(str(stop))
+    assert stop not in book
+
+    book = broker.get_order_book()
+    assert ids(book.active(symbol="DXCM")) == [limit]
+    assert get(book, stop).status == OrderStatus.CANCELED
+
+    client.cancel_order(str(limit), "1234567")
+    broker.get_order(str(limit))
+    assert book.active() == []
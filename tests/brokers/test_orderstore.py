@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+
+from slamtrader.brokers.orderstore import OrderStore
+
+
+def make_order(order_id, status, entered_time, symbol="VNM"):
+    return {
+        "session": "NORMAL",
+        "duration": "GOOD_TILL_CANCEL",
+        "orderType": "STOP",
+        "stopPrice": 13.86,
+        "orderLegCollection": [
+            {
+                "instrument": {"assetType": "EQUITY", "symbol": symbol},
+                "instruction": "SELL",
+                "positionEffect": "CLOSING",
+                "quantity": 1200.0,
+            }
+        ],
+        "orderStrategyType": "SINGLE",
+        "orderId": order_id,
+        "status": status,
+        "enteredTime": entered_time,
+    }
+
+
+@pytest.fixture
+def store():
+    store = OrderStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_sync_from(store: OrderStore):
+    assert store.sync_from("1") is None
+
+    synced_at = datetime.datetime(2020, 8, 1, tzinfo=datetime.timezone.utc)
+    store.merge(
+        "1",
+        [
+            make_order(1, "FILLED", "2020-07-01T10:00:00+0000"),
+            make_order(2, "QUEUED", "2020-07-15T10:00:00+0000"),
+            make_order(3, "WORKING", "2020-07-30T10:00:00+0000"),
+        ],
+        synced_at,
+    )
+    assert store.sync_from("1") == datetime.datetime(
+        2020, 7, 15, 10, tzinfo=datetime.timezone.utc
+    )
+
+    store.merge("1", [make_order(2, "CANCELED", "2020-07-15T10:00:00+0000")], synced_at)
+    assert store.sync_from("1") == datetime.datetime(
+        2020, 7, 30, 10, tzinfo=datetime.timezone.utc
+    )
+
+
+def test_get_orders(store: OrderStore):
+    synced_at = datetime.datetime(2020, 8, 1, tzinfo=datetime.timezone.utc)
+    store.merge(
+        "1",
+        [
+            make_order(1, "FILLED", "2020-07-01T10:00:00+0000"),
+            make_order(2, "QUEUED", "2020-07-15T10:00:00+0000", symbol="DXCM"),
+            make_order(3, "WORKING", "2020-07-30T10:00:00+0000"),
+        ],
+        synced_at,
+    )
+    store.merge("2", [make_order(4, "QUEUED", "2020-07-15T10:00:00+0000")], synced_at)
+
+    assert [o.order_id for o in store.get_orders("1")] == [3, 2, 1]
+    assert [o.order_id for o in store.get_orders("1", active_only=True)] == [3, 2]
+    assert [o.order_id for o in store.get_orders("1", symbol="VNM")] == [3, 1]
+    assert [o.order_id for o in store.get_orders("1", status="QUEUED")] == [2]
+
+
+def test_active_before(store: OrderStore):
+    synced_at = datetime.datetime(2020, 8, 1, tzinfo=datetime.timezone.utc)
+    store.merge(
+        "1",
+        [
+            make_order(1, "FILLED", "2020-05-01T10:00:00+0000"),
+            make_order(2, "QUEUED", "2020-05-15T10:00:00+0000"),
+            make_order(3, "WORKING", "2020-07-30T10:00:00+0000"),
+        ],
+        synced_at,
+    )
+    window = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
+    assert [raw["orderId"] for raw in store.active_before("1", window)] == [2]
+    assert store.sync_from("1", not_before=window) == window
+    assert store.sync_from("1") == datetime.datetime(
+        2020, 5, 15, 10, tzinfo=datetime.timezone.utc
+    )
@@ -0,0 +1,94 @@
+from decimal import Decimal
+import threading
+from typing import Dict, List
+
+import pytest
+
+from slamtrader.brokers.quotes import QuoteService
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+class Fetcher:
+    def __init__(self) -> None:
+        self.calls: List[List[str]] = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, symbols: List[str]) -> Dict[str, Decimal]:
+        self.calls.append(symbols)
+        self.release.wait(5)
+        return {symbol: Decimal(len(symbol)) for symbol in symbols if symbol != "XYZ"}
+
+
+def test_batches_and_caches():
+    fetch = Fetcher()
+    quotes = QuoteService(fetch, ttl=60)
+
+    assert quotes.get(["DXCM", "NVDA", "XYZ", "DXCM"]) == {
+        "DXCM": Decimal(4),
+        "NVDA": Decimal(4),
+    }
+    assert quotes.get(["NVDA", "CANE"]) == {"NVDA": Decimal(4), "CANE": Decimal(4)}
+    assert fetch.calls == [["DXCM", "NVDA", "XYZ"], ["CANE"]]
+
+    quotes.invalidate()
+    quotes.get(["NVDA"])
+    assert fetch.calls[-1] == ["NVDA"]
+
+
+def test_expires():
+    fetch = Fetcher()
+    quotes = QuoteService(fetch, ttl=0)
+    quotes.get(["DXCM"])
+    quotes.get(["DXCM"])
+    assert len(fetch.calls) == 2
+
+
+def test_coalesces_concurrent_requests():
+    fetch = Fetcher()
+    fetch.release.clear()
+    quotes = QuoteService(fetch, ttl=60)
+
+    results = {}
+
+    def get(name: str, symbols: List[str]) -> None:
+        results[name] = quotes.get(symbols)
+
+    first = threading.Thread(target=get, args=("first", ["DXCM", "NVDA"]))
+    first.start()
+    while not fetch.calls:
+        pass
+    second = threading.Thread(target=get, args=("second", ["NVDA", "CANE"]))
+    second.start()
+    while len(fetch.calls) < 2:
+        pass
+    fetch.release.set()
+    first.join()
+    second.join()
+
+    # NVDA is only fetched by the first request
+    assert fetch.calls == [["DXCM", "NVDA"], ["CANE"]]
+    assert results["second"] == {"NVDA": Decimal(4), "CANE": Decimal(4)}
+
+
+def test_errors_reach_waiting_threads():
+    def fail(symbols):
+        raise ValueError("down")
+
+    quotes = QuoteService(fail, ttl=60)
+    with pytest.raises(ValueError, match="down"):
+        quotes.get(["DXCM"])
+    assert not quotes.pending
+
+
+def test_broker_quotes():
+    client = SimulatedClient()
+    client.add_account("1234567")
+    client.set_price("DXCM", 410.5)
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+
+    assert broker.get_quotes(["DXCM", "XYZ"]) == {"DXCM": Decimal("410.5")}
+    assert broker.get_quote("DXCM") == Decimal("410.5")
+    assert broker.get_quote("XYZ") is None
+    assert client.request_count == 2
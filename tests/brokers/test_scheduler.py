@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from slamtrader.brokers.scheduler import (
+    FileTokenBucket,
+    Priority,
+    RequestScheduler,
+    TokenBucket,
+)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1, abs=0.05)
+
+
+def test_file_token_bucket_is_shared(tmp_path):
+    path = str(tmp_path / "ratelimit.json")
+    first = FileTokenBucket(path, rate=1, capacity=2)
+    second = FileTokenBucket(path, rate=1, capacity=2)
+    assert first.take() == 0
+    assert second.take() == 0
+    assert first.take() > 0
+
+
+def test_scheduler_runs_urgent_requests_first():
+    bucket = TokenBucket(rate=10, capacity=1)
+    scheduler = RequestScheduler(bucket)
+    ran = []
+
+    # Hold the only token so every request below has to queue
+    bucket.take()
+    with scheduler.condition:
+        threads = [
+            threading.Thread(target=scheduler.run, args=(priority, ran.append, name))
+            for priority, name in [
+                (Priority.READ, "get_orders"),
+                (Priority.PLACE, "place_order"),
+                (Priority.CANCEL, "cancel_order"),
+            ]
+        ]
+        for thread in threads:
+            thread.start()
+        while len(scheduler.waiting) < 3:
+            scheduler.condition.wait(0.01)
+
+    for thread in threads:
+        thread.join()
+    assert ran == ["cancel_order", "place_order", "get_orders"]
@@ -0,0 +1,116 @@
+from decimal import Decimal
+
+import pytest
+
+from slamtrader.batch import OrderSpec, place_orders
+from slamtrader.brokers.models import BrokerException, OrderStatus
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+@pytest.fixture
+def client() -> SimulatedClient:
+    client = SimulatedClient()
+    client.add_account("1234567", cash=50000.0, positions={"DXCM": (71, 399.95)})
+    return client
+
+
+@pytest.fixture
+def broker(client: SimulatedClient) -> TdAmeritrade:
+    return TdAmeritrade("1234567", "", "", "", cache_ttl=0, client=client)
+
+
+def test_order_lifecycle(broker: TdAmeritrade, client: SimulatedClient):
+    client.set_price("NVDA", 390.0)
+    order_id = broker.place_buy_limit("NVDA", 10, Decimal("380.5"))
+    assert broker.get_order(order_id).status == OrderStatus.QUEUED
+
+    client.step()
+    assert broker.get_order(order_id).status == OrderStatus.WORKING
+
+    client.set_price("NVDA", 385.0)
+    assert broker.get_order(order_id).status == OrderStatus.WORKING
+    client.set_price("NVDA", 380.0)
+    assert broker.get_order(order_id).status == OrderStatus.FILLED
+
+    assert broker.get_positions()["NVDA"].long == 10
+    assert broker.get_balances().buying_power == Decimal("46200.0")
+
+
+def test_sell_stop_and_cancel(broker: TdAmeritrade, client: SimulatedClient):
+    order_id = broker.place_sell_stop("DXCM", 71, Decimal("380"))
+    client.step()
+    assert [order.order_id for order in broker.get_orders(active_only=True)] == [
+        order_id
+    ]
+
+    broker.cancel_order(order_id)
+    assert broker.get_order(order_id).status == OrderStatus.CANCELED
+    assert broker.get_orders(active_only=True) == []
+    with pytest.raises(BrokerException, match="Order cannot be canceled"):
+        broker.cancel_order(order_id)
+
+
+def test_oco(broker: TdAmeritrade, client: SimulatedClient):
+    def leg(order_type, price_key, price):
+        return {
+            "orderType": order_type,
+            "duration": "GOOD_TILL_CANCEL",
+            price_key: price,
+            "orderLegCollection": [
+                {
+                    "instruction": "SELL",
+                    "quantity": 71,
+                    "instrument": {"symbol": "DXCM", "assetType": "EQUITY"},
+                }
+            ],
+        }
+
+    client.place_order(
+        "1234567",
+        {
+            "orderStrategyType": "OCO",
+            "childOrderStrategies": [
+                leg("LIMIT", "price", "450.00"),
+                leg("STOP", "stopPrice", "380.00"),
+            ],
+        },
+    )
+    client.step()
+    client.set_price("DXCM", 379.0)
+
+    (order,) = broker.get_orders()
+    assert not order.active
+    assert [child.status for child in order.children] == [
+        OrderStatus.CANCELED,
+        OrderStatus.FILLED,
+    ]
+    assert broker.get_position("DXCM") is None
+
+
+def test_error_injection(client: SimulatedClient):
+    client.error_rate = 1.0
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+    with pytest.raises(BrokerException, match="Simulated server error"):
+        broker.get_positions()
+
+
+def test_rate_limit(broker: TdAmeritrade, client: SimulatedClient):
+    client.max_requests_per_minute = 2
+    broker.get_positions()
+    broker.get_positions()
+    with pytest.raises(BrokerException, match="Too many requests"):
+        broker.get_positions()
+
+
+def test_batch_load(broker: TdAmeritrade, client: SimulatedClient):
+    specs = [
+        OrderSpec(i, "buy_limit", f"SYM{i % 50}", quantity=1, price=Decimal("10"))
+        for i in range(2000)
+    ]
+
+    results = place_orders(broker, specs, workers=16)
+
+    assert all(result.ok for result in results)
+    assert len({result.order_id for result in results}) == 2000
+    assert len(broker.get_orders(active_only=True)) == 2000
@@ -1,8 +1,19 @@
+import asyncio
+import datetime
+from decimal import Decimal
 import json
 
 import pytest
 
-from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.brokers.models import OrderStatus
+from slamtrader.brokers.orderstore import OrderStore
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import (
+    AccountSet,
+    AsyncTdAmeritrade,
+    ORDER_HISTORY,
+    TdAmeritrade,
+)
 
 TEST_ACCOUNT_DETAILS = """
 {
@@ -238,7 +249,7 @@ def test_get_positions(broker: TdAmeritrade, mock_tda_client):
     assert nvda.symbol == "NVDA"
     assert nvda.long == 20.0
     assert nvda.short == 0.0
-    assert nvda.trade_price == 380.783
+    assert nvda.trade_price == Decimal("380.783")
 
     with pytest.raises(KeyError):
         positions["NONE"]
@@ -429,3 +440,113 @@ def test_get_order_oco(broker: TdAmeritrade, mock_tda_client):
     3051739656 SELL -200 VNM LIMIT 15.44 DAY CLOSING EXPIRED
     3052309434 SELL -400 VNM STOP 13.91 DAY CLOSING EXPIRED"""
     )
+
+
+def test_async_get_positions_and_orders(broker: TdAmeritrade, mock_tda_client):
+    mock_tda_client.return_value.get_account().json.return_value = json.loads(
+        TEST_ACCOUNT_DETAILS
+    )
+    mock_tda_client.return_value.get_orders_by_path().json.return_value = []
+
+    async def fetch():
+        async with AsyncTdAmeritrade(broker, workers=2) as async_broker:
+            return await asyncio.gather(
+                async_broker.get_positions(), async_broker.get_orders()
+            )
+
+    positions, orders = asyncio.run(fetch())
+    assert positions["DXCM"].long == 71.0
+    assert orders == []
+
+
+def test_account_cache(broker: TdAmeritrade, mock_tda_client):
+    client = mock_tda_client.return_value
+    client.get_account.return_value.json.return_value = json.loads(TEST_ACCOUNT_DETAILS)
+
+    assert broker.get_positions()["NVDA"].long == 20.0
+    assert broker.get_positions()["DXCM"].long == 71.0
+    assert broker.get_balances().buying_power == Decimal("119052.65")
+    assert client.get_account.call_count == 1
+
+    broker.cancel_order("3126389058")
+    assert broker.get_positions()["NVDA"].long == 20.0
+    assert client.get_account.call_count == 2
+
+
+def test_iter_positions(broker: TdAmeritrade, mock_tda_client):
+    mock_tda_client.return_value.get_account().iter_content.return_value = [
+        TEST_ACCOUNT_DETAILS.encode()
+    ]
+
+    symbols = [position.symbol for position in broker.iter_positions()]
+    assert symbols[0] == "NVDA"
+    assert symbols[-1] == "DXCM"
+    assert len(symbols) == 7
+
+
+@pytest.mark.parametrize("order_store", [None, ":memory:"])
+def test_account_set(order_store):
+    client = SimulatedClient()
+    client.add_account("1", positions={"DXCM": (71, 399.95)})
+    client.add_account("2", positions={"NVDA": (10, 380.0)})
+    client.add_account("3", positions={"CANE": (100, 6.0)})
+    store = OrderStore(order_store) if order_store else None
+    brokers = [
+        TdAmeritrade(account_id, "", "", "", client=client, order_store=store)
+        for account_id in ["1", "2"]
+    ]
+    stop = int(brokers[0].place_sell_stop("DXCM", 71, Decimal(380)))
+    limit = int(brokers[1].place_buy_limit("NVDA", 10, Decimal(370)))
+    brokers[1].cancel_order(str(limit))
+    client.request_count = 0
+
+    accounts = AccountSet(brokers)
+    positions = accounts.get_positions()
+    assert [(p.account_id, p.position.symbol) for p in positions] == [
+        ("1", "DXCM"),
+        ("2", "NVDA"),
+    ]
+    assert client.request_count == 1
+    assert brokers[1].get_position("NVDA").long == 10
+    assert client.request_count == 1
+
+    orders = accounts.get_orders()
+    assert [(o.account_id, o.order.order_id) for o in orders] == [
+        ("1", stop),
+        ("2", limit),
+    ]
+    assert [o.order.order_id for o in accounts.get_orders(active_only=True)] == [stop]
+    assert client.request_count == (5 if order_store else 3)
+
+
+def test_sync_orders_before_history():
+    client = SimulatedClient()
+    client.add_account("1", positions={"DXCM": (71, 399.95)})
+    store = OrderStore(":memory:")
+    broker = TdAmeritrade("1", "", "", "", client=client, order_store=store)
+    stop = int(broker.place_sell_stop("DXCM", 71, Decimal(380)))
+    # A GTC stop entered long before the 60 days the API returns
+    client.orders[stop]["enteredTime"] = "2020-01-02T10:00:00+0000"
+    gone = {**client.orders[stop], "orderId": 1}
+    broker.sync_orders()
+    store.merge("1", [client.orders[stop], gone], _now() - ORDER_HISTORY * 2)
+    active = broker.get_orders(active_only=True, sync=False)
+    assert {order.order_id for order in active} == {stop, 1}
+
+    client.cancel_order(stop, "1")
+    broker.sync_orders()
+    assert broker.get_orders(active_only=True, sync=False) == []
+    statuses = {order.order_id: order.status for order in store.get_orders("1")}
+    assert statuses == {stop: OrderStatus.CANCELED, 1: OrderStatus.UNKNOWN}
+    assert store.sync_from("1") > _now() - ORDER_HISTORY - datetime.timedelta(1)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def test_iter_positions_empty_account(broker: TdAmeritrade, mock_tda_client):
+    mock_tda_client.return_value.get_account().iter_content.return_value = [
+        b'{"securitiesAccount": {"type": "MARGIN", "accountId": "12345678"}}'
+    ]
+    assert list(broker.iter_positions()) == []
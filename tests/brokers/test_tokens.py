@@ -0,0 +1,94 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from slamtrader.brokers.models import BrokerException
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.brokers.tokens import TokenManager
+
+
+def make_token(expires_in):
+    return {
+        "access_token": f"access {expires_in}",
+        "refresh_token": "refresh",
+        "expires_at": time.time() + expires_in,
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "token.pickle")
+
+
+@pytest.fixture
+def session(mocker):
+    session = mocker.MagicMock()
+    session.token = make_token(1800)
+    session.auto_refresh_url = "https://api.tdameritrade.com/v1/oauth2/token"
+    session.auto_refresh_kwargs = {"client_id": "KEY@AMER.OAUTHAP"}
+    session.refresh_token.side_effect = lambda *args, **kwargs: make_token(1800)
+    return session
+
+
+@pytest.fixture
+def manager(path, session, mocker):
+    manager = TokenManager(path, "KEY")
+    manager.attach(mocker.MagicMock(session=session))
+    return manager
+
+
+def test_save_replaces_file(manager: TokenManager, path, tmp_path):
+    assert manager.load() is None
+    token = make_token(1800)
+    manager.save(token)
+    manager.save(token)
+    assert manager.load() == token
+    assert sorted(os.listdir(tmp_path)) == ["token.pickle", "token.pickle.lock"]
+
+
+def test_load_client(path, mocker):
+    load = mocker.patch("tda.auth.client_from_token_file")
+    manager = TokenManager(path, "KEY")
+    client = manager.load_client()
+    load.assert_called_once_with(path, "KEY")
+    assert client.session.token_updater == manager.save
+
+
+def test_refresh(manager: TokenManager, session, path):
+    session.token = make_token(60)
+    manager.refresh()
+    session.refresh_token.assert_called_once_with(
+        session.auto_refresh_url, client_id="KEY@AMER.OAUTHAP"
+    )
+    token = manager.load()
+    assert token is not None and token["expires_at"] > time.time() + 1700
+
+
+def test_refresh_uses_token_of_other_process(manager: TokenManager, session, path):
+    fresh = make_token(1800)
+    with open(path, "wb") as f:
+        pickle.dump(fresh, f)
+    session.token = make_token(60)
+    manager.refresh()
+    session.refresh_token.assert_not_called()
+    assert session.token == fresh
+
+
+def test_refresh_in_background(manager: TokenManager, session):
+    session.token = make_token(60)
+    manager.margin = 1790.0
+    manager.start()
+    deadline = time.monotonic() + 5
+    while manager.load() is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.stop()
+    assert session.refresh_token.called
+    assert manager.error is None
+
+
+def test_missing_token_fails_fast(path, mocker):
+    mocker.patch("tda.auth.client_from_token_file", side_effect=FileNotFoundError)
+    with pytest.raises(BrokerException, match="No token at"):
+        TdAmeritrade("", "KEY", path, "", interactive=False)
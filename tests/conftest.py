@@ -0,0 +1,41 @@
+from typing import Any, Dict
+
+import pytest
+
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+@pytest.fixture
+def account() -> Dict[str, Any]:
+    """Cash and positions of the simulated account 1234567.
+
+    Override it in a module, or parametrize it in a test, for another account.
+    """
+    return {"cash": 50000.0, "positions": {"DXCM": (71, 399.95)}}
+
+
+@pytest.fixture
+def prices() -> Dict[str, float]:
+    """Market prices of the simulated client, by symbol."""
+    return {"DXCM": 410.0}
+
+
+@pytest.fixture
+def broker_options() -> Dict[str, Any]:
+    """Keyword arguments of the broker, e.g. cache_ttl=0."""
+    return {}
+
+
+@pytest.fixture
+def client(account: Dict[str, Any], prices: Dict[str, float]) -> SimulatedClient:
+    client = SimulatedClient(seed=1)
+    client.add_account("1234567", **account)
+    for symbol, price in prices.items():
+        client.set_price(symbol, price)
+    return client
+
+
+@pytest.fixture
+def broker(client: SimulatedClient, broker_options: Dict[str, Any]) -> TdAmeritrade:
+    return TdAmeritrade("1234567", "", "", "", client=client, **broker_options)
@@ -0,0 +1,137 @@
+from decimal import Decimal
+
+import pytest
+import requests
+
+from slamtrader import batch
+from slamtrader.batch import (
+    BatchException,
+    cancel_orders,
+    OrderSpec,
+    parse_specs,
+    place_orders,
+    select_orders,
+)
+from slamtrader.brokers.models import OrderStatus
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+
+
+def test_parse_specs():
+    specs = parse_specs(
+        [
+            "# morning alert",
+            "buy_market dxcm 10",
+            "",
+            "BUY_LIMIT NVDA 5 380.5  # add on pullback",
+            "sell_stop CANE 50 5.9",
+        ]
+    )
+    assert specs == [
+        OrderSpec(2, "buy_market", "DXCM", quantity=10),
+        OrderSpec(4, "buy_limit", "NVDA", quantity=5, price=Decimal("380.5")),
+        OrderSpec(5, "sell_stop", "CANE", percentage=50.0, price=Decimal("5.9")),
+    ]
+    assert str(specs[1]) == "buy_limit NVDA 5 380.5"
+
+
+@pytest.mark.parametrize(
+    "line,message",
+    [
+        ("sell_limit DXCM 10 400", "line 1: unknown command sell_limit"),
+        ("buy_limit DXCM 10", "line 1: buy_limit expects SYMBOL QUANTITY PRICE"),
+        ("buy_market DXCM ten", "line 1: invalid quantity ten"),
+    ],
+)
+def test_parse_specs_invalid(line, message):
+    with pytest.raises(BatchException, match=message):
+        parse_specs([line])
+
+
+@pytest.fixture
+def prices():
+    return {"DXCM": 410.0, "NVDA": 390.0}
+
+
+@pytest.fixture
+def broker_options():
+    return {"cache_ttl": 0}
+
+
+def test_select_orders(broker: TdAmeritrade):
+    stop = int(broker.place_sell_stop("DXCM", 71, Decimal("380")))
+    limit = int(broker.place_buy_limit("DXCM", 10, Decimal("390")))
+    other = int(broker.place_buy_limit("NVDA", 10, Decimal("370")))
+    broker.cancel_order(str(other))
+    book = broker.get_order_book()
+
+    def selected(*args, **kwargs):
+        matches, errors = select_orders(book, *args, **kwargs)
+        return sorted(order.order_id for order in matches), errors
+
+    assert selected(symbol="DXCM") == ([stop, limit], [])
+    assert selected(symbol="DXCM", order_type="STOP") == ([stop], [])
+    assert selected(all_active=True) == ([stop, limit], [])
+    assert selected([limit, other, 1]) == (
+        [limit],
+        [f"{other} is not active", "1 not found"],
+    )
+
+
+def test_place_orders_errors(broker: TdAmeritrade, mocker):
+    mocker.patch.object(
+        broker,
+        "place_buy_market",
+        side_effect=requests.ConnectionError("Connection reset by peer"),
+    )
+    lines = [
+        "buy_market DXCM 10",
+        "buy_limit NVDA 5 380",
+        "sell_stop X 5 1",
+        "sell_stop DXCM 0.5 380",
+    ]
+    results = place_orders(broker, parse_specs(lines), workers=2)
+    assert [result.error for result in results] == [
+        "ConnectionError: Connection reset by peer",
+        None,
+        "No position in X",
+        "Quantity must be positive",
+    ]
+    assert len(broker.get_orders()) == 1
+
+
+def test_cancel_orders_retries(broker: TdAmeritrade, client: SimulatedClient, mocker):
+    mocker.patch.object(batch, "RETRY_DELAY", 0)
+    for _ in range(10):
+        broker.place_buy_limit("NVDA", 10, Decimal("370"))
+    orders = broker.get_orders(active_only=True)
+
+    client.error_rate = 0.3
+    results = cancel_orders(broker, orders, workers=4, retries=5)
+    client.error_rate = 0.0
+
+    assert [result.order for result in results] == orders
+    assert all(result.ok for result in results)
+    assert any(result.attempts > 1 for result in results)
+    assert all(order.status == OrderStatus.CANCELED for order in broker.get_orders())
+
+
+def test_cancel_orders_network_errors(broker: TdAmeritrade, mocker):
+    mocker.patch.object(batch, "RETRY_DELAY", 0)
+    orders = [broker.get_order(broker.place_buy_limit("NVDA", 10, Decimal("370")))]
+    cancel = mocker.patch.object(
+        broker, "cancel_order", side_effect=[requests.ConnectionError("reset"), None]
+    )
+    (result,) = cancel_orders(broker, orders, retries=2)
+    assert result.ok
+    assert result.attempts == 2
+
+    cancel.side_effect = requests.Timeout("timed out")
+    (result,) = cancel_orders(broker, orders, retries=2)
+    assert result.error == "Timeout: timed out"
+    assert result.attempts == 3
+
+    cancel.side_effect = ValueError("bad order")
+    (result,) = cancel_orders(broker, orders, retries=2)
+    assert result.error == "ValueError: bad order"
+    assert result.attempts == 1
@@ -0,0 +1,156 @@
+import datetime
+import os
+import types
+
+import click.testing
+import numpy as np
+import pytest
+
+from slamtrader import mish
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.history import (
+    average_true_range,
+    BarStore,
+    rolling_high,
+    rolling_low,
+    watchlist_atr,
+    watchlist_high_low,
+)
+
+DAY = 24 * 60 * 60 * 1000
+# Within the year fetched by the first update
+FIRST = int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000) - 350 * DAY
+
+
+def make_candles(count: int, start: int = 0, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 2, count))
+    return [
+        {
+            "open": float(close[i] - 0.5),
+            "high": float(close[i] + rng.uniform(0, 3)),
+            "low": float(close[i] - rng.uniform(0, 3)),
+            "close": float(close[i]),
+            "volume": float(rng.integers(1000, 100000)),
+            "datetime": FIRST + i * DAY,
+        }
+        for i in range(start, count)
+    ]
+
+
+@pytest.fixture
+def store(tmp_path) -> BarStore:
+    return BarStore(str(tmp_path / "history"))
+
+
+def test_append(store: BarStore):
+    candles = make_candles(30)
+    assert store.bars("DXCM").datetime.size == 0
+    assert store.append("DXCM", "daily", candles[:20]) == 20
+
+    # The last bar is replaced, older ones are skipped
+    updated = dict(candles[19], close=1.0)
+    assert store.append("DXCM", "daily", candles[10:19] + [updated]) == 0
+    assert store.append("DXCM", "daily", candles[20:]) == 10
+
+    bars = store.bars("DXCM")
+    assert len(bars) == 30
+    assert bars.close[19] == 1.0
+    assert bars.close[-1] == candles[-1]["close"]
+    assert store.last_time("DXCM") == candles[-1]["datetime"]
+
+    tail = bars.tail(5)
+    assert isinstance(tail.close, np.memmap)
+    assert np.shares_memory(tail.close, bars.close)
+
+
+def test_interrupted_append(store: BarStore):
+    store.append("DXCM", "daily", make_candles(10))
+    # Only the first column of the next bar made it to disk
+    path = os.path.join(store.root, "DXCM", "daily", "datetime.i8")
+    with open(path, "ab") as f:
+        f.write(np.array([0], "<i8").tobytes())
+
+    assert len(store.bars("DXCM")) == 10
+    assert store.append("DXCM", "daily", make_candles(11)[-1:]) == 1
+    assert len(store.bars("DXCM")) == 11
+    assert os.path.getsize(path) == 11 * 8
+
+
+def test_indicators(store: BarStore):
+    store.append("DXCM", "daily", make_candles(40))
+    bars = store.bars("DXCM")
+
+    atr = average_true_range(bars, 14)
+    assert np.isnan(atr[:14]).all()
+    ranges = [
+        max(h - l, abs(h - c), abs(l - c))
+        for h, l, c in zip(bars.high[1:], bars.low[1:], bars.close[:-1])
+    ]
+    assert atr[-1] == pytest.approx(sum(ranges[-14:]) / 14)
+
+    high = rolling_high(bars.high, 20)
+    low = rolling_low(bars.low, 20)
+    assert np.isnan(high[:19]).all()
+    assert high[-1] == max(bars.high[-20:])
+    assert low[25] == min(bars.low[6:26])
+    assert np.isnan(rolling_high(bars.high[:5], 20)).all()
+
+
+def test_watchlist(store: BarStore):
+    for seed, symbol in enumerate(["DXCM", "NVDA", "CANE"]):
+        store.append(symbol, "daily", make_candles(30, seed=seed))
+    store.append("NEW", "daily", make_candles(5))
+
+    atr = watchlist_atr(store, ["DXCM", "NVDA", "CANE", "NEW"], 14)
+    for symbol in ["DXCM", "NVDA", "CANE"]:
+        assert atr[symbol] == pytest.approx(
+            average_true_range(store.bars(symbol), 14)[-1]
+        )
+    assert np.isnan(atr["NEW"])
+
+    extremes = watchlist_high_low(store, ["DXCM", "NEW"], 20)
+    bars = store.bars("DXCM")
+    assert extremes["DXCM"] == (max(bars.high[-20:]), min(bars.low[-20:]))
+    assert np.isnan(extremes["NEW"][0])
+
+
+@pytest.fixture
+def client() -> SimulatedClient:
+    client = SimulatedClient()
+    client.add_account("1234567", positions={"DXCM": (100, 100.0)})
+    client.add_bars("DXCM", make_candles(300))
+    return client
+
+
+def test_update(store: BarStore, client: SimulatedClient):
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+    assert store.update(broker, ["DXCM", "NVDA"]) == 300
+    assert client.request_count == 2
+
+    client.add_bars("DXCM", make_candles(302, start=299))
+    assert store.update(broker, ["DXCM"]) == 2
+    assert len(store.bars("DXCM")) == 302
+
+
+def test_sell_stop_atr(tmp_path, client: SimulatedClient):
+    broker = TdAmeritrade("1234567", "", "", "", client=client)
+    config = types.SimpleNamespace(
+        broker=broker, history_path=str(tmp_path / "history"), atr_period=14
+    )
+    client.set_price("DXCM", 110.0)
+    runner = click.testing.CliRunner()
+
+    result = runner.invoke(
+        mish.main, ["sell_stop", "DXCM", "50", "--atr", "2"], obj=config
+    )
+    assert result.exit_code == 0, result.output
+    atr = average_true_range(BarStore(config.history_path).bars("DXCM"), 14)[-1]
+    (order,) = broker.get_orders()
+    assert order.price is not None
+    assert float(order.price) == pytest.approx(110 - 2 * atr, abs=0.005)
+
+    result = runner.invoke(mish.main, ["sell_stop", "DXCM", "50"], obj=config)
+    assert result.exit_code == 2
+    assert "Give STOP or --atr" in result.output
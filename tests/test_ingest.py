@@ -0,0 +1,171 @@
+from decimal import Decimal
+import os
+import types
+
+import click.testing
+import pytest
+
+from slamtrader import mish
+from slamtrader.batch import OrderSpec
+from slamtrader.brokers.metrics import Metrics
+from slamtrader.brokers.models import BrokerException
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.ingest import Ingester, load_parser, parse_alert, read_alert
+
+MAIL = b"""\
+From: alerts@example.com
+To: me@example.com
+Subject: Buy 100 DXCM at $390.50
+Message-ID: <alert-1@example.com>
+Date: Mon, 03 Aug 2020 14:30:00 +0000
+Content-Type: text/plain; charset="utf-8"
+
+New trade alert.
+
+> Stop 50% DXCM at 380
+Buy 100 DXCM at $390.50
+"""
+
+
+def test_parse_alert():
+    text = """Hello
+Buy 100 shares of DXCM at $390.50
+buy 10 NVDA
+Sell 5 CANE
+Stop DXCM @ 380
+sell_stop NVDA 50 350
+Buy 100 DXCM at 390.50
+Sell some stuff
+"""
+    assert parse_alert(text) == [
+        OrderSpec(2, "buy_limit", "DXCM", 100, price=Decimal("390.50")),
+        OrderSpec(3, "buy_market", "NVDA", 10),
+        OrderSpec(4, "sell_market", "CANE", 5),
+        OrderSpec(5, "sell_stop", "DXCM", percentage=100.0, price=Decimal(380)),
+        OrderSpec(6, "sell_stop", "NVDA", percentage=50.0, price=Decimal(350)),
+    ]
+    assert parse_alert("Nothing to do today") == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Buy 2 more tranches later",
+        "Buy 100 shares",
+        "Sell 50 shares at market",
+        "buy 10 nvda",
+        "BUY 100 MORE",
+        "Stop THE bleeding at 5",
+    ],
+)
+def test_parse_alert_ignores_words(text):
+    assert parse_alert(text) == []
+
+
+def test_load_parser():
+    assert load_parser("slamtrader.ingest:parse_alert") is parse_alert
+    with pytest.raises(ValueError):
+        load_parser("slamtrader.ingest")
+
+
+def test_read_alert(tmp_path):
+    path = tmp_path / "alert.eml"
+    path.write_bytes(MAIL)
+    alert = read_alert(str(path))
+    assert alert.key == "<alert-1@example.com>"
+    assert alert.received == 1596465000.0
+    assert [spec.command for spec in parse_alert(alert.text)] == [
+        "buy_limit",
+        "sell_stop",
+    ]
+
+
+@pytest.fixture
+def broker_options():
+    return {"metrics": Metrics()}
+
+
+def test_ingester(broker: TdAmeritrade, tmp_path):
+    (tmp_path / "a.eml").write_bytes(MAIL)
+    (tmp_path / "b.txt").write_text("Nothing to do today")
+    (tmp_path / ".c.txt").write_text("Buy 10 NVDA")
+    (tmp_path / "d.eml.tmp").write_bytes(MAIL)
+    os.utime(tmp_path / "b.txt", (0, 0))
+
+    ingester = Ingester(broker, str(tmp_path))
+    paths = ingester.scan()
+    assert [os.path.basename(path) for path in paths] == ["b.txt", "a.eml"]
+
+    failed, placed = [ingester.ingest(path) for path in paths]
+    assert failed.error == "No orders found"
+    assert os.path.exists(tmp_path / "failed" / "b.txt")
+    assert [result.spec.command for result in placed.results] == [
+        "buy_limit",
+        "sell_stop",
+    ]
+    assert placed.failed == 0
+    assert placed.latency is not None and placed.latency > 0
+    assert os.path.exists(tmp_path / "done" / "a.eml")
+    assert broker.metrics is not None
+    assert broker.metrics.endpoints["alert"].count == 1
+    assert len(broker.get_orders()) == 2
+
+    # The same alert dropped again, even after a restart
+    (tmp_path / "a2.eml").write_bytes(MAIL)
+    again = Ingester(broker, str(tmp_path)).ingest(str(tmp_path / "a2.eml"))
+    assert again.duplicate
+    assert len(broker.get_orders()) == 2
+
+
+def test_ingester_retries(broker: TdAmeritrade, tmp_path, mocker):
+    (tmp_path / "a.txt").write_text("Buy 10 DXCM\nStop 100% NVDA at 350\n")
+    ingester = Ingester(broker, str(tmp_path), check=False)
+    mocker.patch.object(
+        broker, "get_positions", side_effect=BrokerException("Unavailable")
+    )
+    with pytest.raises(BrokerException):
+        ingester.ingest(str(tmp_path / "a.txt"))
+    assert ingester.scan() == [str(tmp_path / "a.txt")]
+    assert not broker.get_orders()
+
+    mocker.stopall()
+    result = ingester.ingest(str(tmp_path / "a.txt"))
+    assert [result.ok for result in result.results] == [True, False]
+    assert len(broker.get_orders()) == 1
+
+    # Dropped again, only the order that failed is placed again
+    (tmp_path / "b.txt").write_text("Buy 10 DXCM\nStop 100% NVDA at 350\n")
+    result = ingester.ingest(str(tmp_path / "b.txt"))
+    assert [str(result.spec) for result in result.results] == [
+        "sell_stop NVDA 100.0 350"
+    ]
+    assert len(broker.get_orders()) == 1
+
+
+def test_ingest_command(broker: TdAmeritrade, tmp_path):
+    (tmp_path / "a.txt").write_text("Buy 10 DXCM\nStop 100% DXCM at 380\n")
+    config = types.SimpleNamespace(broker=broker, metrics_path=str(tmp_path / "m"))
+    result = click.testing.CliRunner().invoke(
+        mish.main, ["ingest", "--once", str(tmp_path)], obj=config
+    )
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].endswith(" buy_market DXCM 10")
+    assert lines[1].endswith(" sell_stop DXCM 100.0 380")
+    assert lines[2].startswith("a.txt: placed ")
+    assert "alert" in Metrics.load(str(tmp_path / "m")).endpoints
+
+    result = click.testing.CliRunner().invoke(
+        mish.main, ["ingest", "--once", "--parser", "nope", str(tmp_path)], obj=config
+    )
+    assert result.exit_code == 1
+    assert "Can't load parser nope" in result.output
+
+
+def test_ingester_checks(broker: TdAmeritrade, tmp_path):
+    (tmp_path / "a.txt").write_text("Sell 100 DXCM\n")
+    result = Ingester(broker, str(tmp_path)).ingest(str(tmp_path / "a.txt"))
+    assert result.error is not None
+    assert result.error.endswith("Sells 100 of 71 shares, with 0 in active sell orders")
+    assert os.path.exists(tmp_path / "failed" / "a.txt")
+    assert not broker.get_orders()
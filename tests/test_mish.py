@@ -1,12 +1,18 @@
+import json
+import types
+
 import click.testing
 import pytest
 
 from slamtrader import mish
+from slamtrader.brokers.tdameritrade import TdAmeritrade
 
 
 @pytest.fixture
 def runner():
-    return click.testing.CliRunner()
+    runner = click.testing.CliRunner()
+    with runner.isolated_filesystem():
+        yield runner
 
 
 @pytest.fixture
@@ -18,3 +24,258 @@ def mock_tda_auth(mocker):
 def test_main_succeeds(runner, mock_tda_auth):
     result = runner.invoke(mish.main)
     assert result.exit_code == 0
+
+
+def test_batch(runner, mock_tda_auth):
+    client = mock_tda_auth.return_value
+    client.get_account().json.return_value = {
+        "securitiesAccount": {
+            "positions": [
+                {
+                    "longQuantity": 71.0,
+                    "shortQuantity": 0.0,
+                    "averagePrice": 399.95,
+                    "instrument": {"assetType": "EQUITY", "symbol": "DXCM"},
+                }
+            ]
+        }
+    }
+    client.place_order.return_value.headers = {
+        "Location": "https://api.tdameritrade.com/v1/accounts/1234567/orders/42"
+    }
+
+    result = runner.invoke(
+        mish.main,
+        ["batch", "--force", "-"],
+        input="buy_limit NVDA 5 380.5\nsell_stop DXCM 50 380\nsell_stop CANE 50 5\n",
+    )
+
+    assert result.exit_code == 1
+    assert "42 buy_limit NVDA 5 380.5" in result.output
+    assert "42 sell_stop DXCM 50.0 380" in result.output
+    assert "FAILED sell_stop CANE 50.0 5: No position in CANE" in result.output
+    assert client.place_order.call_count == 2
+
+
+def test_list_orders_from_store(runner, mock_tda_auth):
+    client = mock_tda_auth.return_value
+    client.get_orders_by_path.return_value.json.return_value = [
+        {
+            "session": "NORMAL",
+            "duration": "GOOD_TILL_CANCEL",
+            "orderType": "STOP",
+            "stopPrice": 13.86,
+            "orderLegCollection": [
+                {
+                    "instrument": {"assetType": "EQUITY", "symbol": "VNM"},
+                    "instruction": "SELL",
+                    "positionEffect": "CLOSING",
+                    "quantity": 1200.0,
+                }
+            ],
+            "orderStrategyType": "SINGLE",
+            "orderId": 3126389058,
+            "status": "QUEUED",
+            "enteredTime": "2020-07-30T01:08:58+0000",
+        }
+    ]
+    expected = "3126389058 SELL -1200 VNM STOP 13.86 GOOD_TILL_CANCEL CLOSING QUEUED\n"
+
+    result = runner.invoke(mish.main, ["list_orders"])
+    assert result.output == expected
+    assert client.get_orders_by_path.call_count == 1
+
+    client.get_orders_by_path.return_value.json.return_value = []
+    result = runner.invoke(mish.main, ["list_orders", "--offline"])
+    assert result.output == expected
+    assert client.get_orders_by_path.call_count == 1
+
+
+def test_stats(runner):
+    with open("metrics.prom", "w") as f:
+        f.write(
+            'mish_request_duration_seconds_bucket{endpoint="get_account",le="0.1"} 2\n'
+            'mish_request_duration_seconds_bucket{endpoint="get_account",le="+Inf"} 2\n'
+            'mish_request_duration_seconds_sum{endpoint="get_account"} 0.1\n'
+            'mish_request_errors_total{endpoint="get_account"} 1\n'
+            'mish_request_errors_total{endpoint="place_order"} 3\n'
+        )
+
+    result = runner.invoke(mish.main, ["stats"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split() == [
+        "ENDPOINT",
+        "COUNT",
+        "ERRORS",
+        "P50",
+        "MS",
+        "P95",
+        "MS",
+        "P99",
+        "MS",
+    ]
+    assert lines[1].split()[:3] == ["get_account", "2", "1"]
+    assert lines[2].split() == ["place_order", "0", "3", "-", "-", "-"]
+    assert len(lines[2]) == len(lines[1]) == len(lines[0])
+
+
+def test_buy_market_wait_until(runner, mock_tda_auth, mocker):
+    mocker.patch("slamtrader.brokers.tdameritrade.POLL_INTERVAL", 0)
+    client = mock_tda_auth.return_value
+    client.place_order.return_value.headers = {
+        "Location": "https://api.tdameritrade.com/v1/accounts/1234567/orders/42"
+    }
+    order = {
+        "orderType": "MARKET",
+        "duration": "DAY",
+        "orderLegCollection": [
+            {
+                "instrument": {"assetType": "EQUITY", "symbol": "NVDA"},
+                "instruction": "BUY",
+                "positionEffect": "OPENING",
+                "quantity": 10.0,
+            }
+        ],
+        "orderStrategyType": "SINGLE",
+        "orderId": 42,
+    }
+    client.get_order.return_value.json.side_effect = [
+        {**order, "status": "QUEUED"},
+        {**order, "status": "FILLED"},
+    ]
+
+    result = runner.invoke(
+        mish.main, ["buy_market", "NVDA", "10", "--force", "--wait-until", "filled"]
+    )
+    assert result.exit_code == 0
+    assert result.output == "42 BUY +10 NVDA MARKET DAY OPENING FILLED\n"
+
+    client.get_order.return_value.json.side_effect = [{**order, "status": "REJECTED"}]
+    result = runner.invoke(
+        mish.main, ["buy_market", "NVDA", "10", "--force", "--wait-until", "FILLED"]
+    )
+    assert result.exit_code == 1
+    assert "42 is REJECTED" in result.output
+
+
+def test_cancel_needs_orders(runner, mock_tda_auth):
+    result = runner.invoke(mish.main, ["cancel"])
+    assert result.exit_code == 2
+    assert "Give order ids, --symbol, --type or --all-active" in result.output
+
+
+@pytest.fixture
+def simulated_config(broker: TdAmeritrade):
+    return types.SimpleNamespace(broker=broker, max_limit_distance=5.0)
+
+
+@pytest.mark.parametrize(
+    "args,message",
+    [
+        (
+            ["sell_stop", "DXCM", "100", "415"],
+            "Stop 415 is not below the market price 410.0 of DXCM",
+        ),
+        (
+            ["buy_limit", "DXCM", "10", "380"],
+            "Limit 380.0 is 7.3% from the market price 410.0 of DXCM, more than 5.0%",
+        ),
+        (["buy_limit", "XYZ", "10", "380"], "No quote for XYZ"),
+    ],
+)
+def test_price_checks(runner, simulated_config, args, message):
+    result = runner.invoke(mish.main, args, obj=simulated_config)
+    assert result.exit_code == 1
+    assert message in result.output
+    assert not simulated_config.broker.c.orders
+
+    result = runner.invoke(mish.main, args + ["--force"], obj=simulated_config)
+    assert result.exit_code == 0
+    assert len(simulated_config.broker.c.orders) == 1
+
+
+@pytest.mark.parametrize("prices", [{"DXCM": 0.0}])
+def test_price_checks_zero_quote(runner, simulated_config):
+    for args in [["buy_limit", "DXCM", "10", "380"], ["sell_stop", "DXCM", "50", "1"]]:
+        result = runner.invoke(mish.main, args, obj=simulated_config)
+        assert result.exit_code == 1
+        assert "No quote for DXCM" in result.output
+    assert not simulated_config.broker.c.orders
+
+
+def test_all_accounts(runner, simulated_config):
+    client = simulated_config.broker.c
+    client.add_account("7654321", positions={"NVDA": (10, 380.0)})
+    simulated_config.tda_accounts = ["1234567", "7654321"]
+    other = TdAmeritrade("7654321", "", "", "", client=client)
+    order_id = other.place_sell_stop("NVDA", 10, 350)
+
+    result = runner.invoke(
+        mish.main, ["list_orders", "--all-accounts"], obj=simulated_config
+    )
+    assert result.exit_code == 0
+    assert result.output.startswith(f"7654321 {order_id} SELL -10 NVDA STOP 350")
+
+    result = runner.invoke(
+        mish.main, ["list_positions", "--all-accounts"], obj=simulated_config
+    )
+    assert result.exit_code == 0
+    assert (
+        result.output
+        == "1234567 DXCM 71 399.95 29110.0\n7654321 NVDA 10 380.0 3800.0\n"
+    )
+
+
+def test_list_orders_format(runner, simulated_config):
+    broker = simulated_config.broker
+    stop = int(broker.place_sell_stop("DXCM", 71, 380))
+
+    result = runner.invoke(
+        mish.main, ["list_orders", "--format", "ndjson"], obj=simulated_config
+    )
+    assert result.exit_code == 0
+    (record,) = [json.loads(line) for line in result.output.splitlines()]
+    assert record["order_id"] == stop
+    assert record["price"] == 380.0
+    assert record["status"] == "QUEUED"
+
+    result = runner.invoke(
+        mish.main, ["list_positions", "--format", "csv"], obj=simulated_config
+    )
+    assert result.output.splitlines() == [
+        "symbol,asset_type,long,short,trade_price,market_value",
+        "DXCM,EQUITY,71,0.0,399.95,29110.0",
+    ]
+
+
+def test_pre_trade_checks(runner, simulated_config):
+    args = ["buy_limit", "DXCM", "10", "400"]
+    result = runner.invoke(mish.main, args, obj=simulated_config)
+    assert result.exit_code == 0
+
+    result = runner.invoke(mish.main, args, obj=simulated_config)
+    assert result.exit_code == 1
+    assert "buy_limit DXCM 10 400.0: Repeats active order" in result.output
+    assert len(simulated_config.broker.c.orders) == 1
+
+    result = runner.invoke(
+        mish.main,
+        ["batch", "-"],
+        input="buy_market DXCM 200\nsell_market DXCM 80\nbuy_limit DXCM 1 400\n",
+        obj=simulated_config,
+    )
+    assert result.exit_code == 1
+    assert result.output.splitlines()[1:] == [
+        "buy_market DXCM 200: Costs 82000.00, only 50000.00 of funds left",
+        "sell_market DXCM 80: Sells 80 of 71 shares, with 0 in active sell orders",
+    ]
+    assert len(simulated_config.broker.c.orders) == 1
+
+
+def test_sell_stop_no_shares(runner, simulated_config):
+    args = ["sell_stop", "DXCM", "0.5", "380", "--force"]
+    result = runner.invoke(mish.main, args, obj=simulated_config)
+    assert result.exit_code == 1
+    assert "0.5% of DXCM is 0 shares. Quantity must be positive" in result.output
+    assert not simulated_config.broker.c.orders
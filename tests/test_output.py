@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+
+import pytest
+
+from slamtrader.output import RecordWriter
+
+RECORDS = [
+    {"account_id": "1", "order_id": 1, "symbol": "VNM", "price": 13.86, "children": []},
+    {
+        "account_id": "2",
+        "order_id": 2,
+        "symbol": "DXCM",
+        "price": None,
+        "children": [
+            {"order_id": 3, "symbol": "DXCM", "price": 420.0, "children": []},
+            {"order_id": 4, "symbol": "DXCM", "price": 380.0, "children": []},
+        ],
+    },
+]
+
+
+def write(format, records):
+    stream = io.BytesIO()
+    with RecordWriter(stream, format) as writer:
+        for record in records:
+            writer.write(record)
+    assert not stream.closed
+    return stream.getvalue().decode()
+
+
+@pytest.mark.parametrize("records", [RECORDS, []])
+def test_json(records):
+    assert json.loads(write("json", records)) == records
+
+
+def test_ndjson():
+    lines = write("ndjson", RECORDS).splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+def test_csv():
+    rows = list(csv.DictReader(io.StringIO(write("csv", RECORDS))))
+    assert [
+        (row["account_id"], row["order_id"], row["parent_id"], row["price"])
+        for row in rows
+    ] == [
+        ("1", "1", "", "13.86"),
+        ("2", "2", "", ""),
+        ("2", "3", "2", "420.0"),
+        ("2", "4", "2", "380.0"),
+    ]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        RecordWriter(io.BytesIO(), "xml")
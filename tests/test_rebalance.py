@@ -0,0 +1,106 @@
+from decimal import Decimal
+import types
+
+import click.testing
+import numpy as np
+import pytest
+
+from slamtrader import mish
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.rebalance import parse_targets, plan_rebalance, RebalanceException
+
+
+@pytest.fixture
+def account():
+    return {"cash": 20000.0, "positions": {"DXCM": (50, 400.0), "CANE": (1000, 6.0)}}
+
+
+@pytest.fixture
+def prices():
+    return {"DXCM": 400.0, "CANE": 6.0, "NVDA": 380.0}
+
+
+@pytest.fixture
+def broker_options():
+    return {"cache_ttl": 0}
+
+
+def test_parse_targets():
+    targets = parse_targets(["# core", "dxcm 40", "", "NVDA 35.5  # growth"])
+    assert targets == {"DXCM": Decimal("0.4"), "NVDA": Decimal("0.355")}
+
+
+@pytest.mark.parametrize(
+    "lines,message",
+    [
+        (["DXCM"], "line 1: expects SYMBOL PERCENTAGE"),
+        (["DXCM forty"], "line 1: invalid percentage forty"),
+        (["DXCM -5"], "line 1: negative percentage"),
+        (["DXCM 10", "dxcm 20"], "line 2: duplicate symbol DXCM"),
+        (["DXCM 60", "NVDA 50"], "Target weights add up to more than 100%"),
+    ],
+)
+def test_parse_targets_invalid(lines, message):
+    with pytest.raises(RebalanceException, match=message):
+        parse_targets(lines)
+
+
+def test_plan_rebalance(broker: TdAmeritrade):
+    targets = {"DXCM": Decimal("0.2"), "NVDA": Decimal("0.5"), "CANE": Decimal(0)}
+    positions = broker.get_positions()
+    quotes = broker.get_quotes(list(targets))
+    plan = plan_rebalance(targets, positions, quotes, Decimal(46000), Decimal(20000))
+
+    # 20% of 46000 is 23 DXCM, 50% is 60.5 NVDA, rounded down
+    np.testing.assert_array_equal(plan.target, [23, 60, 0])
+    np.testing.assert_array_equal(plan.delta, [-27, 60, -1000])
+    assert [str(spec) for spec in plan.sells] == [
+        "sell_market DXCM 27",
+        "sell_market CANE 1000",
+    ]
+    assert [str(spec) for spec in plan.buys] == ["buy_market NVDA 60"]
+
+
+def test_plan_rebalance_lots_and_cash(broker: TdAmeritrade):
+    targets = {"DXCM": Decimal("0.5"), "NVDA": Decimal("0.5")}
+    quotes = broker.get_quotes(list(targets))
+
+    plan = plan_rebalance(targets, {}, quotes, Decimal(100000), Decimal(100000), 10)
+    np.testing.assert_array_equal(plan.delta, [120, 130])
+
+    # Only half the cash is available, so both buys are halved
+    plan = plan_rebalance(targets, {}, quotes, Decimal(100000), Decimal(50000), 10)
+    np.testing.assert_array_equal(plan.delta, [60, 60])
+    assert float(np.sum(plan.delta * plan.price)) <= 50000
+
+    with pytest.raises(RebalanceException, match="No quote for XYZ"):
+        plan_rebalance({"XYZ": Decimal(1)}, {}, quotes, Decimal(1), Decimal(1))
+
+
+def test_rebalance_command(broker: TdAmeritrade, client: SimulatedClient):
+    config = types.SimpleNamespace(broker=broker)
+    runner = click.testing.CliRunner()
+
+    result = runner.invoke(
+        mish.main, ["rebalance", "--dry-run"], input="DXCM 20\nNVDA 50\n", obj=config
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1].split() == [
+        "DXCM",
+        "400.00",
+        "50",
+        "23",
+        "-27",
+    ]
+    assert not client.orders
+
+    result = runner.invoke(
+        mish.main, ["rebalance"], input="DXCM 20\nNVDA 50\n", obj=config
+    )
+    assert result.exit_code == 0
+    assert [line.split(" ", 1)[1] for line in result.output.splitlines()[3:]] == [
+        "sell_market DXCM 27",
+        "buy_market NVDA 60",
+    ]
+    assert len(client.orders) == 2
@@ -0,0 +1,108 @@
+from decimal import Decimal
+import types
+
+import click.testing
+import numpy as np
+import pytest
+
+from slamtrader import mish
+from slamtrader.brokers.orderbook import OrderBook
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.risk import portfolio_risk
+
+
+@pytest.fixture
+def account():
+    return {
+        "cash": 10000.0,
+        "positions": {"DXCM": (71, 399.95), "NVDA": (10, 380.0), "CANE": (100, 6.0)},
+    }
+
+
+@pytest.fixture
+def prices():
+    return {"DXCM": 410.0, "CANE": 5.0}
+
+
+@pytest.fixture
+def broker(broker: TdAmeritrade) -> TdAmeritrade:
+    broker.place_sell_stop("DXCM", 50, Decimal(380))
+    broker.place_sell_stop("DXCM", 21, Decimal(390))
+    # A stop above the price, and an OCO protecting CANE
+    broker.place_sell_stop("NVDA", 10, Decimal(400))
+    broker.c.place_order(
+        "1234567",
+        {
+            "orderStrategyType": "OCO",
+            "childOrderStrategies": [
+                {
+                    "orderType": order_type,
+                    "duration": "GOOD_TILL_CANCEL",
+                    price_key: price,
+                    "orderLegCollection": [
+                        {
+                            "instruction": "SELL",
+                            "quantity": 60,
+                            "instrument": {"symbol": "CANE", "assetType": "EQUITY"},
+                        }
+                    ],
+                }
+                for order_type, price_key, price in [
+                    ("LIMIT", "price", "7.00"),
+                    ("STOP", "stopPrice", "4.50"),
+                ]
+            ],
+        },
+    )
+    return broker
+
+
+def test_portfolio_risk(broker: TdAmeritrade):
+    report = portfolio_risk(
+        broker.get_positions().values(),
+        broker.get_order_book(),
+        broker.get_balances().liquidation_value,
+    )
+    assert report.symbols == ["DXCM", "NVDA", "CANE"]
+    np.testing.assert_allclose(report.market_value, [29110, 3800, 500])
+    np.testing.assert_allclose(report.pnl, [71 * 410 - 71 * 399.95, 0, -100])
+    np.testing.assert_allclose(report.stop, [(50 * 380 + 21 * 390) / 71, 400, 4.5])
+    np.testing.assert_allclose(report.stop_quantity, [71, 10, 60])
+    assert report.distance[0] == pytest.approx((410 - report.stop[0]) / 410)
+    np.testing.assert_allclose(report.risk, [50 * 30 + 21 * 20, 0, 60 * 0.5 + 40 * 5])
+    assert report.heat == pytest.approx(report.risk.sum() / 43410)
+
+
+def test_portfolio_risk_without_positions():
+    report = portfolio_risk([], OrderBook(), 0)
+    assert report.symbols == []
+    assert report.risk.sum() == 0
+
+
+def test_risk_command(broker: TdAmeritrade):
+    config = types.SimpleNamespace(broker=broker)
+    result = click.testing.CliRunner().invoke(mish.main, ["risk"], obj=config)
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert [line.split()[0] for line in lines[1:4]] == ["DXCM", "CANE", "NVDA"]
+    assert lines[-1].startswith("Value 33,410.00, P&L 613.55, risk 2,150.00, heat")
+
+
+def test_risk_command_all_accounts(broker: TdAmeritrade):
+    broker.c.add_account("7654321", cash=1000.0, positions={"DXCM": (10, 400.0)})
+    config = types.SimpleNamespace(broker=broker, tda_accounts=["7654321"])
+    result = click.testing.CliRunner().invoke(
+        mish.main, ["risk", "--all-accounts"], obj=config
+    )
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split()[:2] == ["ACCOUNT", "SYMBOL"]
+    # The stops of the first account don't cover the DXCM of the second
+    assert [line.split()[:2] for line in lines[1:5]] == [
+        ["7654321", "DXCM"],
+        ["1234567", "DXCM"],
+        ["1234567", "CANE"],
+        ["1234567", "NVDA"],
+    ]
+    assert lines[1].split()[-1] == "4,100.00"
+    assert lines[-1].startswith("Value 37,510.00, P&L 713.55, risk 6,250.00, heat")
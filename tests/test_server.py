@@ -0,0 +1,110 @@
+import os
+import socketserver
+import stat
+import threading
+import types
+
+import pytest
+
+from slamtrader import client, mish
+from slamtrader.server import MishServer
+
+
+@pytest.fixture
+def mock_tda_auth(mocker):
+    mock = mocker.patch("tda.auth.client_from_token_file")
+    return mock
+
+
+@pytest.fixture
+def server(tmp_path, mock_tda_auth):
+    config = types.SimpleNamespace(
+        tda_ira="1234567",
+        tda_api_key="",
+        tda_token_path="",
+        tda_redirect_uri="",
+        tda_order_store=None,
+    )
+    config.broker = mish.get_broker(config)
+    server = MishServer(str(tmp_path / "mish.sock"), config)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_socket_mode(tmp_path, mocker):
+    modes = []
+    server_bind = socketserver.UnixStreamServer.server_bind
+
+    def bind(self):
+        server_bind(self)
+        modes.append(stat.S_IMODE(os.stat(self.server_address).st_mode))
+
+    mocker.patch.object(socketserver.UnixStreamServer, "server_bind", bind)
+    umask = os.umask(0o022)
+    try:
+        server = MishServer(str(tmp_path / "mish.sock"), None)
+    finally:
+        os.umask(umask)
+    server.server_close()
+    # Right after the bind, before the chmod
+    assert modes == [0o700]
+
+
+def test_forward_reuses_broker(server: MishServer, mock_tda_auth):
+    mock_tda_auth.return_value.get_orders_by_path().iter_content.return_value = [b"[]"]
+
+    assert client.forward(server.path, ["list_orders"]) == 0
+    assert client.forward(server.path, ["list_orders"]) == 0
+    assert mock_tda_auth.call_count == 1
+
+
+def test_forward_errors(server: MishServer, capsys):
+    assert client.forward(server.path, ["cancel_order"]) == 2
+    assert "Missing argument" in capsys.readouterr().out
+    assert client.forward(server.path, ["serve"]) == 1
+    assert "already serving" in capsys.readouterr().out
+
+
+def test_long_running(server: MishServer, capsys):
+    assert client.long_running(["ingest", "alerts"])
+    assert client.long_running(["trail", "--percent", "8", "--interval", "60"])
+    assert client.long_running(["trail", "--interval=60"])
+    assert not client.long_running(["trail", "--percent", "8"])
+    assert not client.long_running(["list_orders"])
+
+    assert client.forward(server.path, ["ingest", "alerts"]) == 1
+    assert "runs until interrupted" in capsys.readouterr().out
+
+
+def test_forward_exception(server: MishServer, mock_tda_auth, capsys):
+    mock_tda_auth.return_value.get_orders_by_path.side_effect = RuntimeError("boom")
+    assert client.forward(server.path, ["list_orders"]) == 1
+    output = capsys.readouterr().out
+    assert output.startswith("Traceback")
+    assert output.endswith("RuntimeError: boom\n")
+
+
+def test_forward_resolves_files(server: MishServer, tmp_path, monkeypatch, capsys):
+    (tmp_path / "client").mkdir()
+    (tmp_path / "client" / "specs.txt").write_text("sell_limit DXCM 10 400\n")
+    monkeypatch.chdir(tmp_path)
+    # The client runs elsewhere, and the server mustn't change directory
+    monkeypatch.setattr(os, "getcwd", lambda: str(tmp_path / "client"))
+    monkeypatch.setattr(os, "chdir", None)
+
+    assert client.forward(server.path, ["batch", "specs.txt"]) == 1
+    assert "line 1: unknown command sell_limit" in capsys.readouterr().out
+
+
+def test_reads_stdin():
+    assert client.reads_stdin(["batch"])
+    assert client.reads_stdin(["batch", "-w", "4", "-"])
+    assert client.reads_stdin(["rebalance", "--lot", "10", "--dry-run"])
+    assert not client.reads_stdin(["batch", "specs.txt"])
+    assert not client.reads_stdin(["rebalance", "--lot", "10", "targets.txt"])
+    assert not client.reads_stdin(["list_orders"])
+    assert not client.reads_stdin([])
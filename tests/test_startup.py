@@ -0,0 +1,51 @@
+import subprocess  # nosec
+import sys
+
+# Cumulative import time of slamtrader.mish, in microseconds. It is around
+# 70ms on a laptop, mostly click. The budget leaves room for slow CI runners.
+STARTUP_BUDGET_US = 250_000
+
+
+def import_times(code: str) -> dict:
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_startup_time():
+    # Take the best of a few runs to smooth out a busy machine
+    best = min(
+        import_times("import slamtrader.mish")["slamtrader.mish"] for _ in range(3)
+    )
+    assert best < STARTUP_BUDGET_US
+
+
+def test_help_imports_no_broker():
+    modules = import_times(
+        "from slamtrader import mish\n"
+        "try:\n"
+        "    mish.main(['list_orders', '--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    )
+    assert "slamtrader.mish" in modules
+    assert "tda" not in modules
+    assert "slamtrader.brokers.tdameritrade" not in modules
+    assert "config_example" not in modules
+    assert "importlib.metadata" not in modules
+
+
+def test_client_imports_no_cli():
+    modules = import_times("import slamtrader.client")
+    assert "click" not in modules
+    assert "tda" not in modules
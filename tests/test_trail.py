@@ -0,0 +1,166 @@
+from decimal import Decimal
+import types
+
+import click.testing
+import pytest
+import requests
+
+from slamtrader import mish
+from slamtrader.brokers.models import Position
+from slamtrader.brokers.simulator import SimulatedClient
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.trail import plan_trail, run_actions, target_stops, TrailAction
+
+
+@pytest.fixture
+def account():
+    return {
+        "positions": {"DXCM": (71, 399.95), "NVDA": (10, 380.0), "CANE": (100, 6.0)}
+    }
+
+
+@pytest.fixture
+def prices():
+    return {}
+
+
+def test_target_stops():
+    quotes = {"DXCM": Decimal(400), "NVDA": Decimal(5)}
+    distances = {"DXCM": Decimal("33.333"), "NVDA": Decimal(10), "CANE": Decimal(1)}
+    assert target_stops(quotes, distances) == {"DXCM": Decimal("366.67")}
+
+
+def test_plan_trail(broker: TdAmeritrade, client: SimulatedClient):
+    dxcm = int(broker.place_sell_stop("DXCM", 50, Decimal(360)))
+    nvda = int(broker.place_sell_stop("NVDA", 5, Decimal(350)))
+    lower = int(broker.place_sell_stop("NVDA", 5, Decimal(340)))
+    closed = int(broker.place_sell_stop("TSLA", 10, Decimal(300)))
+    positions = broker.get_positions()
+    book = broker.get_order_book()
+
+    # No stop moves, only the shares without a stop get one
+    targets = {"DXCM": Decimal("361"), "NVDA": Decimal(340), "CANE": Decimal("5.5")}
+    actions = [
+        TrailAction("place", "DXCM", 21, Decimal("361")),
+        TrailAction("place", "CANE", 100, Decimal("5.5")),
+    ]
+    assert plan_trail(positions, book, targets, Decimal("0.005")) == actions
+    assert plan_trail(
+        positions, book, targets, Decimal("0.005"), cancel_closed=True
+    ) == actions + [TrailAction("cancel", "TSLA", order_id=closed)]
+    assert plan_trail(positions, book, targets, Decimal("0.005"), merge=True) == [
+        TrailAction("replace", "DXCM", 71, Decimal("361"), dxcm),
+        TrailAction("replace", "NVDA", 10, Decimal(350), nvda),
+        TrailAction("cancel", "NVDA", order_id=lower),
+        TrailAction("place", "CANE", 100, Decimal("5.5")),
+    ]
+
+    # Each stop moves with its own quantity
+    targets = {"DXCM": Decimal(370), "NVDA": Decimal(345)}
+    actions = plan_trail(positions, book, targets, Decimal("0.005"))
+    assert actions == [
+        TrailAction("replace", "DXCM", 50, Decimal(370), dxcm),
+        TrailAction("place", "DXCM", 21, Decimal(370)),
+        TrailAction("replace", "NVDA", 5, Decimal(345), lower),
+    ]
+    assert str(actions[0]) == f"replace {dxcm} DXCM 50 at 370"
+
+
+def test_plan_trail_skips_options(broker: TdAmeritrade):
+    option = Position(
+        {
+            "longQuantity": 1.0,
+            "shortQuantity": 0.0,
+            "averagePrice": 12.5,
+            "marketValue": 1400.0,
+            "instrument": {"assetType": "OPTION", "symbol": "DXCM_081420C400"},
+        }
+    )
+    positions = {**broker.get_positions(), option.symbol: option}
+    targets = {"DXCM_081420C400": Decimal(10)}
+    assert plan_trail(positions, broker.get_order_book(), targets, Decimal(0)) == []
+
+
+def test_run_actions_errors(broker: TdAmeritrade, mocker):
+    mocker.patch.object(
+        broker, "cancel_order", side_effect=requests.Timeout("timed out")
+    )
+    actions = [
+        TrailAction("cancel", "NVDA", order_id=1),
+        TrailAction("place", "CANE", 100, Decimal("5.5")),
+    ]
+    results = run_actions(broker, actions)
+    assert [result.error for result in results] == ["Timeout: timed out", None]
+
+
+def test_plan_trail_skips_oco(broker: TdAmeritrade, client: SimulatedClient):
+    client.place_order(
+        "1234567",
+        {
+            "orderStrategyType": "OCO",
+            "childOrderStrategies": [
+                {
+                    "orderType": "STOP",
+                    "duration": "GOOD_TILL_CANCEL",
+                    "stopPrice": "350.00",
+                    "orderLegCollection": [
+                        {
+                            "instruction": "SELL",
+                            "quantity": 10,
+                            "instrument": {"symbol": "NVDA", "assetType": "EQUITY"},
+                        }
+                    ],
+                }
+            ],
+        },
+    )
+    actions = plan_trail(
+        broker.get_positions(),
+        broker.get_order_book(),
+        {"NVDA": Decimal(370)},
+        Decimal(0),
+    )
+    assert actions == []
+
+
+@pytest.mark.parametrize("prices", [{"DXCM": 400.0, "NVDA": 380.0, "CANE": 6.0}])
+def test_trail_command(broker: TdAmeritrade, client: SimulatedClient):
+    config = types.SimpleNamespace(broker=broker)
+    runner = click.testing.CliRunner()
+
+    result = runner.invoke(mish.main, ["trail", "--dry-run"], obj=config)
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        "place DXCM 71 at 368.00",
+        "place NVDA 10 at 349.60",
+        "place CANE 100 at 5.52",
+    ]
+    assert not client.orders
+
+    result = runner.invoke(mish.main, ["trail"], obj=config)
+    assert result.exit_code == 0
+    assert len(client.orders) == 3
+
+    # Nothing moved, so only the positions, orders and quotes are read
+    broker.quotes.invalidate()
+    requests = client.request_count
+    result = runner.invoke(mish.main, ["trail"], obj=config)
+    assert result.output == ""
+    assert client.request_count - requests == 3
+
+    client.set_price("DXCM", 420.0)
+    broker.quotes.invalidate()
+    result = runner.invoke(mish.main, ["trail"], obj=config)
+    assert result.output.split(" ", 1)[1].startswith("replace")
+    assert "DXCM 71 at 386.40" in result.output
+
+
+@pytest.mark.parametrize("prices", [{"DXCM": 400.0}])
+def test_trail_interval_interrupted(broker: TdAmeritrade, mocker):
+    mocker.patch("time.sleep", side_effect=KeyboardInterrupt)
+    config = types.SimpleNamespace(broker=broker)
+    result = click.testing.CliRunner().invoke(
+        mish.main, ["trail", "--interval", "60"], obj=config
+    )
+    assert result.exit_code == 0
+    assert "place DXCM 71 at 368.00" in result.output
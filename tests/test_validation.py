@@ -0,0 +1,174 @@
+from decimal import Decimal
+
+import pytest
+
+from slamtrader.batch import OrderSpec
+from slamtrader.brokers.orderstore import OrderStore
+from slamtrader.brokers.tdameritrade import TdAmeritrade
+from slamtrader.validation import check_orders, validate, ValidationException
+
+
+@pytest.fixture
+def account():
+    return {"cash": 10000.0, "positions": {"DXCM": (71, 399.95)}}
+
+
+def messages(broker, specs):
+    account = broker.get_account()
+    prices = {"DXCM": Decimal(410)}
+    violations = validate(specs, account, broker.get_order_book(), prices)
+    return [(violation.spec.line, violation.message) for violation in violations]
+
+
+def test_valid(broker: TdAmeritrade):
+    specs = [
+        OrderSpec(1, "buy_market", "DXCM", 10),
+        OrderSpec(2, "buy_limit", "DXCM", 10, price=Decimal(400)),
+        OrderSpec(3, "sell_stop", "DXCM", percentage=50.0, price=Decimal(380)),
+        OrderSpec(4, "sell_market", "DXCM", 35),
+    ]
+    assert messages(broker, specs) == []
+
+
+def test_zero_quantity(broker: TdAmeritrade):
+    specs = [
+        OrderSpec(1, "buy_market", "DXCM", 0),
+        OrderSpec(2, "sell_stop", "NVDA", percentage=50.0, price=Decimal(350)),
+        OrderSpec(3, "sell_stop", "DXCM", percentage=0.5, price=Decimal(380)),
+        OrderSpec(4, "sell_market", "DXCM", -5),
+    ]
+    assert messages(broker, specs) == [
+        (1, "Quantity must be positive"),
+        (2, "Quantity must be positive"),
+        (3, "Quantity must be positive"),
+        (4, "Quantity must be positive"),
+    ]
+
+
+def test_duplicates(broker: TdAmeritrade):
+    order_id = broker.place_sell_stop("DXCM", 36, Decimal(380))
+    specs = [
+        OrderSpec(1, "sell_stop", "DXCM", percentage=50.0, price=Decimal(380)),
+        OrderSpec(2, "buy_limit", "DXCM", 5, price=Decimal(400)),
+        OrderSpec(3, "buy_limit", "DXCM", 5, price=Decimal(400)),
+        OrderSpec(4, "buy_limit", "DXCM", 5, price=Decimal(401)),
+    ]
+    assert messages(broker, specs) == [
+        (1, f"Repeats active order {order_id}"),
+        (1, "Sells 36 of 71 shares, with 36 in active sell orders"),
+        (3, "Repeats an order before it"),
+    ]
+
+
+def test_over_allocation(broker: TdAmeritrade):
+    specs = [
+        OrderSpec(1, "buy_limit", "DXCM", 20, price=Decimal(400)),
+        OrderSpec(2, "buy_market", "DXCM", 5),
+        OrderSpec(3, "buy_market", "NVDA", 1000),
+    ]
+    assert messages(broker, specs) == [
+        (2, "Costs 2050.00, only 2000.00 of funds left"),
+        (3, "No price for NVDA"),
+    ]
+
+
+def test_oversized_sells(broker: TdAmeritrade):
+    broker.place_sell_stop("DXCM", 50, Decimal(380))
+    specs = [
+        OrderSpec(1, "sell_market", "DXCM", 20),
+        OrderSpec(2, "sell_market", "DXCM", 2),
+        OrderSpec(3, "sell_market", "NVDA", 1),
+    ]
+    assert messages(broker, specs) == [
+        (2, "Sells 2 of 71 shares, with 70 in active sell orders"),
+        (3, "Sells 1 of 0 shares, with 0 in active sell orders"),
+    ]
+
+
+@pytest.mark.parametrize("account", [{"positions": {"DXCM": (200, 399.95)}}])
+def test_oco_sells(broker: TdAmeritrade):
+    # A bracket sells 100 shares at the limit or at the stop, not both
+    broker.c.place_order(
+        "1234567",
+        {
+            "orderStrategyType": "OCO",
+            "childOrderStrategies": [
+                {
+                    "orderType": order_type,
+                    "duration": "GOOD_TILL_CANCEL",
+                    price_key: price,
+                    "orderLegCollection": [
+                        {
+                            "instruction": "SELL",
+                            "quantity": 100,
+                            "instrument": {"symbol": "DXCM", "assetType": "EQUITY"},
+                        }
+                    ],
+                }
+                for order_type, price_key, price in [
+                    ("LIMIT", "price", "450.00"),
+                    ("STOP", "stopPrice", "380.00"),
+                ]
+            ],
+        },
+    )
+    specs = [
+        OrderSpec(1, "sell_market", "DXCM", 50),
+        OrderSpec(2, "sell_market", "DXCM", 51),
+    ]
+    assert messages(broker, specs) == [
+        (2, "Sells 51 of 200 shares, with 150 in active sell orders"),
+    ]
+
+
+def test_check_orders(broker: TdAmeritrade):
+    broker.place_sell_stop("DXCM", 71, Decimal(380))
+    # Warm the caches, the checks then make no requests
+    check_orders(broker, [OrderSpec(1, "buy_market", "DXCM", 1)])
+    count = broker.c.request_count
+
+    specs = [
+        OrderSpec(1, "buy_market", "DXCM", 0),
+        OrderSpec(2, "buy_market", "DXCM", 100),
+        OrderSpec(3, "sell_stop", "DXCM", percentage=100.0, price=Decimal(380)),
+        OrderSpec(4, "sell_market", "DXCM", 1),
+    ]
+    with pytest.raises(ValidationException) as error:
+        check_orders(broker, specs)
+    assert [violation.spec.line for violation in error.value.violations] == [
+        1,
+        2,
+        3,
+        3,
+        4,
+    ]
+    assert (
+        str(error.value).splitlines()[0]
+        == "buy_market DXCM 0: Quantity must be positive"
+    )
+    assert broker.c.request_count == count
+
+
+@pytest.mark.parametrize("prices", [{"DXCM": 410.0, "NVDA": 380.0}])
+def test_check_orders_prices_market_buys(broker: TdAmeritrade):
+    check_orders(broker, [OrderSpec(1, "buy_market", "NVDA", 10)])
+    with pytest.raises(ValidationException, match="No price for XYZ"):
+        check_orders(broker, [OrderSpec(1, "buy_market", "XYZ", 10)])
+
+
+def test_check_orders_shared_store(broker: TdAmeritrade, tmp_path):
+    path = str(tmp_path / "orders.db")
+    first = TdAmeritrade("1234567", "", "", "", client=broker.c)
+    first.order_store = OrderStore(path)
+    spec = OrderSpec(1, "buy_limit", "DXCM", 10, price=Decimal(400))
+    check_orders(first, [spec])
+    order_id = first.place_buy_limit("DXCM", 10, Decimal(400))
+
+    # e.g. the next mish run
+    second = TdAmeritrade("1234567", "", "", "", client=broker.c, cache_ttl=0)
+    second.order_store = OrderStore(path)
+    with pytest.raises(ValidationException, match=f"Repeats active order {order_id}"):
+        check_orders(second, [spec])
+
+    first.cancel_order(order_id)
+    check_orders(second, [spec])